@@ -0,0 +1,34 @@
+import io
+
+import numpy as np
+
+# Imported by the chart worker processes, so it must not import bot.utils
+# (which loads the storage layer); matplotlib is imported inside render_chart.
+
+
+def render_chart(ticker: str, range_name: str, columns: dict[str, np.ndarray]) -> bytes:
+    """
+    PNG of one price window: a close line with the high/low band for OHLC
+    bars, or a plain line for raw ticks. Runs in a worker process.
+    """
+    from matplotlib.figure import Figure  # imported in the worker, not the bot
+    import matplotlib.dates as mdates
+
+    when = columns["ts"].astype("datetime64[s]")
+    fig = Figure(figsize=(8, 4), dpi=100)
+    ax = fig.subplots()
+    if "close" in columns:
+        ax.fill_between(when, columns["low"], columns["high"], alpha=0.25, color="tab:green", linewidth=0)
+        price = columns["close"]
+    else:
+        price = columns["price"]
+    ax.plot(when, price, color="tab:green", linewidth=1.5)
+    ax.set_title(f"{ticker} · {range_name}")
+    ax.set_ylabel("coins")
+    ax.grid(True, alpha=0.3)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(ax.xaxis.get_major_locator()))
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
@@ -1,44 +1,48 @@
 import io
 import os
+import json
 import zipfile
 import discord
 from discord.ext import commands, tasks
 from datetime import datetime, timezone
 
-from bot.config import ANNOUNCEMENT_CHANNEL_ID, INTEREST_INTERVAL, INTEREST_RATE, PACKAGE_USER_ID, PACKAGE_FILES
-from bot.utils.storage import load_json, save_json, abs_path, exists_file
+from bot.config import ANNOUNCEMENT_CHANNEL_ID, PACKAGE_USER_ID, PACKAGE_FILES, EVENTS
+from bot.utils.storage import aload_json, abs_path, aexists_file, storage_stats
+from bot.utils.accounts import materialize_accounts, retry_on_conflict
+from bot.utils.events import EVENT_REGISTRY
+from bot.utils.locks import MONEY_LOCKS
+from bot.utils.transfers import Batch, TransferError, apply_batch
 
-COIN_DATA_FILE = "coins.json"
-
-def load_coins(): return load_json(COIN_DATA_FILE, {})
-def save_coins(d): save_json(COIN_DATA_FILE, d)
-
-def existing_files(files: list[str]) -> list[str]:
+async def existing_files(files: list[str]) -> list[str]:
     out = []
     for f in files:
-        if exists_file(f):
+        if await aexists_file(f):
             out.append(abs_path(f))
     return out
 
 async def build_data_zip_bytes() -> tuple[io.BytesIO, list[str]]:
-    included = existing_files(PACKAGE_FILES)
+    included = await existing_files(PACKAGE_FILES)
+    # bank interest is lazy; bring every balance up to date before snapshotting
+    await materialize_accounts()
     buf = io.BytesIO()
     with zipfile.ZipFile(buf, mode="w", compression=zipfile.ZIP_DEFLATED) as z:
         for path in included:
-            arcname = f"bot_backup/{os.path.basename(path)}"
-            z.write(path, arcname=arcname)
+            # go through storage so the backup is plain JSON whatever the backend
+            name = os.path.basename(path)
+            body = json.dumps(await aload_json(name, {}), indent=2, ensure_ascii=False)
+            z.writestr(f"bot_backup/{name}", body)
     buf.seek(0)
     return buf, included
 
 class Admin(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.apply_bank_interest.start()
         self.send_backup_zip_every_5h.start()
+        self.expire_events.start()
 
     def cog_unload(self):
-        self.apply_bank_interest.cancel()
         self.send_backup_zip_every_5h.cancel()
+        self.expire_events.cancel()
 
     @commands.command(name="announcement", help="Post a yellow-embed announcement with @everyone")
     async def announcement(self, ctx, *, message: str):
@@ -49,21 +53,86 @@ class Admin(commands.Cog):
         await channel.send(content="@everyone", embed=embed, allowed_mentions=discord.AllowedMentions(everyone=True))
         await ctx.send(f"✅ Announcement sent in {channel.mention}")
 
-    @tasks.loop(seconds=INTEREST_INTERVAL)
-    async def apply_bank_interest(self):
+    # ---------- Events ----------
+    @commands.command(name="event", help="Show the server event that is running, if any.")
+    async def event_cmd(self, ctx):
+        info = EVENT_REGISTRY.info()
+        if not info:
+            names = ", ".join(f"`{n}`" for n in EVENTS)
+            return await ctx.send(embed=discord.Embed(description=f"📭 No event running. Events: {names}", color=discord.Color.blurple()))
+        mods = " · ".join(f"{k} = {v}" for k, v in EVENTS[info["name"]].items())
+        embed = discord.Embed(title=f"🎪 {info['name']}", description=mods, color=discord.Color.blurple())
+        if info.get("ends_at"):
+            embed.add_field(name="Ends", value=f"<t:{int(info['ends_at'])}:R>", inline=True)
+        if info.get("started_at"):
+            embed.add_field(name="Started", value=f"<t:{int(info['started_at'])}:R>", inline=True)
+        await ctx.send(embed=embed)
+
+    @commands.command(name="startevent", help="Admin: start a server event. Usage: !startevent <event name> [hours]")
+    async def startevent(self, ctx, *, raw: str):
+        if ctx.author.id != PACKAGE_USER_ID and not ctx.author.guild_permissions.administrator:
+            return await ctx.send("❌ You don’t have permission to use this command.")
+
+        parts = raw.split()
+        hours = None
+        if len(parts) > 1:
+            try:
+                hours = float(parts[-1])
+                parts = parts[:-1]
+            except ValueError:
+                pass
+        wanted = " ".join(parts).lower()
+        name = next((n for n in EVENTS if n.lower() == wanted), None)
+        if not name:
+            names = ", ".join(f"`{n}`" for n in EVENTS)
+            return await ctx.send(f"❌ Unknown event. Choose one of: {names}")
+        if hours is not None and hours <= 0:
+            return await ctx.send("❌ Duration must be more than 0 hours.")
+
+        await EVENT_REGISTRY.start(name, hours * 3600 if hours else None)
+        until = f" for **{hours:g}h**" if hours else ""
+        await ctx.send(f"✅ **{name}** started{until}.")
+
+    @commands.command(name="stopevent", help="Admin: end the running server event.")
+    async def stopevent(self, ctx):
+        if ctx.author.id != PACKAGE_USER_ID and not ctx.author.guild_permissions.administrator:
+            return await ctx.send("❌ You don’t have permission to use this command.")
+        name = await EVENT_REGISTRY.stop()
+        await ctx.send(f"✅ **{name}** ended." if name else "📭 No event is running.")
+
+    # ---------- Bulk grants ----------
+    @commands.command(name="grant", help="Admin: give (or with a negative amount, take) coins from several users at once. Usage: !grant <amount> @user [@user ...]")
+    @retry_on_conflict()
+    async def grant(self, ctx, amount: int, members: commands.Greedy[discord.Member]):
+        if ctx.author.id != PACKAGE_USER_ID and not ctx.author.guild_permissions.administrator:
+            return await ctx.send("❌ You don’t have permission to use this command.")
+        members = [m for m in dict.fromkeys(members) if not m.bot]
+        if not members or amount == 0:
+            return await ctx.send("❌ Usage: `!grant <amount> @user [@user ...]`")
+
+        batch = Batch()
+        for m in members:
+            if amount > 0:
+                batch.move(None, m.id, amount, "grant", by=ctx.author.id)
+            else:
+                batch.move(m.id, None, -amount, "grant", by=ctx.author.id)
+
+        async with MONEY_LOCKS.hold(*batch.keys()):
+            try:
+                await apply_batch(batch)
+            except TransferError as e:
+                short = ctx.guild.get_member(int(e.owner))
+                return await ctx.send(f"❌ Nothing changed: {short.mention if short else e.owner} only has **{e.have:,}** in their wallet.")
+
+        verb = "Gave" if amount > 0 else "Took"
+        await ctx.send(f"✅ {verb} **{abs(amount):,}** coins {'to' if amount > 0 else 'from'} {len(members)} user(s).")
+
+    @tasks.loop(minutes=1)
+    async def expire_events(self):
         await self.bot.wait_until_ready()
-        coins = load_coins()
-        changed = False
-        for _, balances in coins.items():
-            bank_balance = int(balances.get("bank", 0))
-            if bank_balance > 0:
-                interest = int(bank_balance * INTEREST_RATE)
-                if interest > 0:
-                    balances["bank"] = bank_balance + interest
-                    changed = True
-        if changed:
-            save_coins(coins)
-            print("[Interest] Applied interest to bank balances.")
+        name = await EVENT_REGISTRY.expire()
+        if name:
+            print(f"[Events] {name} ended.")
 
     @tasks.loop(hours=5)
     async def send_backup_zip_every_5h(self):
@@ -110,5 +179,52 @@ class Admin(commands.Cog):
         ok = await self.dm_package_to_user(PACKAGE_USER_ID, reason=f"Manual !package by {ctx.author} ({ctx.author.id})")
         await ctx.send("✅ Backup zip sent via DM." if ok else "⚠️ Tried to DM the backup, but it failed.")
 
+    @commands.command(name="storagestats", help="Admin: per-file storage load/save stats. Usage: !storagestats [json]")
+    @commands.guild_only()
+    async def storagestats(self, ctx, fmt: str = ""):
+        if ctx.author.id != PACKAGE_USER_ID and not ctx.author.guild_permissions.administrator:
+            return await ctx.send("❌ You don’t have permission to use this command.")
+
+        stats = storage_stats()
+        locks = MONEY_LOCKS.stats()
+        if fmt.lower() == "json":
+            stats = {**stats, "money_locks": locks}
+            body = json.dumps(stats, indent=2).encode("utf-8")
+            return await ctx.send(file=discord.File(io.BytesIO(body), filename="storage_stats.json"))
+
+        files = stats["files"]
+        if not files:
+            return await ctx.send("📭 No storage activity recorded yet.")
+
+        def cost(item):
+            _, f = item
+            return f["parse"]["mean_ms"] * f["parse"]["count"] + f["serialize"]["mean_ms"] * f["serialize"]["count"]
+
+        lines = []
+        for name, f in sorted(files.items(), key=cost, reverse=True)[:15]:
+            lines.append(
+                f"{name}\n"
+                f"  loads {f['loads']} · hits {f['hits']} · saves {f['saves']} ({f['saves_per_min']}/min) · appends {f['appends']}\n"
+                f"  read {f['bytes_read'] / 1e6:.2f} MB · written {f['bytes_written'] / 1e6:.2f} MB · avg save {f['avg_save_bytes'] / 1e3:.1f} KB\n"
+                f"  parse p50/p95 {f['parse']['p50_ms']}/{f['parse']['p95_ms']} ms · "
+                f"serialize p50/p95 {f['serialize']['p50_ms']}/{f['serialize']['p95_ms']} ms"
+            )
+        embed = discord.Embed(
+            title="🗄️ Storage Stats",
+            description=("```\n" + "\n".join(lines))[:4000] + "\n```",
+            color=discord.Color.dark_teal(),
+        )
+        embed.add_field(
+            name="Money locks",
+            value=(
+                f"{locks['acquisitions']} taken · {locks['waits']} waited "
+                f"({locks['wait_ms_total']:.0f} ms total, max {locks['wait_ms_max']:.0f} ms) · "
+                f"max queue {locks['max_queue_depth']} · {locks['stripes']} stripes"
+            ),
+            inline=False,
+        )
+        embed.set_footer(text=f"Since {stats['uptime_min']:.0f} min ago · !storagestats json for the raw dump")
+        await ctx.send(embed=embed)
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(Admin(bot))
@@ -1,7 +1,8 @@
 import random
 import discord
 from discord.ext import commands
-from bot.cogs.economy import ensure_user_coins, load_coins, save_coins
+from bot.utils.accounts import AccountConflict, CONFLICT_REPLY
+from bot.utils.transfers import TransferError, transfer
 
 SOLO_BLACKJACK_GAMES: dict[str, dict] = {}
 
@@ -38,17 +39,15 @@ class Blackjack(commands.Cog):
         if user_id in SOLO_BLACKJACK_GAMES:
             return await ctx.send("❌ You already have a solo Blackjack game in progress! Use `!hit` or `!stand`.")
 
-        ensure_user_coins(user_id)
-        coins = load_coins()
-        user_data = coins[user_id]
-
         if bet <= 0:
             return await ctx.send("❌ Your bet must be more than zero.")
-        if int(user_data["wallet"]) < bet:
-            return await ctx.send("💸 You don’t have enough coins to bet that much.")
 
-        user_data["wallet"] -= bet
-        save_coins(coins)
+        try:
+            await transfer(user_id, None, bet, "blackjack_bet")
+        except TransferError:
+            return await ctx.send("💸 You don’t have enough coins to bet that much.")
+        except AccountConflict:
+            return await ctx.send(CONFLICT_REPLY)
 
         player_hand = [draw_card(), draw_card()]
         dealer_hand = [draw_card(), draw_card()]
@@ -113,24 +112,27 @@ class Blackjack(commands.Cog):
             dealer_hand.append(draw_card())
             dealer_score = calculate_score(dealer_hand)
 
-        ensure_user_coins(user_id)
-        coins = load_coins()
-        user_data = coins[user_id]
-
         if dealer_score > 21 or player_score > dealer_score:
             winnings = bet * 2
-            user_data["wallet"] += winnings
+            payout = winnings
             result_msg = f"🎉 You win! Dealer had {dealer_score}. You earned **{winnings}** coins!"
             color = discord.Color.green()
         elif dealer_score == player_score:
-            user_data["wallet"] += bet
+            payout = bet
             result_msg = f"🤝 It’s a tie! Dealer had {dealer_score}. Your **{bet}** coins were returned."
             color = discord.Color.gold()
         else:
+            payout = 0
             result_msg = f"😢 You lost. Dealer had {dealer_score}. Better luck next time!"
             color = discord.Color.red()
 
-        save_coins(coins)
+        if payout:
+            try:
+                await transfer(None, user_id, payout, "blackjack_payout")
+            except AccountConflict:
+                # the dealer's hand is already final, so standing again settles the same result
+                SOLO_BLACKJACK_GAMES[user_id] = game
+                return await ctx.send(f"{CONFLICT_REPLY} Use `!stand` again to collect.")
         embed = discord.Embed(
             title="🏁 Final Result",
             description=(
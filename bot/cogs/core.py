@@ -1,44 +1,55 @@
+import atexit
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
-from bot.config import XP_PER_MESSAGE, TOP_ROLE_NAME, LEVEL_UP_CHANNEL_ID, EVENTS
-from bot.utils.storage import load_json, save_json
+from bot.config import XP_PER_MESSAGE, TOP_ROLE_NAME, LEVEL_UP_CHANNEL_ID
+from bot.utils.storage import aload_record, aupdate_records, update_records
+from bot.utils.events import EVENT_REGISTRY
 
 DATA_FILE = "data.json"
-EVENT_FILE = "events.json"
-
-# Local copy of EVENTS like your original (keep in config if you want)
-EVENTS = {
-    "Double XP": {"xp_mult": 2},
-    "Crash Week": {"crash_odds": 0.3},
-    "Boom Frenzy": {"boom_odds": 0.3},
-    "Coin Rain": {"bonus_daily": 100},
-}
+XP_FLUSH_SECONDS = 5
 
 AFK_STATUS = {}  # key: f"{guild_id}-{user_id}" -> reason
+TOP_XP: dict[str, tuple[str, int]] = {}  # guild_id -> (user_id, xp) of the current XP leader
+
+# In-memory XP totals; data.json is only written every XP_FLUSH_SECONDS
+XP_TOTALS: dict[tuple[str, str], dict] = {}  # (guild_id, user_id) -> {"xp", "level"}
+XP_DIRTY: set[tuple[str, str]] = set()
 
 def calculate_level(xp: int) -> int:
     return int(xp ** 0.5)
 
-def load_data():
-    return load_json(DATA_FILE, {})
-
-def save_data(d):
-    save_json(DATA_FILE, d)
-
-def load_event():
-    return load_json(EVENT_FILE, {})
-
-def save_event(d):
-    save_json(EVENT_FILE, d)
+async def get_top_xp(guild_id: int | str) -> tuple[str, int] | None:
+    """Current XP leader of a guild; read from data.json once, then tracked in memory."""
+    gid = str(guild_id)
+    if gid not in TOP_XP:
+        # a copy: on a resident data.json this is the live guild dict
+        users = dict(await aload_record(DATA_FILE, gid, None) or {})
+        # overlay XP still buffered in memory
+        users.update({u: rec for (g, u), rec in XP_TOTALS.items() if g == gid})
+        if not users:
+            return None
+        uid, user = max(users.items(), key=lambda x: x[1].get("xp", 0))
+        TOP_XP[gid] = (uid, int(user.get("xp", 0)))
+    return TOP_XP[gid]
+
+def note_xp(guild_id: int | str, user_id: int | str, xp: int) -> bool:
+    """Record a user's new XP total. True if that made them the new leader."""
+    gid, uid = str(guild_id), str(user_id)
+    top = TOP_XP.get(gid)
+    if top is not None and top[0] == uid:
+        TOP_XP[gid] = (uid, xp)
+        return False
+    if top is None or xp > top[1]:
+        TOP_XP[gid] = (uid, xp)
+        return True
+    return False
 
 async def update_top_exp_role(guild: discord.Guild):
-    data = load_data()
-    gid = str(guild.id)
-    if gid not in data or not data[gid]:
+    top = await get_top_xp(guild.id)
+    if not top:
         return
-    top_user_id, _ = max(data[gid].items(), key=lambda x: x[1].get("xp", 0))
-    top_member = guild.get_member(int(top_user_id))
+    top_member = guild.get_member(int(top[0]))
     if not top_member:
         return
 
@@ -49,31 +60,59 @@ async def update_top_exp_role(guild: discord.Guild):
         except discord.Forbidden:
             return
 
-    for m in guild.members:
-        if role in m.roles and m != top_member:
+    for m in list(role.members):
+        if m != top_member:
             await m.remove_roles(role)
     if role not in top_member.roles:
         await top_member.add_roles(role)
 
+def _take_pending_xp() -> list[tuple[tuple[str, str], dict]]:
+    """Claim every buffered XP change as ((guild_id, user_id), fields) record updates."""
+    keys = list(XP_DIRTY)
+    XP_DIRTY.clear()
+    return [(k, dict(XP_TOTALS[k])) for k in keys]
+
+async def flush_xp():
+    """Write every buffered XP change to data.json as record updates, in one write."""
+    if not XP_DIRTY:
+        return
+    # claimed before the await: XP that arrives meanwhile stays dirty for the next flush
+    items = _take_pending_xp()
+    try:
+        await aupdate_records(DATA_FILE, items)
+    except Exception:
+        XP_DIRTY.update(k for k, _ in items)
+        raise
+    # written: drop the totals nothing has changed since, data.json has them now
+    for k, _ in items:
+        if k not in XP_DIRTY:
+            XP_TOTALS.pop(k, None)
+
+@atexit.register
+def _flush_xp_at_exit():
+    # runs before the storage layer's own exit flush (registered earlier)
+    if XP_DIRTY:
+        update_records(DATA_FILE, _take_pending_xp())
+
 async def update_xp(bot: commands.Bot, user_id: int, guild_id: int, xp_amount: int):
-    data = load_data()
     gid = str(guild_id)
     uid = str(user_id)
 
-    data.setdefault(gid, {})
-    user = data[gid].setdefault(uid, {"xp": 0})
+    user = XP_TOTALS.get((gid, uid))
+    if user is None:
+        # a copy: on a resident data.json this is the live record
+        user = dict(await aload_record(DATA_FILE, (gid, uid), None) or {"xp": 0})
+        user = XP_TOTALS.setdefault((gid, uid), user)
 
     prev_xp = int(user.get("xp", 0))
     prev_level = int(user.get("level", calculate_level(prev_xp)))
 
-    event = load_event()
-    mult = EVENTS.get(event.get("active", ""), {}).get("xp_mult", 1)
+    mult = EVENT_REGISTRY.modifier("xp_mult", 1)
 
     user["xp"] = prev_xp + int(xp_amount * mult)
     new_level = calculate_level(int(user["xp"]))
     user["level"] = new_level
-
-    save_data(data)
+    XP_DIRTY.add((gid, uid))
 
     # Level-up announcements (your logic)
     if new_level > prev_level and new_level % 5 == 0:
@@ -97,13 +136,41 @@ async def update_xp(bot: commands.Bot, user_id: int, guild_id: int, xp_amount: i
             if role and member:
                 await member.add_roles(role)
 
-    guild = bot.get_guild(int(gid))
-    if guild:
-        await update_top_exp_role(guild)
+    # XP only goes up, so the leader changes only when someone overtakes them;
+    # the first message after a restart also re-syncs the role once
+    fresh = gid not in TOP_XP
+    await get_top_xp(gid)
+    if note_xp(gid, uid, int(user["xp"])) or fresh:
+        guild = bot.get_guild(int(gid))
+        if guild:
+            await update_top_exp_role(guild)
 
 class Core(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.flush_xp_loop.start()
+        EVENT_REGISTRY.subscribe(self.on_event_change)
+
+    def cog_unload(self):
+        self.flush_xp_loop.cancel()
+        EVENT_REGISTRY.unsubscribe(self.on_event_change)
+
+    async def on_event_change(self, name: str, mods: dict, active: bool):
+        if "xp_mult" not in mods:
+            return
+        ch = self.bot.get_channel(LEVEL_UP_CHANNEL_ID)
+        if ch:
+            if active:
+                await ch.send(f"✨ **{name}** is live — chat XP is worth **x{mods['xp_mult']}**!")
+            else:
+                await ch.send(f"⌛ **{name}** has ended — XP is back to normal.")
+
+    @tasks.loop(seconds=XP_FLUSH_SECONDS)
+    async def flush_xp_loop(self):
+        try:
+            await flush_xp()
+        except Exception as e:
+            print(f"[XP] flush failed: {type(e).__name__}: {e}")
 
     @commands.command(name="afk", help="Set your AFK status with a reason")
     async def afk(self, ctx, *, reason: str = "AFK"):
@@ -1,6 +1,7 @@
 # bot/cogs/economy.py
 import time
 import random
+from datetime import datetime, timedelta, timezone
 import discord
 from discord.ext import commands, tasks
 
@@ -16,11 +17,19 @@ from bot.config import (
     BANKROB_MAX_STEAL_PCT_CAP,
     MARKET_ANNOUNCE_CHANNEL_ID,
     SUGGESTION_CHANNEL_ID,
+    INTEREST_INTERVAL,
 )
 
-from bot.utils.storage import load_json, save_json
+from bot.utils.storage import aload_json, asave_json, aload_record, WriteSet
+from bot.utils.accounts import AccountConflict, CONFLICT_REPLY, AccountSession, BALANCE_RANKS, get_account, retry_on_conflict, materialize_accounts, balance_ranks, cooldown_index, holdings_matrix
+from bot.utils.ranking import RankIndex
+from bot.utils.events import EVENT_REGISTRY
 from bot.utils.locks import MONEY_LOCKS
+from bot.utils.ledger import LEDGER
+from bot.utils.transfers import Batch, TransferError, SHOP, apply_batch, transfer
+from bot.utils.market import load_market
 from bot.utils.members import get_member_safe
+from bot.utils.orderbook import order_books
 
 # If you want shop auto-restock every 5 minutes
 SHOP_RESTOCK_CHECK_MINUTES = 5
@@ -33,6 +42,12 @@ BEG_COOLDOWN = 30
 ROB_COOLDOWN = 300
 BANKROB_COOLDOWN = 600
 
+# !history rows per page
+HISTORY_PAGE_SIZE = 10
+
+# shop_stock.json is shared by every buyer, so purchases and restocks also lock this key
+SHOP_LOCK_KEY = SHOP
+
 # JSON files
 COIN_DATA_FILE = "coins.json"
 INVENTORY_FILE = "inventories.json"
@@ -44,27 +59,13 @@ BEG_STATS_FILE = "beg_stats.json"
 # -----------------------
 # Storage helpers
 # -----------------------
-def load_coins():
-    return load_json(COIN_DATA_FILE, {})
-
-
-def save_coins(d):
-    save_json(COIN_DATA_FILE, d)
-
-
-def load_inventory():
-    return load_json(INVENTORY_FILE, {})
-
-
-def save_inventory(d):
-    save_json(INVENTORY_FILE, d)
-
-
-def load_shop_stock():
-    stock = load_json(SHOP_FILE, None)
+async def load_shop_stock(readonly: bool = False):
+    if readonly:
+        return await aload_json(SHOP_FILE, {}, readonly=True)
+    stock = await aload_json(SHOP_FILE, None)
     if stock is None:
         stock = {item: 0 for item in SHOP_ITEMS}
-        save_shop_stock(stock)
+        await save_shop_stock(stock)
         return stock
     # ensure keys exist
     changed = False
@@ -73,82 +74,43 @@ def load_shop_stock():
             stock[item] = 0
             changed = True
     if changed:
-        save_shop_stock(stock)
+        await save_shop_stock(stock)
     return stock
 
 
-def save_shop_stock(d):
-    save_json(SHOP_FILE, d)
-
+async def save_shop_stock(d):
+    await asave_json(SHOP_FILE, d)
 
-def load_suggestions():
-    return load_json(SUGGESTION_FILE, [])
 
+async def load_suggestions():
+    return await aload_json(SUGGESTION_FILE, [])
 
-def save_suggestions(d):
-    save_json(SUGGESTION_FILE, d)
 
+async def save_suggestions(d):
+    await asave_json(SUGGESTION_FILE, d)
 
-def load_beg_stats():
-    return load_json(BEG_STATS_FILE, {})
 
+async def load_beg_stats(readonly: bool = False):
+    return await aload_json(BEG_STATS_FILE, {}, readonly=readonly)
 
-def save_beg_stats(d):
-    save_json(BEG_STATS_FILE, d)
 
+async def save_beg_stats(d):
+    await asave_json(BEG_STATS_FILE, d)
 
-def ensure_user_coins(user_id: int | str):
-    uid = str(user_id)
-    coins = load_coins()
-
-    if uid not in coins:
-        coins[uid] = {
-            "wallet": 100,
-            "bank": 0,
-            "last_daily": 0.0,
-            "last_rob": 0.0,
-            "last_bankrob": 0.0,
-            "last_beg": 0.0,
-            "portfolio": {s: 0 for s in STOCKS},
-        }
-        save_coins(coins)
-        return coins
 
-    data = coins[uid]
-    changed = False
-    for k, default in [
-        ("wallet", 100),
-        ("bank", 0),
-        ("last_daily", 0.0),
-        ("last_rob", 0.0),
-        ("last_bankrob", 0.0),
-        ("last_beg", 0.0),
-    ]:
-        if k not in data:
-            data[k] = default
-            changed = True
+# (level, xp, total_begs) per user, kept current by !beg
+BEG_RANKS = RankIndex()
 
-    if "portfolio" not in data or not isinstance(data["portfolio"], dict):
-        data["portfolio"] = {s: 0 for s in STOCKS}
-        changed = True
-    else:
-        for s in STOCKS:
-            if s not in data["portfolio"]:
-                data["portfolio"][s] = 0
-                changed = True
 
-    if changed:
-        save_coins(coins)
-    return coins
+def _beg_score(stats) -> tuple[int, int, int]:
+    return int(stats.get("level", 1)), int(stats.get("xp", 0)), int(stats.get("total_begs", 0))
 
 
-def ensure_user_inventory(user_id: int | str):
-    uid = str(user_id)
-    inv = load_inventory()
-    if uid not in inv:
-        inv[uid] = {}
-        save_inventory(inv)
-    return inv
+async def beg_ranks() -> RankIndex:
+    if not BEG_RANKS.ready:
+        stats = await load_beg_stats(readonly=True)
+        BEG_RANKS.rebuild((uid, _beg_score(st)) for uid, st in stats.items() if st)
+    return BEG_RANKS
 
 
 def _match_item(name: str) -> str | None:
@@ -209,6 +171,87 @@ def _format_coins(n: int) -> str:
     return f"{int(n):,}"
 
 
+def _daily_wait(last_ts: float, now: datetime) -> int:
+    """Seconds until the next midnight UTC if the daily was already claimed today, else 0."""
+    if not last_ts or datetime.fromtimestamp(last_ts, timezone.utc).date() != now.date():
+        return 0
+    tomorrow = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return int((tomorrow - now).total_seconds())
+
+
+def _cooldown_reply(field: str, remaining: int) -> dict:
+    """ctx.send() kwargs telling the user how long `field` is still on cooldown."""
+    if field == "last_beg":
+        return {"content": f"⏳ Wait **{remaining}s** before begging again."}
+    if field == "last_rob":
+        return {"embed": discord.Embed(description=f"⏳ Cooldown: **{remaining}**s", color=discord.Color.purple())}
+    if field == "last_bankrob":
+        return {"embed": discord.Embed(description=f"🚨 Try again in **{remaining//60}m {remaining%60}s**.", color=discord.Color.purple())}
+    h, m, s = remaining // 3600, (remaining % 3600) // 60, remaining % 60
+    return {"embed": discord.Embed(
+        description=f"🕒 Already claimed. Try again in **{h}h {m}m {s}s** (midnight UTC).",
+        color=discord.Color.purple(),
+    )}
+
+
+def _guild_filter(guild):
+    """Rank-index filter: user is a (non-bot) member of `guild`, via the member cache."""
+    def accept(uid: str) -> bool:
+        m = guild.get_member(int(uid))
+        return m is not None and not m.bot
+    return accept
+
+
+async def _valuation():
+    """HOLDINGS with the order books loaded, so coins escrowed in open bids count toward net worth."""
+    await order_books()
+    return await holdings_matrix()
+
+
+def _guild_ranks(ranks: RankIndex, guild) -> RankIndex:
+    """`ranks` over the (non-bot) members of `guild`; built from the member cache on first use."""
+    return ranks.view(guild.id, (m.id for m in guild.members if not m.bot))
+
+
+def _ranked_members(ranks: RankIndex, guild, count: int) -> tuple[RankIndex, list]:
+    """
+    Top `count` of `ranks` in `guild` as (member, score), and the guild view.
+    Users the member cache no longer has (a missed leave event) are dropped
+    from the view rather than shown.
+    """
+    while True:
+        view = _guild_ranks(ranks, guild)
+        top = view.top(count)
+        gone = [uid for uid, _ in top if guild.get_member(int(uid)) is None]
+        if not gone:
+            return view, [(guild.get_member(int(uid)), score) for uid, score in top]
+        for uid in gone:
+            ranks.leave(guild.id, uid)
+
+
+def _add_rank_footer(embed, ranks: RankIndex, user_id: int):
+    pos = ranks.rank(user_id)
+    if pos is not None:
+        embed.set_footer(text=f"📍 Your rank: #{pos}")
+
+
+
+def _tx_line(tx: dict, user_id: int | str) -> str:
+    """One !history row from the user's point of view: signed amount and the other side."""
+    uid = str(user_id)
+    incoming = tx["to_id"] == uid and tx["from_id"] != uid
+    other = tx["from_id"] if incoming else tx["to_id"]
+    who = f"<@{other}>" if other else "🏦"
+    sign = "+" if incoming else "−"
+    detail = ""
+    meta = tx.get("meta") or {}
+    if "item" in meta:
+        detail = f" ({meta.get('qty', 1)}× {meta['item']})"
+    elif "stock" in meta:
+        detail = f" ({meta['shares']} {meta['stock']} @ {_format_coins(meta['price'])})"
+    return f"`#{tx['id']}` <t:{int(tx['ts'])}:R> **{tx['kind']}** {sign}{_format_coins(tx['amount'])} · {who}{detail}"
+
+
 # -----------------------
 # Trade state (simple)
 # -----------------------
@@ -223,14 +266,45 @@ class Economy(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.shop_restock_loop.start()
+        self.materialize_loop.start()
+        EVENT_REGISTRY.subscribe(self.on_event_change)
 
     def cog_unload(self):
         self.shop_restock_loop.cancel()
+        self.materialize_loop.cancel()
+        EVENT_REGISTRY.unsubscribe(self.on_event_change)
+
+    async def on_event_change(self, name: str, mods: dict, active: bool):
+        if "bonus_daily" not in mods:
+            return
+        channel = self.bot.get_channel(MARKET_ANNOUNCE_CHANNEL_ID)
+        if not channel:
+            return
+        if active:
+            desc = f"🌧️ **{name}** — every `!daily` pays **+{_format_coins(mods['bonus_daily'])}** extra coins!"
+        else:
+            desc = f"☀️ **{name}** is over — `!daily` is back to normal."
+        try:
+            await channel.send(embed=discord.Embed(description=desc, color=discord.Color.gold()))
+        except Exception:
+            pass
+
+    # ---------- Rank index membership ----------
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        if not member.bot:
+            for ranks in (BALANCE_RANKS, BEG_RANKS):
+                ranks.join(member.guild.id, member.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        for ranks in (BALANCE_RANKS, BEG_RANKS):
+            ranks.leave(member.guild.id, member.id)
 
     # ---------- Suggestions ----------
     @commands.command(name="suggest", help="Submit a suggestion to the server.")
     async def suggest(self, ctx, *, message: str):
-        suggestions = load_suggestions()
+        suggestions = await load_suggestions()
         suggestions.append(
             {
                 "user_id": ctx.author.id,
@@ -239,7 +313,7 @@ class Economy(commands.Cog):
                 "timestamp": discord.utils.utcnow().isoformat(),
             }
         )
-        save_suggestions(suggestions)
+        await save_suggestions(suggestions)
 
         channel = self.bot.get_channel(SUGGESTION_CHANNEL_ID)
         if not channel:
@@ -260,58 +334,52 @@ class Economy(commands.Cog):
     @commands.command(name="balance", aliases=["bal"], help="Check your or someone else's wallet and bank balance.")
     async def balance(self, ctx, member: discord.Member = None):
         member = member or ctx.author
-        ensure_user_coins(member.id)
-        coins = load_coins()
-        data = coins[str(member.id)]
+        acct = await get_account(member.id)
 
         embed = discord.Embed(title=f"💰 {member.display_name}'s Balance", color=discord.Color.purple())
-        embed.add_field(name="Wallet", value=f"💵 {_format_coins(data['wallet'])} coins", inline=True)
-        embed.add_field(name="Bank", value=f"🏦 {_format_coins(data['bank'])} coins", inline=True)
+        embed.add_field(name="Wallet", value=f"💵 {_format_coins(acct.wallet)} coins", inline=True)
+        embed.add_field(name="Bank", value=f"🏦 {_format_coins(acct.bank)} coins", inline=True)
         await ctx.send(embed=embed)
 
     @commands.command(name="deposit", aliases=["dep"], help="Deposit to bank. Usage: !deposit <amount> or !deposit all")
+    @retry_on_conflict()
     async def deposit(self, ctx, amount: str):
-        uid = str(ctx.author.id)
-        ensure_user_coins(uid)
-        coins = load_coins()
-        data = coins[uid]
+        async with MONEY_LOCKS.hold(ctx.author.id), AccountSession() as session:
+            acct = await session.get(ctx.author.id)
 
-        if amount.lower() == "all":
-            amt = int(data["wallet"])
-        else:
-            if not amount.isdigit():
-                return await ctx.send(embed=discord.Embed(description="❌ Enter a number or `all`.", color=discord.Color.orange()))
-            amt = int(amount)
+            if amount.lower() == "all":
+                amt = int(acct.wallet)
+            else:
+                if not amount.isdigit():
+                    return await ctx.send(embed=discord.Embed(description="❌ Enter a number or `all`.", color=discord.Color.orange()))
+                amt = int(amount)
 
-        if amt <= 0 or amt > int(data["wallet"]):
-            return await ctx.send(embed=discord.Embed(description="❌ Not enough wallet balance.", color=discord.Color.orange()))
+            if amt <= 0 or amt > int(acct.wallet):
+                return await ctx.send(embed=discord.Embed(description="❌ Not enough wallet balance.", color=discord.Color.orange()))
 
-        data["wallet"] -= amt
-        data["bank"] += amt
-        save_coins(coins)
+            acct.wallet -= amt
+            acct.bank += amt
 
         await ctx.send(embed=discord.Embed(description=f"🏦 Deposited **{_format_coins(amt)}** coins.", color=discord.Color.orange()))
 
     @commands.command(name="withdraw", aliases=["with"], help="Withdraw from bank. Usage: !withdraw <amount> or !withdraw all")
+    @retry_on_conflict()
     async def withdraw(self, ctx, amount: str):
-        uid = str(ctx.author.id)
-        ensure_user_coins(uid)
-        coins = load_coins()
-        data = coins[uid]
+        async with MONEY_LOCKS.hold(ctx.author.id), AccountSession() as session:
+            acct = await session.get(ctx.author.id)
 
-        if amount.lower() == "all":
-            amt = int(data["bank"])
-        else:
-            if not amount.isdigit():
-                return await ctx.send(embed=discord.Embed(description="❌ Enter a number or `all`.", color=discord.Color.orange()))
-            amt = int(amount)
+            if amount.lower() == "all":
+                amt = int(acct.bank)
+            else:
+                if not amount.isdigit():
+                    return await ctx.send(embed=discord.Embed(description="❌ Enter a number or `all`.", color=discord.Color.orange()))
+                amt = int(amount)
 
-        if amt <= 0 or amt > int(data["bank"]):
-            return await ctx.send(embed=discord.Embed(description="❌ Not enough bank balance.", color=discord.Color.orange()))
+            if amt <= 0 or amt > int(acct.bank):
+                return await ctx.send(embed=discord.Embed(description="❌ Not enough bank balance.", color=discord.Color.orange()))
 
-        data["bank"] -= amt
-        data["wallet"] += amt
-        save_coins(coins)
+            acct.bank -= amt
+            acct.wallet += amt
 
         await ctx.send(embed=discord.Embed(description=f"💰 Withdrew **{_format_coins(amt)}** coins.", color=discord.Color.orange()))
 
@@ -325,24 +393,12 @@ class Economy(commands.Cog):
         if amount <= 0:
             return await ctx.send("❌ Enter an amount > 0.")
 
-        a = ctx.author.id
-        b = member.id
-        first, second = sorted([a, b])
-
-        async with MONEY_LOCKS[first], MONEY_LOCKS[second]:
-            ensure_user_coins(a)
-            ensure_user_coins(b)
-            coins = load_coins()
-
-            sender = coins[str(a)]
-            recipient = coins[str(b)]
-
-            if int(sender["wallet"]) < amount:
-                return await ctx.send("💸 You don't have enough coins in your wallet.")
-
-            sender["wallet"] -= amount
-            recipient["wallet"] += amount
-            save_coins(coins)
+        try:
+            await transfer(ctx.author.id, member.id, amount, "pay")
+        except TransferError:
+            return await ctx.send("💸 You don't have enough coins in your wallet.")
+        except AccountConflict:
+            return await ctx.send(CONFLICT_REPLY)
 
         await ctx.send(embed=discord.Embed(description=f"✅ Sent **{_format_coins(amount)}** coins to {member.mention}!", color=discord.Color.green()))
 
@@ -355,93 +411,75 @@ class Economy(commands.Cog):
         if amount <= 0:
             return await ctx.send(embed=discord.Embed(description="❌ Amount must be > 0.", color=discord.Color.orange()))
 
-        a = ctx.author.id
-        b = member.id
-        first, second = sorted([a, b])
-
-        async with MONEY_LOCKS[first], MONEY_LOCKS[second]:
-            ensure_user_coins(a)
-            ensure_user_coins(b)
-            coins = load_coins()
-
-            donor = coins[str(a)]
-            recipient = coins[str(b)]
-
-            if int(donor["wallet"]) < amount:
-                return await ctx.send(embed=discord.Embed(description="💸 Not enough wallet balance.", color=discord.Color.orange()))
-
-            donor["wallet"] -= amount
-            recipient["wallet"] += amount
-            save_coins(coins)
+        try:
+            await transfer(ctx.author.id, member.id, amount, "donate")
+        except TransferError:
+            return await ctx.send(embed=discord.Embed(description="💸 Not enough wallet balance.", color=discord.Color.orange()))
+        except AccountConflict:
+            return await ctx.send(CONFLICT_REPLY)
 
         await ctx.send(embed=discord.Embed(description=f"💖 {ctx.author.mention} donated **{_format_coins(amount)}** coins to {member.mention}!", color=discord.Color.orange()))
 
     # ---------- Daily ----------
     @commands.command(name="daily", help="Claim your daily reward (resets at midnight UTC).")
+    @retry_on_conflict()
     async def daily(self, ctx):
-        uid = str(ctx.author.id)
-        ensure_user_coins(uid)
-        coins = load_coins()
-        data = coins[uid]
-
         now = discord.utils.utcnow()
-        last_ts = float(data.get("last_daily", 0.0))
-        last_dt = discord.utils.utcnow().fromtimestamp(last_ts) if last_ts else None
-
-        if last_dt and last_dt.date() == now.date():
-            tomorrow = now.replace(hour=0, minute=0, second=0, microsecond=0) + discord.utils.timedelta(days=1)
-            remaining = int((tomorrow - now).total_seconds())
-            h = remaining // 3600
-            m = (remaining % 3600) // 60
-            s = remaining % 60
-            return await ctx.send(
-                embed=discord.Embed(
-                    description=f"🕒 Already claimed. Try again in **{h}h {m}m {s}s** (midnight UTC).",
-                    color=discord.Color.purple(),
-                )
-            )
-
-        reward = random.randint(200, 350)
-        data["wallet"] += reward
-        data["last_daily"] = now.timestamp()
-        save_coins(coins)
+        cooldowns = await cooldown_index()
+        wait = _daily_wait(cooldowns.last(ctx.author.id, "last_daily"), now)
+        if wait:
+            return await ctx.send(**_cooldown_reply("last_daily", wait))
+
+        async with MONEY_LOCKS.hold(ctx.author.id), AccountSession() as session:
+            acct = await session.get(ctx.author.id)
+            wait = _daily_wait(acct.last_daily, now)
+            if wait:
+                return await ctx.send(**_cooldown_reply("last_daily", wait))
+
+            reward = random.randint(200, 350) + int(EVENT_REGISTRY.modifier("bonus_daily", 0))
+            acct.wallet += reward
+            acct.last_daily = now.timestamp()
 
         await ctx.send(embed=discord.Embed(description=f"💰 Daily claimed: **{_format_coins(reward)}** coins!", color=discord.Color.purple()))
 
     # ---------- Beg ----------
     @commands.command(name="beg", help="Beg for coins (has cooldown, levels up over time).")
+    @retry_on_conflict()
     async def beg(self, ctx):
         uid = str(ctx.author.id)
+        cooldowns = await cooldown_index()
+        wait = cooldowns.remaining(uid, "last_beg", BEG_COOLDOWN)
+        if wait:
+            return await ctx.send(**_cooldown_reply("last_beg", int(wait)))
 
-        ensure_user_coins(uid)
-        coins = load_coins()
-        data = coins[uid]
+        async with MONEY_LOCKS.hold(uid), AccountSession() as session:
+            acct = await session.get(uid)
 
-        now = time.time()
-        last_beg = float(data.get("last_beg", 0.0))
-        if now - last_beg < BEG_COOLDOWN:
-            remaining = int(BEG_COOLDOWN - (now - last_beg))
-            return await ctx.send(f"⏳ Wait **{remaining}s** before begging again.")
+            now = time.time()
+            if now - acct.last_beg < BEG_COOLDOWN:
+                remaining = int(BEG_COOLDOWN - (now - acct.last_beg))
+                return await ctx.send(**_cooldown_reply("last_beg", remaining))
 
-        beg_stats = load_beg_stats()
-        user_beg = beg_stats.setdefault(uid, {"xp": 0, "level": 1, "total_begs": 0})
+            user_beg = await aload_record(BEG_STATS_FILE, uid, None) or {"xp": 0, "level": 1, "total_begs": 0}
 
-        # level curve (same “sqrt-ish” vibe as your original)
-        user_beg["level"] = int((int(user_beg["xp"]) ** 0.5) // 5 + 1)
+            # level curve (same “sqrt-ish” vibe as your original)
+            user_beg["level"] = int((int(user_beg["xp"]) ** 0.5) // 5 + 1)
 
-        base_min = 10 + user_beg["level"] * 2
-        base_max = 30 + user_beg["level"] * 5
-        amount = random.randint(base_min, base_max)
+            base_min = 10 + user_beg["level"] * 2
+            base_max = 30 + user_beg["level"] * 5
+            amount = random.randint(base_min, base_max)
 
-        data["wallet"] += amount
-        data["last_beg"] = now
+            acct.wallet += amount
+            acct.last_beg = now
 
-        xp_gain = random.randint(5, 12)
-        user_beg["xp"] += xp_gain
-        user_beg["total_begs"] += 1
+            xp_gain = random.randint(5, 12)
+            user_beg["xp"] += xp_gain
+            user_beg["total_begs"] += 1
+            # stats land in the same commit as the coins they were earned with
+            await session.commit(WriteSet().put(BEG_STATS_FILE, uid, user_beg))
 
-        save_coins(coins)
-        save_beg_stats(beg_stats)
+        if BEG_RANKS.ready:
+            BEG_RANKS.update(uid, _beg_score(user_beg))
 
         embed = discord.Embed(
             title="🙏 Successful Beg",
@@ -457,36 +495,23 @@ class Economy(commands.Cog):
     @commands.command(name="begleaderboard", aliases=["begtop"], help="Show top beggars in the server.")
     async def begleaderboard(self, ctx, count: int = 10):
         count = max(3, min(25, int(count)))
-        beg_stats = load_beg_stats()
-
-        entries = []
-        for member in ctx.guild.members:
-            if member.bot:
-                continue
-            stats = beg_stats.get(str(member.id))
-            if not stats:
-                continue
-            level = int(stats.get("level", 1))
-            xp = int(stats.get("xp", 0))
-            begs = int(stats.get("total_begs", 0))
-            entries.append((member, level, xp, begs))
-
+        ranks, entries = _ranked_members(await beg_ranks(), ctx.guild, count)
         if not entries:
             return await ctx.send("📭 No begging data yet.")
 
-        entries.sort(key=lambda x: (x[1], x[2], x[3]), reverse=True)
-
         lines = []
-        for i, (member, level, xp, begs) in enumerate(entries[:count], start=1):
+        for i, (member, (level, xp, begs)) in enumerate(entries, start=1):
             crown = " 👑" if i == 1 else ""
             you = " ← you" if member.id == ctx.author.id else ""
             lines.append(f"**{i}.** {member.mention}{crown} — Lvl **{level}** · {xp} XP · {begs} begs{you}")
 
         embed = discord.Embed(title="🏆 Begging Leaderboard", description="\n".join(lines), color=discord.Color.gold())
+        _add_rank_footer(embed, ranks, ctx.author.id)
         await ctx.send(embed=embed)
 
     # ---------- Rob ----------
     @commands.command(name="rob", help="Attempt to rob someone. Usage: !rob @user")
+    @retry_on_conflict()
     async def rob(self, ctx):
         target_id = _only_mention_target(ctx)
         if target_id is None:
@@ -494,6 +519,11 @@ class Economy(commands.Cog):
         if target_id == ctx.author.id:
             return await ctx.send(embed=discord.Embed(description="❌ You can't rob yourself.", color=discord.Color.purple()))
 
+        cooldowns = await cooldown_index()
+        wait = cooldowns.remaining(ctx.author.id, "last_rob", ROB_COOLDOWN)
+        if wait:
+            return await ctx.send(**_cooldown_reply("last_rob", int(wait)))
+
         target_member = ctx.guild.get_member(target_id) or await get_member_safe(ctx.guild, target_id)
         if not target_member:
             return await ctx.send("❌ Could not find that member in this server.")
@@ -502,30 +532,22 @@ class Economy(commands.Cog):
 
         a = ctx.author.id
         b = target_id
-        first, second = sorted([a, b])
-
-        async with MONEY_LOCKS[first], MONEY_LOCKS[second]:
-            ensure_user_coins(a)
-            ensure_user_coins(b)
-            coins = load_coins()
 
-            thief = coins[str(a)]
-            victim = coins[str(b)]
+        async with MONEY_LOCKS.hold(a, b), AccountSession() as session:
+            thief = await session.get(a)
+            victim = await session.get(b)
 
             now = time.time()
-            if now - float(thief.get("last_rob", 0.0)) < ROB_COOLDOWN:
-                remaining = int(ROB_COOLDOWN - (now - float(thief.get("last_rob", 0.0))))
-                return await ctx.send(embed=discord.Embed(description=f"⏳ Cooldown: **{remaining}**s", color=discord.Color.purple()))
+            if now - thief.last_rob < ROB_COOLDOWN:
+                remaining = int(ROB_COOLDOWN - (now - thief.last_rob))
+                return await ctx.send(**_cooldown_reply("last_rob", remaining))
 
-            if int(victim.get("wallet", 0)) < 50:
+            if int(victim.wallet) < 50:
                 return await ctx.send(embed=discord.Embed(description="😒 That user doesn't have enough in wallet to rob.", color=discord.Color.purple()))
 
-            stolen = random.randint(10, max(10, int(victim["wallet"]) // 2))
-            victim["wallet"] -= stolen
-            thief["wallet"] += stolen
-            thief["last_rob"] = now
-
-            save_coins(coins)
+            stolen = random.randint(10, max(10, int(victim.wallet) // 2))
+            thief.last_rob = now
+            await apply_batch(Batch().move(b, a, stolen, "rob"), session)
 
         await ctx.send(embed=discord.Embed(
             description=f"💸 You robbed **{target_member.display_name}** and got **{_format_coins(stolen)}** coins!",
@@ -534,6 +556,7 @@ class Economy(commands.Cog):
 
     # ---------- Bankrob ----------
     @commands.command(name="bankrob", help="Rob a specific person's bank (risky!). Usage: !bankrob @user")
+    @retry_on_conflict()
     async def bankrob(self, ctx):
         target_id = _only_mention_target(ctx)
         if target_id is None:
@@ -541,6 +564,11 @@ class Economy(commands.Cog):
         if target_id == ctx.author.id:
             return await ctx.send(embed=discord.Embed(description="❌ You can’t rob yourself.", color=discord.Color.purple()))
 
+        cooldowns = await cooldown_index()
+        wait = cooldowns.remaining(ctx.author.id, "last_bankrob", BANKROB_COOLDOWN)
+        if wait:
+            return await ctx.send(**_cooldown_reply("last_bankrob", int(wait)))
+
         member = ctx.guild.get_member(target_id) or await get_member_safe(ctx.guild, target_id)
         if not member:
             return await ctx.send("❌ Couldn’t find that member.")
@@ -550,27 +578,19 @@ class Economy(commands.Cog):
         robber_id = ctx.author.id
         victim_id = target_id
 
-        a, b = sorted([robber_id, victim_id])
-        async with MONEY_LOCKS[a], MONEY_LOCKS[b]:
-            ensure_user_coins(robber_id)
-            ensure_user_coins(victim_id)
-            coins = load_coins()
-            robber = coins[str(robber_id)]
-            victim = coins[str(victim_id)]
+        async with MONEY_LOCKS.hold(robber_id, victim_id), AccountSession() as session:
+            robber = await session.get(robber_id)
+            victim = await session.get(victim_id)
 
             now = time.time()
-            if now - float(robber.get("last_bankrob", 0.0)) < BANKROB_COOLDOWN:
-                remaining = int(BANKROB_COOLDOWN - (now - float(robber.get("last_bankrob", 0.0))))
-                return await ctx.send(embed=discord.Embed(
-                    description=f"🚨 Try again in **{remaining//60}m {remaining%60}s**.",
-                    color=discord.Color.purple()
-                ))
+            if now - robber.last_bankrob < BANKROB_COOLDOWN:
+                remaining = int(BANKROB_COOLDOWN - (now - robber.last_bankrob))
+                return await ctx.send(**_cooldown_reply("last_bankrob", remaining))
 
-            robber["last_bankrob"] = now
+            robber.last_bankrob = now
 
-            victim_bank = int(victim.get("bank", 0))
+            victim_bank = int(victim.bank)
             if victim_bank < 100:
-                save_coins(coins)
                 return await ctx.send(embed=discord.Embed(
                     description=f"😓 {member.display_name} doesn’t have enough in the bank to rob.",
                     color=discord.Color.purple()
@@ -588,90 +608,111 @@ class Economy(commands.Cog):
 
                 amount = max(BANKROB_MIN_STEAL, min(raw_amount, hard_cap, victim_bank))
 
-                victim["bank"] -= amount
-                robber["wallet"] += amount
-                save_coins(coins)
+                batch = Batch().move(victim_id, robber_id, amount, "bankrob", from_field="bank")
 
                 pct_display = (amount / max(1, victim_bank)) * 100
-                return await ctx.send(embed=discord.Embed(
-                    description=f"🏦 Success! You stole **{_format_coins(amount)}** coins from **{member.display_name}** (~{pct_display:.0f}% of their bank).",
-                    color=discord.Color.purple()
-                ))
+                msg = f"🏦 Success! You stole **{_format_coins(amount)}** coins from **{member.display_name}** (~{pct_display:.0f}% of their bank)."
             else:
                 # fine
-                fine_msg = "🚔 You got caught!"
-                wallet = int(robber.get("wallet", 0))
+                msg = "🚔 You got caught!"
+                batch = Batch()
+                wallet = int(robber.wallet)
                 if wallet < 50:
-                    fine_msg += " You were too broke to fine. Warning issued."
+                    msg += " You were too broke to fine. Warning issued."
                 else:
                     fine = random.randint(50, int(min(wallet, 150)))
-                    robber["wallet"] -= fine
-                    fine_msg += f" You lost **{_format_coins(fine)}** coins in legal fees."
+                    batch.move(robber_id, None, fine, "bankrob_fine")
+                    msg += f" You lost **{_format_coins(fine)}** coins in legal fees."
 
-                save_coins(coins)
-                return await ctx.send(embed=discord.Embed(description=fine_msg, color=discord.Color.purple()))
+            await apply_batch(batch, session)
+
+        await ctx.send(embed=discord.Embed(description=msg, color=discord.Color.purple()))
 
     # ---------- Leaderboards ----------
     @commands.command(name="baltop", aliases=["rich", "leaderboard"], help="Top balances by wallet+bank for this server.")
     async def baltop(self, ctx, count: int = 10):
         count = max(3, min(25, int(count)))
-        coins = load_coins()
-
-        rows = []
-        for m in ctx.guild.members:
-            if m.bot:
-                continue
-            u = coins.get(str(m.id))
-            if not u:
-                continue
-            total = int(u.get("wallet", 0)) + int(u.get("bank", 0))
-            rows.append((m, total, int(u.get("wallet", 0)), int(u.get("bank", 0))))
-
+        ranks, rows = _ranked_members(await balance_ranks(), ctx.guild, count)
         if not rows:
             return await ctx.send("📭 No economy data yet.")
 
-        rows.sort(key=lambda r: r[1], reverse=True)
-
         lines = []
-        for i, (m, total, w, b) in enumerate(rows[:count], start=1):
+        for i, (m, (total, w, b)) in enumerate(rows, start=1):
             crown = " 👑" if i == 1 else ""
             you = " ← you" if m.id == ctx.author.id else ""
             lines.append(f"**{i}.** {m.mention}{crown} — **{_format_coins(total)}** (w {_format_coins(w)} / b {_format_coins(b)}){you}")
 
         embed = discord.Embed(title="🏦 Baltop (Wallet + Bank)", description="\n".join(lines), color=discord.Color.gold())
+        _add_rank_footer(embed, ranks, ctx.author.id)
+        await ctx.send(embed=embed)
+
+    @commands.command(name="networthtop", aliases=["nwtop"], help="Top net worth (wallet + bank + stocks) for this server.")
+    async def networthtop(self, ctx, count: int = 10):
+        count = max(3, min(25, int(count)))
+        hm = await _valuation()
+        in_guild = _guild_filter(ctx.guild)
+
+        rows = hm.top(count, in_guild)
+        if not rows:
+            return await ctx.send("📭 No economy data yet.")
+
+        lines = []
+        for i, (uid, worth, stock_value) in enumerate(rows, start=1):
+            m = ctx.guild.get_member(int(uid))
+            crown = " 👑" if i == 1 else ""
+            you = " ← you" if m.id == ctx.author.id else ""
+            lines.append(f"**{i}.** {m.mention}{crown} — **{_format_coins(worth)}** (stocks {_format_coins(stock_value)}){you}")
+
+        embed = discord.Embed(title="📊 Net Worth Leaderboard", description="\n".join(lines), color=discord.Color.teal())
+        footer = f"All shares held are worth {_format_coins(hm.market_cap())} coins"
+        pos = hm.rank_among(ctx.author.id, in_guild)
+        if pos is not None:
+            footer = f"📍 Your rank: #{pos} · {footer}"
+        embed.set_footer(text=footer)
         await ctx.send(embed=embed)
 
     @commands.command(name="networth", help="Shows your net worth including stocks.")
     async def networth(self, ctx, member: discord.Member = None):
         member = member or ctx.author
-        ensure_user_coins(member.id)
-        coins = load_coins()
-        u = coins[str(member.id)]
-
-        wallet = int(u.get("wallet", 0))
-        bank = int(u.get("bank", 0))
-
-        # stock value via stocks.json (owned in portfolio)
-        stocks_data = load_json("stocks.json", {})
-        pf = u.get("portfolio", {}) or {}
-        stock_value = 0
-        for s in STOCKS:
-            shares = int(pf.get(s, 0))
-            price = int((stocks_data.get(s, {}) or {}).get("price", 0))
-            stock_value += shares * price
-
-        total = wallet + bank + stock_value
+        acct = await get_account(member.id)
+
+        wallet = int(acct.wallet)
+        bank = int(acct.bank)
+        hm = await _valuation()
+        stock_value = hm.value_of(acct.owned())
+        bids = hm.bids(member.id)
+
+        total = wallet + bank + stock_value + bids
         embed = discord.Embed(title=f"📊 Net Worth — {member.display_name}", color=discord.Color.teal())
         embed.add_field(name="Wallet", value=_format_coins(wallet), inline=True)
         embed.add_field(name="Bank", value=_format_coins(bank), inline=True)
         embed.add_field(name="Stocks", value=_format_coins(stock_value), inline=True)
+        if bids:
+            embed.add_field(name="Open bids", value=_format_coins(bids), inline=True)
         embed.add_field(name="Total", value=f"**{_format_coins(total)}**", inline=False)
         await ctx.send(embed=embed)
 
+    @commands.command(name="history", aliases=["txs"], help="Your coin transaction history. Usage: !history [@user] [page]")
+    async def history(self, ctx, member: discord.Member = None, page: int = 1):
+        member = member or ctx.author
+        page = max(1, int(page))
+        rows, total = await LEDGER.ahistory(member.id, HISTORY_PAGE_SIZE, (page - 1) * HISTORY_PAGE_SIZE)
+        pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+        if not rows:
+            return await ctx.send("📭 No transactions on that page." if total else f"📭 No transactions for {member.display_name} yet.")
+
+        embed = discord.Embed(
+            title=f"📜 History — {member.display_name}",
+            description="\n".join(_tx_line(tx, member.id) for tx in rows),
+            color=discord.Color.teal(),
+        )
+        embed.set_footer(text=f"Page {page}/{pages} · {total} transaction(s)")
+        await ctx.send(embed=embed)
+
     # ---------- Shop / inventory ----------
     @commands.command(name="shop", help="Browse items currently in stock.")
     async def shop(self, ctx):
-        stock = load_shop_stock()
+        stock = await load_shop_stock(readonly=True)
         embed = discord.Embed(title="🛒 QMUL Shop", color=discord.Color.purple())
         for item in SHOP_ITEMS:
             price = ITEM_PRICES.get(item, 0)
@@ -680,6 +721,7 @@ class Economy(commands.Cog):
         await ctx.send(embed=embed)
 
     @commands.command(name="buy", help="Buy an item. Usage: !buy <item> [qty] OR !buy <qty> <item>")
+    @retry_on_conflict()
     async def buy(self, ctx, *, raw: str):
         item_str, qty = _parse_item_and_qty(raw)
         item = _match_item(item_str)
@@ -695,36 +737,25 @@ class Economy(commands.Cog):
 
         uid = ctx.author.id
 
-        async with MONEY_LOCKS[uid]:
-            ensure_user_coins(uid)
-            ensure_user_inventory(uid)
-
-            coins = load_coins()
-            inv = load_inventory()
-            shop = load_shop_stock()
-
-            if int(shop.get(item, 0)) < qty:
-                return await ctx.send(embed=discord.Embed(
-                    description=f"📦 Not enough stock for **{item}**. Available: **{int(shop.get(item,0))}**",
-                    color=discord.Color.orange()
-                ))
+        cost = price * qty
+        batch = Batch().move(uid, None, cost, "buy", item=item, qty=qty)
+        batch.give(SHOP, item, -qty).give(uid, item, qty)
 
-            cost = price * qty
-            if int(coins[str(uid)]["wallet"]) < cost:
+        async with MONEY_LOCKS.hold(*batch.keys()):
+            await load_shop_stock()  # make sure every item has a stock entry
+            try:
+                await apply_batch(batch)
+            except TransferError as e:
+                if e.owner == SHOP:
+                    return await ctx.send(embed=discord.Embed(
+                        description=f"📦 Not enough stock for **{item}**. Available: **{e.have}**",
+                        color=discord.Color.orange()
+                    ))
                 return await ctx.send(embed=discord.Embed(
                     description=f"💸 You need **{_format_coins(cost)}** coins in your wallet to buy that.",
                     color=discord.Color.orange()
                 ))
 
-            coins[str(uid)]["wallet"] -= cost
-            shop[item] -= qty
-            inv.setdefault(str(uid), {})
-            inv[str(uid)][item] = int(inv[str(uid)].get(item, 0)) + qty
-
-            save_coins(coins)
-            save_shop_stock(shop)
-            save_inventory(inv)
-
         await ctx.send(embed=discord.Embed(
             description=f"✅ Bought **{qty}× {item}** for **{_format_coins(cost)}** coins.",
             color=discord.Color.green()
@@ -733,9 +764,7 @@ class Economy(commands.Cog):
     @commands.command(name="inventory", aliases=["inv"], help="View your or someone else's inventory.")
     async def inventory(self, ctx, member: discord.Member = None):
         member = member or ctx.author
-        ensure_user_inventory(member.id)
-        inv = load_inventory()
-        user_inv = inv.get(str(member.id), {}) or {}
+        user_inv = await aload_record(INVENTORY_FILE, member.id, None) or {}
 
         if not user_inv:
             return await ctx.send(embed=discord.Embed(
@@ -773,9 +802,7 @@ class Economy(commands.Cog):
         give_item = _match_item(give) or give.strip()
         want_item = _match_item(want) or want.strip()
 
-        ensure_user_inventory(ctx.author.id)
-        inv = load_inventory()
-        mine = inv.get(str(ctx.author.id), {}) or {}
+        mine = await aload_record(INVENTORY_FILE, ctx.author.id, None) or {}
 
         if int(mine.get(give_item, 0)) <= 0:
             return await ctx.send(f"❌ You don’t have **{give_item}** to offer.")
@@ -797,6 +824,7 @@ class Economy(commands.Cog):
         )
 
     @commands.command(name="accepttrade", help="Accept the latest trade proposed to you.")
+    @retry_on_conflict()
     async def accepttrade(self, ctx):
         p = TRADE_PROPOSALS.get(str(ctx.author.id))
         if not p:
@@ -810,42 +838,20 @@ class Economy(commands.Cog):
         give_item = str(p["give"])
         want_item = str(p["want"])
 
-        # lock both inventories to avoid duplication
-        first, second = sorted([proposer_id, target_id])
-        async with MONEY_LOCKS[first], MONEY_LOCKS[second]:
-            ensure_user_inventory(proposer_id)
-            ensure_user_inventory(target_id)
-            inv = load_inventory()
-
-            proposer_inv = inv.get(str(proposer_id), {}) or {}
-            target_inv = inv.get(str(target_id), {}) or {}
-
-            # proposer must still have "give"
-            if int(proposer_inv.get(give_item, 0)) <= 0:
-                TRADE_PROPOSALS.pop(str(ctx.author.id), None)
-                save_inventory(inv)
-                return await ctx.send("❌ Trade failed: proposer no longer has the offered item.")
+        # swap one of each; both inventories are written together or not at all
+        batch = Batch()
+        batch.give(proposer_id, give_item, -1).give(target_id, give_item, 1)
+        batch.give(target_id, want_item, -1).give(proposer_id, want_item, 1)
 
-            # target must have "want" item to swap
-            if int(target_inv.get(want_item, 0)) <= 0:
+        async with MONEY_LOCKS.hold(*batch.keys()):
+            try:
+                await apply_batch(batch)
+            except TransferError as e:
+                if e.owner == str(proposer_id) and e.what == give_item:
+                    TRADE_PROPOSALS.pop(str(ctx.author.id), None)
+                    return await ctx.send("❌ Trade failed: proposer no longer has the offered item.")
                 return await ctx.send(f"❌ You can’t accept: you don’t have **{want_item}**.")
 
-            # perform swap (1 item each)
-            proposer_inv[give_item] = int(proposer_inv.get(give_item, 0)) - 1
-            if proposer_inv[give_item] <= 0:
-                proposer_inv.pop(give_item, None)
-
-            target_inv[want_item] = int(target_inv.get(want_item, 0)) - 1
-            if target_inv[want_item] <= 0:
-                target_inv.pop(want_item, None)
-
-            proposer_inv[want_item] = int(proposer_inv.get(want_item, 0)) + 1
-            target_inv[give_item] = int(target_inv.get(give_item, 0)) + 1
-
-            inv[str(proposer_id)] = proposer_inv
-            inv[str(target_id)] = target_inv
-            save_inventory(inv)
-
         TRADE_PROPOSALS.pop(str(ctx.author.id), None)
 
         proposer_user = await self.bot.fetch_user(proposer_id)
@@ -858,23 +864,18 @@ class Economy(commands.Cog):
     @commands.command(name="portfolio", aliases=["pf"], help="Show your stock holdings.")
     async def portfolio(self, ctx, member: discord.Member = None):
         member = member or ctx.author
-        ensure_user_coins(member.id)
-        coins = load_coins()
-        u = coins[str(member.id)]
-        pf = u.get("portfolio", {}) or {}
+        acct = await get_account(member.id)
+        hm = await holdings_matrix()
+        owned = acct.owned()
+        values = hm.stock_values(owned)
 
-        stocks_data = load_json("stocks.json", {})
         lines = []
-        total_value = 0
-
-        for s in STOCKS:
-            shares = int(pf.get(s, 0))
+        for s, shares, price, value in zip(STOCKS, owned, hm.prices, values):
             if shares <= 0:
                 continue
-            price = int((stocks_data.get(s, {}) or {}).get("price", 0))
-            value = shares * price
-            total_value += value
-            lines.append(f"• **{s}** — {shares} shares @ {_format_coins(price)} = **{_format_coins(value)}**")
+            held = acct.escrowed(s)
+            note = f" ({held} in open orders)" if held else ""
+            lines.append(f"• **{s}** — {shares} shares{note} @ {_format_coins(int(price))} = **{_format_coins(int(value))}**")
 
         if not lines:
             return await ctx.send(embed=discord.Embed(description=f"📉 {member.display_name} has no stocks yet.", color=discord.Color.dark_grey()))
@@ -884,10 +885,11 @@ class Economy(commands.Cog):
             description="\n".join(lines)[:4000],
             color=discord.Color.green(),
         )
-        embed.set_footer(text=f"Total stock value: {_format_coins(total_value)} coins")
+        embed.set_footer(text=f"Total stock value: {_format_coins(int(values.sum()))} coins")
         await ctx.send(embed=embed)
 
     @commands.command(name="buystock", help="Buy stock. Usage: !buystock <stock> <shares>")
+    @retry_on_conflict()
     async def buystock(self, ctx, stock: str, shares: int):
         s = _match_stock(stock)
         if not s:
@@ -896,31 +898,23 @@ class Economy(commands.Cog):
             return await ctx.send("❌ Shares must be > 0.")
 
         uid = ctx.author.id
-        async with MONEY_LOCKS[uid]:
-            ensure_user_coins(uid)
-            coins = load_coins()
-            u = coins[str(uid)]
+        async with MONEY_LOCKS.hold(uid), AccountSession() as session:
+            acct = await session.get(uid)
 
-            stocks_data = load_json("stocks.json", {})
-            price = int((stocks_data.get(s, {}) or {}).get("price", 0))
+            market = await load_market()
+            price = market.price(s)
             if price <= 0:
                 return await ctx.send("❌ Stock price unavailable right now.")
 
             cost = price * shares
-            if int(u.get("wallet", 0)) < cost:
+            if int(acct.wallet) < cost:
                 return await ctx.send(f"💸 You need **{_format_coins(cost)}** coins in wallet.")
 
-            u["wallet"] -= cost
-            u.setdefault("portfolio", {})
-            u["portfolio"][s] = int(u["portfolio"].get(s, 0)) + shares
-            save_coins(coins)
+            batch = Batch().move(uid, None, cost, "buystock", stock=s, shares=shares, price=price).shares(uid, s, shares)
+            await apply_batch(batch, session)
 
-        # optionally influence price updates (your old behaviour)
-        try:
-            from bot.cogs.stocks import STOCK_PURCHASE_COUNT
-            STOCK_PURCHASE_COUNT[s] = int(STOCK_PURCHASE_COUNT.get(s, 0)) + shares
-        except Exception:
-            pass
+        # buying pressure moves the price on the next tick
+        market.record_buy(s, shares)
 
         await ctx.send(embed=discord.Embed(
             description=f"✅ Bought **{shares}** shares of **{s}** for **{_format_coins(cost)}** coins.",
@@ -928,6 +922,7 @@ class Economy(commands.Cog):
         ))
 
     @commands.command(name="sellstock", help="Sell stock. Usage: !sellstock <stock> <shares>")
+    @retry_on_conflict()
     async def sellstock(self, ctx, stock: str, shares: int):
         s = _match_stock(stock)
         if not s:
@@ -936,54 +931,55 @@ class Economy(commands.Cog):
             return await ctx.send("❌ Shares must be > 0.")
 
         uid = ctx.author.id
-        async with MONEY_LOCKS[uid]:
-            ensure_user_coins(uid)
-            coins = load_coins()
-            u = coins[str(uid)]
-            pf = u.get("portfolio", {}) or {}
+        async with MONEY_LOCKS.hold(uid), AccountSession() as session:
+            acct = await session.get(uid)
 
-            owned = int(pf.get(s, 0))
+            owned = acct.shares(s)
             if owned < shares:
                 return await ctx.send(f"❌ You only own **{owned}** shares of **{s}**.")
 
-            stocks_data = load_json("stocks.json", {})
-            price = int((stocks_data.get(s, {}) or {}).get("price", 0))
+            price = (await load_market()).price(s)
             if price <= 0:
                 return await ctx.send("❌ Stock price unavailable right now.")
 
             proceeds = price * shares
-            pf[s] = owned - shares
-            if pf[s] <= 0:
-                pf.pop(s, None)
-            u["portfolio"] = pf
-            u["wallet"] = int(u.get("wallet", 0)) + proceeds
-            coins[str(uid)] = u
-            save_coins(coins)
+            batch = Batch().move(None, uid, proceeds, "sellstock", stock=s, shares=shares, price=price).shares(uid, s, -shares)
+            await apply_batch(batch, session)
 
         await ctx.send(embed=discord.Embed(
             description=f"✅ Sold **{shares}** shares of **{s}** for **{_format_coins(proceeds)}** coins.",
             color=discord.Color.green()
         ))
 
+    # ---------- Interest / dividend catch-up ----------
+    @tasks.loop(seconds=INTEREST_INTERVAL)
+    async def materialize_loop(self):
+        # interest/dividends are lazy; bring every account (and the leaderboards) up to date once per
+        # interval, skipping the first run if startup has only just done it
+        await self.bot.wait_until_ready()
+        changed = await materialize_accounts(max_age=INTEREST_INTERVAL / 2)
+        if changed:
+            print(f"[Accounts] Brought {changed} account(s) up to date.")
+
     # ---------- Shop restock loop ----------
     @tasks.loop(minutes=SHOP_RESTOCK_CHECK_MINUTES)
     async def shop_restock_loop(self):
         await self.bot.wait_until_ready()
-        stock = load_shop_stock()
-        changed = False
+        batch = Batch()
         restocked = []
-
         for item in SHOP_ITEMS:
             if random.random() < SHOP_RESTOCK_CHANCE:
                 add = random.randint(1, SHOP_RESTOCK_MAX_ADD)
-                stock[item] = int(stock.get(item, 0)) + add
-                changed = True
+                batch.give(SHOP, item, add)
                 restocked.append((item, add))
 
-        if not changed:
+        if not batch:
             return
 
-        save_shop_stock(stock)
+        async with MONEY_LOCKS.hold(SHOP_LOCK_KEY):
+            await load_shop_stock()
+            await apply_batch(batch)
+            stock = await load_shop_stock(readonly=True)
 
         # announce restock (optional)
         channel = self.bot.get_channel(MARKET_ANNOUNCE_CHANNEL_ID)
@@ -4,22 +4,22 @@ from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
 from bot.config import BIC_TIMEZONE, BIC_POST_CHANNEL_ID
-from bot.utils.storage import load_json, save_json, abs_path
+from bot.utils.storage import aload_json, asave_json, abs_path
 
 BIC_RAMADAN_JSON = "bic_ramadan_2026.json"
 RAMADAN_STATE_FILE = "ramadan_state.json"
 
-def load_ramadan_config():
-    data = load_json(BIC_RAMADAN_JSON, {})
+async def load_ramadan_config():
+    data = await aload_json(BIC_RAMADAN_JSON, {})
     if not data or "days" not in data:
         raise RuntimeError(f"Missing or invalid {abs_path(BIC_RAMADAN_JSON)}")
     return data
 
-def load_ramadan_state():
-    return load_json(RAMADAN_STATE_FILE, {"sent": {}, "last_daily_post": ""})
+async def load_ramadan_state():
+    return await aload_json(RAMADAN_STATE_FILE, {"sent": {}, "last_daily_post": ""})
 
-def save_ramadan_state(state):
-    save_json(RAMADAN_STATE_FILE, state)
+async def save_ramadan_state(state):
+    await asave_json(RAMADAN_STATE_FILE, state)
 
 def _parse_hhmm(date_str: str, hhmm: str, tz: ZoneInfo) -> datetime:
     hour, minute = hhmm.split(":")
@@ -74,10 +74,10 @@ class Ramadan(commands.Cog):
     async def ramadan_bic_scheduler(self):
         await self.bot.wait_until_ready()
 
-        cfg = load_ramadan_config()
+        cfg = await load_ramadan_config()
         tz = ZoneInfo(cfg.get("timezone", BIC_TIMEZONE))
         channel_id = int(cfg.get("post_channel_id", BIC_POST_CHANNEL_ID))
-        state = load_ramadan_state()
+        state = await load_ramadan_state()
 
         now_local = datetime.now(tz)
         today_key = now_local.date().isoformat()
@@ -88,7 +88,7 @@ class Ramadan(commands.Cog):
                 desc = format_day_text(cfg, entry, today_key)
                 await _post_embed_to_channel(self.bot, channel_id, "🗓️ Today’s Ramadan Times", desc, discord.Color.gold())
                 state["last_daily_post"] = today_key
-                save_ramadan_state(state)
+                await save_ramadan_state(state)
 
         if not entry:
             return
@@ -119,11 +119,11 @@ class Ramadan(commands.Cog):
                 msg = template.format(time=hhmm)
                 await _post_embed_to_channel(self.bot, channel_id, title, f"@everyone\n\n{msg}", discord.Color.orange())
                 state["sent"][sent_key] = True
-                save_ramadan_state(state)
+                await save_ramadan_state(state)
 
     @commands.command(name="table", help="Show Ramadan times for today.")
     async def table(self, ctx: commands.Context):
-        cfg = load_ramadan_config()
+        cfg = await load_ramadan_config()
         tz = ZoneInfo(cfg.get("timezone", BIC_TIMEZONE))
         today_key = datetime.now(tz).date().isoformat()
         entry = cfg["days"].get(today_key)
@@ -1,13 +1,13 @@
 import random
 import discord
 from discord.ext import commands
-from bot.utils.storage import load_json, save_json
+from bot.utils.storage import aload_json, asave_json
 
 MARRIAGE_FILE = "marriages.json"
 MARRIAGE_PROPOSALS: dict[str, str] = {}
 
-def load_marriages(): return load_json(MARRIAGE_FILE, {})
-def save_marriages(d): save_json(MARRIAGE_FILE, d)
+async def load_marriages(readonly: bool = False): return await aload_json(MARRIAGE_FILE, {}, readonly=readonly)
+async def save_marriages(d): await asave_json(MARRIAGE_FILE, d)
 
 class Social(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -20,7 +20,7 @@ class Social(commands.Cog):
         if member.bot:
             return await ctx.send("🤖 You can't marry a bot.")
 
-        marriages = load_marriages()
+        marriages = await load_marriages(readonly=True)
         author_id = str(ctx.author.id)
         target_id = str(member.id)
 
@@ -43,14 +43,14 @@ class Social(commands.Cog):
         if not proposer_id:
             return await ctx.send("❌ You don't have any pending proposals.")
 
-        marriages = load_marriages()
+        marriages = await load_marriages()
         if marriages.get(proposer_id) or marriages.get(user_id):
             MARRIAGE_PROPOSALS.pop(user_id, None)
             return await ctx.send("💔 One of you is already married.")
 
         marriages[proposer_id] = user_id
         marriages[user_id] = proposer_id
-        save_marriages(marriages)
+        await save_marriages(marriages)
 
         proposer = await self.bot.fetch_user(int(proposer_id))
         await ctx.send(f"💞 {ctx.author.mention} and {proposer.mention} are now married! 🎉")
@@ -59,14 +59,14 @@ class Social(commands.Cog):
     @commands.command(name="divorce", help="Divorce your current partner 😢")
     async def divorce(self, ctx):
         user_id = str(ctx.author.id)
-        marriages = load_marriages()
+        marriages = await load_marriages()
         partner_id = marriages.get(user_id)
         if not partner_id:
             return await ctx.send("❌ You are not married.")
 
         marriages.pop(user_id, None)
         marriages.pop(partner_id, None)
-        save_marriages(marriages)
+        await save_marriages(marriages)
 
         partner = await self.bot.fetch_user(int(partner_id))
         await ctx.send(f"💔 {ctx.author.mention} and {partner.mention} are now divorced.")
@@ -74,7 +74,7 @@ class Social(commands.Cog):
     @commands.command(name="partner", help="View your or someone else's partner 💘")
     async def partner(self, ctx, member: discord.Member = None):
         member = member or ctx.author
-        marriages = load_marriages()
+        marriages = await load_marriages(readonly=True)
         partner_id = marriages.get(str(member.id))
         if not partner_id:
             return await ctx.send(f"{member.display_name} is not married.")
@@ -1,31 +1,36 @@
-import random
+import io
+import traceback
+from datetime import datetime, timezone
 import discord
 from discord.ext import commands, tasks
 
-from bot.config import STOCKS, MARKET_ANNOUNCE_CHANNEL_ID, DIVIDEND_RATE, DIVIDEND_INTERVAL
-from bot.utils.storage import load_json, save_json
+from bot.config import STOCKS, STOCK_BASE_PRICES, MARKET_ANNOUNCE_CHANNEL_ID, DIVIDEND_RATE, DIVIDEND_INTERVAL
+from bot.utils.storage import aload_json, asave_json, edit_lock
+from bot.utils.events import EVENT_REGISTRY
+from bot.utils.holdings import HOLDINGS
+from bot.utils.market import CRASH, BOOM, MEGA_CRASH, MEGA_BOOM, load_market
+from bot.utils.pricehistory import PRICE_HISTORY, RANGES
+from bot.utils.charts import CHART_CACHE
+from bot.utils.orderbook import BUY, SELL, MAX_OPEN_ORDERS, SelfTrade, order_books, place_order, cancel_order
+from bot.utils.accounts import retry_on_conflict, holdings_matrix
+from bot.utils.transfers import TransferError
+from bot.utils.triggers import STOP_LOSS, TAKE_PROFIT, MAX_TRIGGERS, triggers
 
 STOCK_FILE = "stocks.json"
-COIN_DATA_FILE = "coins.json"
+STOCK_TICK_MINUTES = 5
 
-STOCK_PURCHASE_COUNT = {s: 0 for s in STOCKS}
+async def save_stocks(d): await asave_json(STOCK_FILE, d)
 
-def load_coins(): return load_json(COIN_DATA_FILE, {})
-def save_coins(d): save_json(COIN_DATA_FILE, d)
-
-def save_stocks(d): save_json(STOCK_FILE, d)
-
-def load_stocks():
-    data = load_json(STOCK_FILE, None)
-    template = {
-        "Oreobux": {"price": 100, "history": [100]},
-        "QMkoin": {"price": 150, "history": [150]},
-        "Seelsterling": {"price": 200, "history": [200]},
-        "Fwizfinance": {"price": 250, "history": [250]},
-        "BingBux": {"price": 120, "history": [120]},
-    }
+async def load_stocks(readonly: bool = False):
+    """stocks.json with every ticker present; may rewrite it, so hold edit_lock(STOCK_FILE)."""
+    if readonly:
+        data = await aload_json(STOCK_FILE, None, readonly=True)
+        if data is not None and all("price" in (data.get(k) or {}) and "history" in (data.get(k) or {}) for k in STOCKS):
+            return data
+    data = await aload_json(STOCK_FILE, None)
+    template = {s: {"price": p, "history": [p]} for s, p in STOCK_BASE_PRICES.items()}
     if data is None:
-        save_stocks(template)
+        await save_stocks(template)
         return template
 
     changed = False
@@ -43,82 +48,246 @@ def load_stocks():
             changed = True
         else:
             fixed[key] = entry
+    if "dividends" in data:
+        fixed["dividends"] = data["dividends"]
 
     if changed:
-        save_stocks(fixed)
+        await save_stocks(fixed)
     return fixed
 
+def _match_ticker(name: str) -> str | None:
+    n = name.strip().lower()
+    return next((s for s in STOCKS if s.lower() == n), None)
+
 class Stocks(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.update_stock_prices.start()
         self.pay_dividends.start()
+        EVENT_REGISTRY.subscribe(self.on_event_change)
 
     def cog_unload(self):
+        CHART_CACHE.shutdown()
         self.update_stock_prices.cancel()
         self.pay_dividends.cancel()
+        EVENT_REGISTRY.unsubscribe(self.on_event_change)
+
+    async def on_event_change(self, name: str, mods: dict, active: bool):
+        if "crash_odds" not in mods and "boom_odds" not in mods:
+            return
+        channel = self.bot.get_channel(MARKET_ANNOUNCE_CHANNEL_ID)
+        if not channel:
+            return
+        if active:
+            odds = ", ".join(f"{k.split('_')[0]} odds {v:.0%}" for k, v in mods.items() if k.endswith("_odds"))
+            await channel.send(embed=discord.Embed(title=f"📣 {name} has begun!", description=f"Market {odds} per tick.", color=discord.Color.orange()))
+        else:
+            await channel.send(embed=discord.Embed(description=f"📣 **{name}** is over — the market is back to normal.", color=discord.Color.orange()))
 
     @commands.command(name="stocks", help="View current stock prices.")
     async def stocks_cmd(self, ctx):
-        stock_data = load_stocks()
+        market = await load_market()
         embed = discord.Embed(title="📈 Current Stock Prices", color=discord.Color.green())
-        for name in STOCKS:
-            price = int(stock_data[name]["price"])
-            embed.add_field(name=name, value=f"💰 {price} coins", inline=True)
+        if len(STOCKS) <= 25:
+            for name, price in zip(STOCKS, market.prices):
+                embed.add_field(name=name, value=f"💰 {int(price)} coins", inline=True)
+        else:
+            # more tickers than an embed has fields
+            embed.description = "\n".join(f"**{name}** — 💰 {int(price)}" for name, price in zip(STOCKS, market.prices))[:4000]
+        await ctx.send(embed=embed)
+
+    @commands.command(name="stockchart", aliases=["chart"], help="Price chart for a stock. Usage: !stockchart <stock> [1d|1w|1m|3m|1y|all]")
+    async def stockchart(self, ctx, stock: str, window: str = "1d"):
+        name = _match_ticker(stock)
+        if not name:
+            return await ctx.send("❌ Unknown stock. Use `!stocks` to see names.")
+        window = window.lower()
+        if window not in RANGES:
+            return await ctx.send(f"❌ Range must be one of: {', '.join(RANGES)}")
+
+        async with ctx.typing():
+            png = await CHART_CACHE.get(name, window)
+        if png is None:
+            return await ctx.send(f"📭 No price history for **{name}** yet.")
+        await ctx.send(file=discord.File(io.BytesIO(png), filename=f"{name}_{window}.png"))
+
+    @commands.command(name="stockstats", help="Price stats for a stock. Usage: !stockstats <stock> [1d|1w|1m|3m|1y|all]")
+    async def stockstats(self, ctx, stock: str, window: str = "1w"):
+        name = _match_ticker(stock)
+        if not name:
+            return await ctx.send("❌ Unknown stock. Use `!stocks` to see names.")
+        window = window.lower()
+        if window not in RANGES:
+            return await ctx.send(f"❌ Range must be one of: {', '.join(RANGES)}")
+
+        st = await PRICE_HISTORY.astats(name, window)
+        if not st:
+            return await ctx.send(f"📭 No price history for **{name}** yet.")
+        arrow = "📈" if st["change_pct"] >= 0 else "📉"
+        embed = discord.Embed(title=f"{arrow} {name} — {window}", color=discord.Color.green() if st["change_pct"] >= 0 else discord.Color.red())
+        embed.add_field(name="Open", value=f"{st['open']:,}", inline=True)
+        embed.add_field(name="Close", value=f"{st['close']:,}", inline=True)
+        embed.add_field(name="Change", value=f"{st['change_pct']:+.1f}%", inline=True)
+        embed.add_field(name="High", value=f"{st['high']:,}", inline=True)
+        embed.add_field(name="Low", value=f"{st['low']:,}", inline=True)
+        embed.set_footer(text=f"{st['points']} points since")
+        embed.timestamp = datetime.fromtimestamp(st["since"], timezone.utc)
+        await ctx.send(embed=embed)
+
+    # ---------- Player order book ----------
+    @commands.command(name="order", help="Place a limit order. Usage: !order <buy|sell> <stock> <shares> <price>")
+    @retry_on_conflict()
+    async def order(self, ctx, side: str, stock: str, shares: int, price: int):
+        side = side.lower()
+        if side not in (BUY, SELL):
+            return await ctx.send("❌ Side must be `buy` or `sell`.")
+        name = _match_ticker(stock)
+        if not name:
+            return await ctx.send("❌ Unknown stock. Use `!stocks` to see names.")
+        if shares <= 0 or price <= 0:
+            return await ctx.send("❌ Shares and price must be > 0.")
+
+        books = await order_books()
+        if len(books.user_orders(ctx.author.id)) >= MAX_OPEN_ORDERS:
+            return await ctx.send(f"❌ You already have {MAX_OPEN_ORDERS} open orders. Cancel some with `!cancelorder <id>`.")
+
+        try:
+            order, fills = await place_order(ctx.author.id, side, name, shares, price)
+        except SelfTrade as e:
+            return await ctx.send(f"❌ That would trade with your own order `#{e.order.id}` — cancel it first.")
+        except TransferError as e:
+            if side == BUY:
+                return await ctx.send(f"💸 You need **{e.need:,}** coins in wallet (you have {e.have:,}).")
+            return await ctx.send(f"❌ You only own **{e.have}** shares of **{name}**.")
+
+        lines = [f"🤝 {n} @ {p.price:,}" for p, n in fills]
+        if order.filled:
+            lines.insert(0, f"✅ Filled **{order.filled}**/{shares} shares of **{name}**.")
+        if order.live:
+            lines.append(f"📋 Order `#{order.id}`: {side} **{order.qty}** @ **{price:,}** is on the book.")
+        await ctx.send(embed=discord.Embed(description="\n".join(lines), color=discord.Color.green()))
+
+    @commands.command(name="orders", help="List your open orders.")
+    async def orders(self, ctx):
+        mine = (await order_books()).user_orders(ctx.author.id)
+        if not mine:
+            return await ctx.send("📭 You have no open orders.")
+        desc = "\n".join(
+            f"`#{o.id}` {'🟢 buy' if o.side == BUY else '🔴 sell'} **{o.qty}** {o.ticker} @ **{o.price:,}**"
+            + (f" ({o.filled} filled)" if o.filled else "")
+            for o in mine
+        )
+        await ctx.send(embed=discord.Embed(title="📋 Your open orders", description=desc[:4000], color=discord.Color.blue()))
+
+    @commands.command(name="cancelorder", help="Cancel an open order. Usage: !cancelorder <id>")
+    @retry_on_conflict()
+    async def cancelorder(self, ctx, order_id: int):
+        order = await cancel_order(ctx.author.id, order_id)
+        if order is None:
+            return await ctx.send("❌ You have no open order with that id.")
+        back = f"**{order.price * order.qty:,}** coins" if order.side == BUY else f"**{order.qty}** shares of **{order.ticker}**"
+        await ctx.send(f"🗑️ Cancelled order `#{order.id}`; {back} returned.")
+
+    @commands.command(name="orderbook", aliases=["book"], help="Best bids and asks for a stock. Usage: !orderbook <stock>")
+    async def orderbook(self, ctx, stock: str):
+        name = _match_ticker(stock)
+        if not name:
+            return await ctx.send("❌ Unknown stock. Use `!stocks` to see names.")
+        book = (await order_books()).books[name]
+        market = await load_market()
+
+        def levels(side):
+            rows = book.depth(side)
+            return "\n".join(f"**{p:,}** × {q} ({n})" for p, q, n in rows) or "—"
+
+        embed = discord.Embed(title=f"📒 {name} order book", color=discord.Color.blue())
+        embed.add_field(name="🟢 Bids", value=levels(BUY), inline=True)
+        embed.add_field(name="🔴 Asks", value=levels(SELL), inline=True)
+        embed.set_footer(text=f"Market price: {market.price(name):,} coins")
         await ctx.send(embed=embed)
 
-    @tasks.loop(minutes=5)
+    # ---------- Stop-loss / take-profit ----------
+    async def _add_trigger(self, ctx, kind: str, stock: str, shares: int, price: int):
+        name = _match_ticker(stock)
+        if not name:
+            return await ctx.send("❌ Unknown stock. Use `!stocks` to see names.")
+        if shares <= 0 or price <= 0:
+            return await ctx.send("❌ Shares and price must be > 0.")
+        now = (await load_market()).price(name)
+        if kind == STOP_LOSS and price >= now:
+            return await ctx.send(f"❌ A stop-loss must be below the current price ({now:,}).")
+        if kind == TAKE_PROFIT and price <= now:
+            return await ctx.send(f"❌ A take-profit must be above the current price ({now:,}).")
+
+        index = await triggers()
+        if len(index.user_triggers(ctx.author.id)) >= MAX_TRIGGERS:
+            return await ctx.send(f"❌ You already have {MAX_TRIGGERS} stop orders. Cancel some with `!canceltrigger <id>`.")
+        t = await index.add(ctx.author.id, name, kind, price, shares)
+        when = "falls to" if kind == STOP_LOSS else "rises to"
+        await ctx.send(f"🎯 Order `#{t.id}`: sell **{shares}** {name} at market once it {when} **{price:,}**.")
+
+    @commands.command(name="stoploss", help="Sell at market if a stock falls to a price. Usage: !stoploss <stock> <shares> <price>")
+    async def stoploss(self, ctx, stock: str, shares: int, price: int):
+        await self._add_trigger(ctx, STOP_LOSS, stock, shares, price)
+
+    @commands.command(name="takeprofit", help="Sell at market if a stock rises to a price. Usage: !takeprofit <stock> <shares> <price>")
+    async def takeprofit(self, ctx, stock: str, shares: int, price: int):
+        await self._add_trigger(ctx, TAKE_PROFIT, stock, shares, price)
+
+    @commands.command(name="triggers", help="List your stop-loss and take-profit orders.")
+    async def triggers_cmd(self, ctx):
+        mine = (await triggers()).user_triggers(ctx.author.id)
+        if not mine:
+            return await ctx.send("📭 You have no stop-loss or take-profit orders.")
+        desc = "\n".join(
+            f"`#{t.id}` {'🛑 stop' if t.kind == STOP_LOSS else '💰 take'} **{t.qty}** {t.ticker} "
+            f"{'≤' if t.kind == STOP_LOSS else '≥'} **{t.price:,}**"
+            for t in mine
+        )
+        await ctx.send(embed=discord.Embed(title="🎯 Your stop orders", description=desc[:4000], color=discord.Color.blue()))
+
+    @commands.command(name="canceltrigger", help="Cancel a stop-loss or take-profit order. Usage: !canceltrigger <id>")
+    async def canceltrigger(self, ctx, trigger_id: int):
+        t = await (await triggers()).cancel(ctx.author.id, trigger_id)
+        if t is None:
+            return await ctx.send("❌ You have no stop order with that id.")
+        await ctx.send(f"🗑️ Cancelled order `#{t.id}`.")
+
+    @tasks.loop(minutes=STOCK_TICK_MINUTES)
     async def update_stock_prices(self):
         await self.bot.wait_until_ready()
-        global STOCK_PURCHASE_COUNT
-
-        stocks = load_stocks()
-        total_purchases = sum(STOCK_PURCHASE_COUNT.values())
-        growth_bias = random.uniform(0.01, 0.02)
-
-        crash_triggered = random.randint(1, 15) == 1
-        boom_triggered  = random.randint(1, 15) == 1
-        mega_crash_triggered = random.randint(1, 100) == 1
-        mega_boom_triggered  = random.randint(1, 100) == 1
-
-        crash_multiplier       = random.uniform(0.4, 0.8)
-        boom_multiplier        = random.uniform(2.3, 2.8)
-        mega_crash_multiplier  = random.uniform(0.1, 0.3)
-        mega_boom_multiplier   = random.uniform(6.0, 7.0)
-
-        crashed, boomed, mega_crashed, mega_boomed = [], [], [], []
-
-        for s in STOCKS:
-            current_price = int(stocks[s]["price"])
-            purchase_count = STOCK_PURCHASE_COUNT.get(s, 0)
-
-            if mega_crash_triggered and current_price > 10000:
-                new_price = max(1, int(current_price * mega_crash_multiplier))
-                mega_crashed.append((s, current_price, new_price))
-            elif crash_triggered and current_price > 5000:
-                new_price = max(1, int(current_price * crash_multiplier))
-                crashed.append((s, current_price, new_price))
-            elif mega_boom_triggered and current_price < 2000:
-                new_price = int(current_price * mega_boom_multiplier)
-                mega_boomed.append((s, current_price, new_price))
-            elif boom_triggered and current_price < 3000:
-                new_price = int(current_price * boom_multiplier)
-                boomed.append((s, current_price, new_price))
-            else:
-                if total_purchases > 0:
-                    purchase_ratio = purchase_count / total_purchases
-                    change = 0.5 * (purchase_ratio - 0.25) + growth_bias
-                else:
-                    change = random.uniform(-0.05, 0.05) + growth_bias
-                new_price = max(1, int(current_price * (1 + change)))
-
-            stocks[s]["price"] = new_price
-            stocks[s]["history"].append(new_price)
-            if len(stocks[s]["history"]) > 24:
-                stocks[s]["history"] = stocks[s]["history"][-24:]
-
-        save_stocks(stocks)
-        STOCK_PURCHASE_COUNT = {s: 0 for s in STOCKS}
+        async with edit_lock(STOCK_FILE):
+            stocks = await load_stocks()
+            market = await load_market()
+
+            # 1 in 15 per tick unless an event (Crash Week / Boom Frenzy) raises it
+            old = market.tick(
+                crash_odds=EVENT_REGISTRY.modifier("crash_odds", 1 / 15),
+                boom_odds=EVENT_REGISTRY.modifier("boom_odds", 1 / 15),
+            )
+
+            prices = market.prices.tolist()
+            for s, price in zip(STOCKS, prices):
+                stocks[s]["price"] = price
+
+            await save_stocks(stocks)
+        HOLDINGS.set_prices(stocks)
+        # long-horizon history lives in the columnar store, not in stocks.json
+        await PRICE_HISTORY.aappend_tick(zip(STOCKS, prices))
+        CHART_CACHE.invalidate()
+
+        # stop-losses matter most on exactly the ticks that crash
+        try:
+            fired = await (await triggers()).execute(dict(zip(STOCKS, prices)))
+        except Exception as e:
+            fired = []
+            print(f"[Stocks] stop orders failed, they stay open for the next tick: {type(e).__name__}: {e}")
+            traceback.print_exc()
+
+        mega_crashed = market.changed(old, MEGA_CRASH)
+        crashed = market.changed(old, CRASH)
+        mega_boomed = market.changed(old, MEGA_BOOM)
+        boomed = market.changed(old, BOOM)
 
         channel = self.bot.get_channel(MARKET_ANNOUNCE_CHANNEL_ID)
         if not channel:
@@ -136,26 +305,38 @@ class Stocks(commands.Cog):
         if boomed:
             desc = "\n".join(f"📈 **{s}** rose from **{old}** → **{new}** coins" for s, old, new in boomed)
             await channel.send(embed=discord.Embed(title="📈 Market Boom!", description=f"Undervalued stocks surged upward:\n\n{desc}", color=discord.Color.green()))
+        sold = [(t, n, p) for t, n, p in fired if n]
+        if sold:
+            desc = "\n".join(
+                f"{'🛑' if t.kind == STOP_LOSS else '💰'} <@{t.uid}> sold **{n}** {t.ticker} @ **{p:,}**"
+                for t, n, p in sold[:20]
+            )
+            more = f"\n…and {len(sold) - 20} more" if len(sold) > 20 else ""
+            await channel.send(embed=discord.Embed(title="🎯 Stop orders triggered", description=desc + more, color=discord.Color.blue()))
+
+    @update_stock_prices.before_loop
+    async def _before_update_stock_prices(self):
+        await self.bot.wait_until_ready()
+        # one-time import of the short `history` lists stocks.json used to keep
+        async with edit_lock(STOCK_FILE):
+            stocks = await load_stocks(readonly=True)
+        await PRICE_HISTORY.aseed(stocks, STOCK_TICK_MINUTES * 60)
 
     @tasks.loop(seconds=DIVIDEND_INTERVAL)
     async def pay_dividends(self):
         await self.bot.wait_until_ready()
-        coins = load_coins()
-        stocks = load_stocks()
-        any_payout = False
-
-        for user_id, data in coins.items():
-            pf = (data.get("portfolio") or {})
-            total_value = 0
-            for s in STOCKS:
-                total_value += int(pf.get(s, 0)) * int(stocks[s]["price"])
-            payout = int(total_value * DIVIDEND_RATE)
-            if payout > 0:
-                data["wallet"] = int(data.get("wallet", 0)) + payout
-                any_payout = True
+        # Only record today's prices; each holder is credited DIVIDEND_RATE of
+        # their holding's value at these prices when their account is next loaded.
+        async with edit_lock(STOCK_FILE):
+            stocks = await load_stocks()
+            log = stocks.setdefault("dividends", {"base": 0, "prices": []})
+            log["prices"].append({s: int(stocks[s]["price"]) for s in STOCKS})
+            await save_stocks(stocks)
 
+        # announce only when someone's holding is worth a payout of at least a coin
+        holdings = await holdings_matrix()
+        any_payout = bool((holdings.values() * DIVIDEND_RATE >= 1).any())
         if any_payout:
-            save_coins(coins)
             ch = self.bot.get_channel(MARKET_ANNOUNCE_CHANNEL_ID)
             if ch:
                 await ch.send("💸 Dividends have been paid out to all shareholders!")
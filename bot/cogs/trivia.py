@@ -4,27 +4,38 @@ import discord
 import aiohttp
 from discord.ext import commands
 
-from bot.utils.storage import load_json, save_json
+from bot.utils.storage import aload_record
 from bot.cogs.core import update_xp
-from bot.cogs.economy import ensure_user_coins, load_coins, save_coins
+from bot.utils.accounts import AccountConflict, CONFLICT_REPLY
+from bot.utils.locks import MONEY_LOCKS
+from bot.utils.transfers import Batch, apply_batch_retrying
 
 TRIVIA_STATS_FILE = "trivia_stats.json"
 TRIVIA_STREAKS_FILE = "trivia_streaks.json"
 
-def load_trivia_stats(): return load_json(TRIVIA_STATS_FILE, {})
-def save_trivia_stats(d): save_json(TRIVIA_STATS_FILE, d)
-
-def load_trivia_streaks(): return load_json(TRIVIA_STREAKS_FILE, {})
-def save_trivia_streaks(d): save_json(TRIVIA_STREAKS_FILE, d)
-
-def add_trivia_result(uid: str, category: str, correct: bool):
-    stats = load_trivia_stats()
-    user = stats.setdefault(uid, {})
-    cat = user.setdefault(category, {"correct": 0, "attempts": 0})
-    cat["attempts"] += 1
-    if correct:
-        cat["correct"] += 1
-    save_trivia_stats(stats)
+async def record_trivia_answer(uid: str, category: str, correct: bool) -> tuple[int, int]:
+    """
+    Settle one answer under the user's money lock: their streak, their stats
+    for `category` and, if correct, the reward land in one commit.
+    Returns (reward, new streak).
+    """
+    async with MONEY_LOCKS.hold(uid):
+        streak = int(await aload_record(TRIVIA_STREAKS_FILE, uid, 0) or 0)
+        cat = await aload_record(TRIVIA_STATS_FILE, (uid, category), None) or {"correct": 0, "attempts": 0}
+        cat["attempts"] = int(cat.get("attempts", 0)) + 1
+        cat["correct"] = int(cat.get("correct", 0)) + int(correct)
+
+        batch = Batch()
+        reward = 0
+        if correct:
+            streak += 1
+            reward = 50 + 5 * min(streak - 1, 10)  # base + streak bonus
+            batch.move(None, uid, reward, "trivia", category=category)
+        else:
+            streak = 0
+        batch.writes.put(TRIVIA_STREAKS_FILE, uid, streak).put(TRIVIA_STATS_FILE, (uid, category), cat)
+        await apply_batch_retrying(batch)
+    return reward, streak
 
 class Trivia(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -78,39 +89,22 @@ class Trivia(commands.Cog):
 
         chosen = options[emojis.index(str(payload.emoji))]
         uid = str(ctx.author.id)
-        streaks = load_trivia_streaks()
-        streak = int(streaks.get(uid, 0))
+        try:
+            reward, streak = await record_trivia_answer(uid, category, chosen == correct)
+        except AccountConflict:
+            return await ctx.send(f"{'✅ Correct!' if chosen == correct else '❌ Wrong!'} {CONFLICT_REPLY}")
 
         if chosen == correct:
-            streak += 1
-            reward_base = 50
-            streak_bonus = 5 * min(streak - 1, 10)
-            reward = reward_base + streak_bonus
-
-            ensure_user_coins(ctx.author.id)
-            coins = load_coins()
-            coins[uid]["wallet"] += reward
-            save_coins(coins)
-
             await update_xp(self.bot, ctx.author.id, ctx.guild.id, 20)
-
-            add_trivia_result(uid, category, True)
-            streaks[uid] = streak
-            save_trivia_streaks(streaks)
-
             await ctx.send(f"✅ Correct! **+{reward}** coins (streak **{streak}**).")
         else:
-            add_trivia_result(uid, category, False)
-            streaks[uid] = 0
-            save_trivia_streaks(streaks)
             await ctx.send(f"❌ Wrong! The correct answer was **{correct}**. Streak reset.")
 
     @commands.command(name="triviastats", help="Show trivia stats. Usage: !triviastats [@user]")
     async def triviastats(self, ctx, member: discord.Member = None):
         member = member or ctx.author
         uid = str(member.id)
-        stats = load_trivia_stats()
-        u = stats.get(uid)
+        u = await aload_record(TRIVIA_STATS_FILE, uid, None)
 
         if not u:
             return await ctx.send(f"📊 No trivia stats for **{member.display_name}** yet.")
@@ -25,7 +25,15 @@ BANKROB_MIN_STEAL = 100
 BANKROB_MAX_STEAL_PCT_CAP = 0.40
 
 # ===== Stocks =====
-STOCKS = ["Oreobux", "QMkoin", "Seelsterling", "Fwizfinance", "BingBux"]
+# ticker -> starting price; add a line here to list a new stock
+STOCK_BASE_PRICES = {
+    "Oreobux": 100,
+    "QMkoin": 150,
+    "Seelsterling": 200,
+    "Fwizfinance": 250,
+    "BingBux": 120,
+}
+STOCKS = list(STOCK_BASE_PRICES)
 DIVIDEND_RATE = 0.01
 DIVIDEND_INTERVAL = 86400  # seconds
 
@@ -3,6 +3,10 @@ import asyncio
 from dotenv import load_dotenv
 
 from .client import bot
+from bot.utils.storage import flush_loop, apreload
+from bot.utils.accounts import materialize_accounts
+from bot.utils.events import EVENT_REGISTRY
+from bot.utils.ledger import LEDGER
 
 COGS = [
     "bot.cogs.core",
@@ -34,6 +38,19 @@ def main():
 
     async def runner():
         await _load_cogs()
-        await bot.start(token)
+        await apreload()
+        await EVENT_REGISTRY.load()
+        # ledger entries whose transfers committed before the ledger write did
+        replayed = await LEDGER.areplay_outbox()
+        if replayed:
+            print(f"[Ledger] Replayed {replayed} outbox entries.")
+        # catch up interest/dividends owed while offline and stamp accounts that predate lazy accrual
+        seeded = await materialize_accounts()
+        print(f"[Accounts] Brought {seeded} account(s) up to date.")
+        flusher = asyncio.create_task(flush_loop())
+        try:
+            await bot.start(token)
+        finally:
+            flusher.cancel()
 
     asyncio.run(runner())
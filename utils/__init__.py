@@ -1 +1,8 @@
-from .storage import load_json, save_json, ensure_file, path
+from .storage import (
+    load_json, save_json, ensure_file, path, abs_path, exists_file,
+    load_record, save_record, update_record, delete_record, cas_update_record,
+    save_records, update_records, cas_update_records, flush_all, storage_stats,
+    aload_json, asave_json, aload_record, asave_record, aupdate_record, adelete_record, acas_update_record,
+    asave_records, aupdate_records, acas_update_records,
+    aexists_file,
+)
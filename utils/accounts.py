@@ -0,0 +1,511 @@
+import functools
+import time
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+from bot.config import STOCKS, INTEREST_RATE, INTEREST_INTERVAL, DIVIDEND_RATE
+
+from .storage import WriteSet, aload_json, asave_json, aload_record, acas_update_records, acommit, aflush, edit_lock
+from .ranking import RankIndex
+from .cooldowns import COOLDOWNS, CooldownIndex
+from .holdings import HOLDINGS, HoldingsMatrix
+
+COIN_DATA_FILE = "coins.json"
+STOCK_FILE = "stocks.json"
+VERSION_FIELD = "version"
+COMMIT_RETRIES = 5
+
+# position of each ticker in Account.holdings
+STOCK_INDEX = {s: i for i, s in enumerate(STOCKS)}
+
+# field -> default for a brand-new (or partially filled) coins.json entry
+ACCOUNT_DEFAULTS = {
+    "wallet": 100,
+    "bank": 0,
+    "last_daily": 0.0,
+    "last_rob": 0.0,
+    "last_bankrob": 0.0,
+    "last_beg": 0.0,
+    "bank_accrued_at": None,  # None -> one interval ago (now for a brand-new account)
+    "dividend_epoch": None,   # None -> owed every payout still in the log
+}
+
+
+def accrue_interest(bank: int, since: float, now: float | None = None) -> tuple[int, float]:
+    """
+    Compound INTEREST_RATE over the whole INTEREST_INTERVALs between `since`
+    and `now`, truncating each step like the old hourly job did.
+    Returns (new bank, new accrued-at); a partial interval is carried over.
+    """
+    now = time.time() if now is None else now
+    steps = int((now - since) // INTEREST_INTERVAL)
+    if steps <= 0:
+        return bank, since
+    bank = int(bank)
+    for _ in range(steps):
+        interest = int(bank * INTEREST_RATE)
+        if interest <= 0:
+            break
+        bank += interest
+    return bank, since + steps * INTEREST_INTERVAL
+
+
+# -----------------------
+# Dividends
+# -----------------------
+# stocks.json["dividends"] = {"base": B, "prices": [{stock: price}, ...]}
+# Entry i is payout number B + i + 1 and holds the prices it was paid at;
+# an account's `dividend_epoch` is the last payout it has been credited for.
+def dividend_epoch(log) -> int:
+    return int(log.get("base", 0)) + len(log.get("prices") or [])
+
+
+_price_matrix_cache: tuple = ((), None)
+
+
+def _price_matrix(log) -> np.ndarray:
+    """The log's payouts as a (payouts x STOCKS) int64 matrix, rebuilt only when the log changes."""
+    global _price_matrix_cache
+    prices = log.get("prices") or []
+    # payouts are only appended or trimmed from the front, so (base, count) pins the contents
+    key = (int(log.get("base", 0)), len(prices))
+    if _price_matrix_cache[0] != key:
+        m = np.array([[int(vec.get(s, 0)) for s in STOCKS] for vec in prices], dtype=np.int64)
+        _price_matrix_cache = (key, m.reshape(len(prices), len(STOCKS)))
+    return _price_matrix_cache[1]
+
+
+def dividends_owed(holdings, since: int, log) -> int:
+    """
+    What the old per-payout loop would have credited since payout `since`:
+    each payout's value is a row of the price matrix dotted with `holdings`
+    (share counts in STOCKS order), truncated per payout as before.
+    """
+    m = _price_matrix(log)[max(0, since - int(log.get("base", 0))):]
+    if not len(m):
+        return 0
+    values = m @ np.asarray(holdings, dtype=np.int64)
+    return int(np.floor(values * DIVIDEND_RATE).sum())
+
+
+async def load_dividend_log():
+    stocks = await aload_json(STOCK_FILE, {}, readonly=True)
+    return stocks.get("dividends") or {}
+
+
+class AccountConflict(Exception):
+    """A commit kept losing to concurrent writers, or its changes no longer fit the newer account."""
+
+
+CONFLICT_RETRIES = 3
+CONFLICT_REPLY = "⚠️ Your balance changed while that was running, so nothing went through. Please try again."
+
+
+def retry_on_conflict(attempts: int = CONFLICT_RETRIES):
+    """
+    For cog commands that commit accounts and only reply after the commit:
+    run the command again (it re-reads and re-checks everything) when the
+    commit raises AccountConflict, and tell the user if it still fails.
+
+        @commands.command(name="deposit")
+        @retry_on_conflict()
+        async def deposit(self, ctx, amount: str): ...
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, ctx, *args, **kwargs):
+            for attempt in range(1, attempts + 1):
+                try:
+                    return await fn(self, ctx, *args, **kwargs)
+                except AccountConflict as e:
+                    print(f"[Accounts] !{ctx.command} conflict ({attempt}/{attempts}): {e}")
+            await ctx.send(CONFLICT_REPLY)
+        return wrapper
+    return decorate
+
+
+class Account:
+    """
+    One user's coins.json entry with every field defaulted, bank interest
+    accrued up to now and pending dividends credited.
+
+    Defaults are applied in memory only; nothing is written until the owning
+    AccountSession commits, and then only the fields that changed (plus any
+    that were missing on disk) are sent to storage. `version` is the record's
+    write counter, used by the commit's compare-and-swap.
+
+    Slotted, with share counts in one `array('q')` indexed like config.STOCKS
+    (`STOCK_INDEX`) for the life of a session. The resident coins.json entry
+    stays plain JSON, with a portfolio that lists only the tickers held, so
+    touching an account never pads it with a zero per ticker. `to_dict()`
+    gives back that layout, including fields and stocks this class doesn't
+    know.
+    Shares escrowed for open sell orders sit in `escrow`, outside the
+    portfolio, and are still paid dividends.
+    """
+
+    __slots__ = (
+        "user_id", "is_new", "version",
+        "wallet", "bank", "last_daily", "last_rob", "last_bankrob", "last_beg",
+        "bank_accrued_at", "dividend_epoch",
+        "holdings", "_other_shares", "escrow", "_extra", "_missing", "_saved", "_loaded",
+    )
+
+    def __init__(self, user_id: str, raw: dict | None, dividends=None):
+        dividends = dividends or {}
+        self.user_id = str(user_id)
+        self.is_new = raw is None
+        raw = raw or {}
+        self._extra = {k: v for k, v in raw.items() if k not in ACCOUNT_DEFAULTS and k not in ("portfolio", "escrow", VERSION_FIELD)}
+        self.version = int(raw.get(VERSION_FIELD, 0))
+
+        self.wallet = raw.get("wallet", ACCOUNT_DEFAULTS["wallet"])
+        self.bank = raw.get("bank", ACCOUNT_DEFAULTS["bank"])
+        self.last_daily = float(raw.get("last_daily", ACCOUNT_DEFAULTS["last_daily"]))
+        self.last_rob = float(raw.get("last_rob", ACCOUNT_DEFAULTS["last_rob"]))
+        self.last_bankrob = float(raw.get("last_bankrob", ACCOUNT_DEFAULTS["last_bankrob"]))
+        self.last_beg = float(raw.get("last_beg", ACCOUNT_DEFAULTS["last_beg"]))
+        if raw.get("bank_accrued_at"):
+            self.bank_accrued_at = float(raw["bank_accrued_at"])
+        else:
+            # an account from before lazy accrual is owed one step: the removed
+            # hourly job paid one as soon as the bot started, and the partial
+            # interval since its last run is otherwise lost. New accounts start now.
+            self.bank_accrued_at = time.time() - (0 if self.is_new else INTEREST_INTERVAL)
+        if raw.get("dividend_epoch") is not None:
+            self.dividend_epoch = int(raw["dividend_epoch"])
+        else:
+            # a brand-new account holds nothing, so it starts at the current payout
+            self.dividend_epoch = dividend_epoch(dividends) if self.is_new else int(dividends.get("base", 0))
+
+        pf = raw.get("portfolio")
+        pf = pf if isinstance(pf, dict) else {}
+        self.holdings = array("q", (int(pf.get(s, 0)) for s in STOCKS))
+        # delisted tickers are carried through untouched
+        self._other_shares = {s: n for s, n in pf.items() if s not in STOCK_INDEX}
+        # shares held back for open sell orders: out of the portfolio, still earning dividends
+        esc = raw.get("escrow")
+        self.escrow = {s: int(n) for s, n in esc.items() if int(n)} if isinstance(esc, dict) else {}
+
+        self._missing = {k for k in ACCOUNT_DEFAULTS if k not in raw}
+        self._saved = self._snapshot()
+        self.accrue()
+        self.settle_dividends(dividends)
+        self._loaded = self._snapshot()
+
+    def accrue(self, now: float | None = None):
+        """Bring the bank balance up to date with any interest owed."""
+        self.bank, self.bank_accrued_at = accrue_interest(self.bank, self.bank_accrued_at, now)
+
+    def settle_dividends(self, log):
+        """Credit every payout since `dividend_epoch` at the holdings we have now."""
+        epoch = dividend_epoch(log)
+        if epoch <= self.dividend_epoch:
+            return
+        self.wallet = int(self.wallet) + dividends_owed(self.owned(), self.dividend_epoch, log)
+        self.dividend_epoch = epoch
+
+    @property
+    def total(self) -> int:
+        return int(self.wallet) + int(self.bank)
+
+    @property
+    def portfolio(self) -> dict:
+        """
+        Share counts in the coins.json layout (a fresh dict; use set_shares()
+        to change them). Only tickers the user holds are listed, so a stored
+        portfolio never carries a zero for every ticker.
+        """
+        out = {s: n for s, n in zip(STOCKS, self.holdings) if n}
+        out.update(self._other_shares)
+        return out
+
+    def shares(self, stock: str) -> int:
+        i = STOCK_INDEX.get(stock)
+        return int(self.holdings[i]) if i is not None else int(self._other_shares.get(stock, 0))
+
+    def set_shares(self, stock: str, n: int):
+        i = STOCK_INDEX.get(stock)
+        if i is None:
+            self._other_shares[stock] = int(n)
+        else:
+            self.holdings[i] = int(n)
+
+    def escrowed(self, stock: str) -> int:
+        return int(self.escrow.get(stock, 0))
+
+    def set_escrowed(self, stock: str, n: int):
+        if n:
+            self.escrow[stock] = int(n)
+        else:
+            self.escrow.pop(stock, None)
+
+    def owned(self):
+        """
+        Share counts in STOCKS order the user owns: the portfolio plus
+        escrow. Dividends are paid and net worth is valued on these.
+        """
+        if not self.escrow:
+            return self.holdings
+        out = array("q", self.holdings)
+        for s, n in self.escrow.items():
+            if s in STOCK_INDEX:
+                out[STOCK_INDEX[s]] += n
+        return out
+
+    def _snapshot(self) -> dict:
+        snap = {k: getattr(self, k) for k in ACCOUNT_DEFAULTS}
+        snap["portfolio"] = self.portfolio
+        snap["escrow"] = dict(self.escrow)
+        return snap
+
+    def to_dict(self) -> dict:
+        out = dict(self._extra)
+        out.update(self._snapshot())
+        if not out["escrow"]:
+            del out["escrow"]
+        return out
+
+    def dirty(self) -> bool:
+        """Differs from storage, including interest and dividends settled on load."""
+        return self._snapshot() != self._saved
+
+    def touched(self) -> bool:
+        """Changed since it was loaded, i.e. by the command itself."""
+        return self._snapshot() != self._loaded
+
+    def changes(self) -> dict:
+        now = self._snapshot()
+        return {k: v for k, v in now.items() if k in self._missing or v != self._saved[k]}
+
+    def mark_saved(self):
+        self.is_new = False
+        self._missing.clear()
+        self._saved = self._snapshot()
+        self._loaded = self._saved
+        self.version += 1
+
+    def rebase(self, fresh: "Account"):
+        """
+        Re-apply what this session changed on top of a newer copy of the record.
+        Balances and share counts keep their deltas; timestamps and checkpoints
+        keep whichever is later.
+        """
+        mine, base = self._snapshot(), self._loaded
+        wallet = int(fresh.wallet) + int(mine["wallet"]) - int(base["wallet"])
+        bank = int(fresh.bank) + int(mine["bank"]) - int(base["bank"])
+        portfolio = fresh.portfolio
+        for s in {*mine["portfolio"], *base["portfolio"]}:
+            portfolio[s] = int(portfolio.get(s, 0)) + int(mine["portfolio"].get(s, 0)) - int(base["portfolio"].get(s, 0))
+        escrow = dict(fresh.escrow)
+        for s in {*mine["escrow"], *base["escrow"]}:
+            escrow[s] = escrow.get(s, 0) + mine["escrow"].get(s, 0) - base["escrow"].get(s, 0)
+        if wallet < 0 or bank < 0 or any(n < 0 for n in (*portfolio.values(), *escrow.values())):
+            raise AccountConflict(f"account {self.user_id} changed underneath this command")
+
+        latest = {k: max(getattr(fresh, k), mine[k]) for k in ("last_daily", "last_rob", "last_bankrob", "last_beg", "bank_accrued_at", "dividend_epoch")}
+        for k in Account.__slots__:
+            setattr(self, k, getattr(fresh, k))
+        self.holdings = array("q", fresh.holdings)
+        self._other_shares = dict(fresh._other_shares)
+        self.escrow = {s: n for s, n in escrow.items() if n}
+        self.wallet, self.bank = wallet, bank
+        for s, n in portfolio.items():
+            self.set_shares(s, n)
+        for k, v in latest.items():
+            setattr(self, k, v)
+
+
+class AccountSession:
+    """
+    Unit of work over coins.json.
+
+        async with AccountSession() as s:
+            me = await s.get(ctx.author.id)
+            me.wallet += 10
+
+    Each account is loaded once per session; leaving the block normally
+    commits every account the block changed in a single write (interest and
+    dividends settled on load ride along), an exception discards the changes.
+    A block that only reads, or returns before changing anything, writes
+    nothing.
+    """
+
+    def __init__(self):
+        self._accounts: dict[str, Account] = {}
+        self._dividends = None
+
+    async def get(self, user_id: int | str) -> Account:
+        uid = str(user_id)
+        if uid not in self._accounts:
+            if self._dividends is None:
+                self._dividends = await load_dividend_log()
+            raw = await aload_record(COIN_DATA_FILE, uid, None)
+            self._accounts[uid] = Account(uid, raw if isinstance(raw, dict) else None, self._dividends)
+        return self._accounts[uid]
+
+    async def _write(self, accts: list[Account], writes: WriteSet | None = None) -> list[dict]:
+        """
+        Compare-and-swap every changed account, together with `writes`, in
+        one commit. If any account moved underneath us, nothing is written:
+        the stale ones are rebased onto their newer records and the whole
+        set is tried again.
+        """
+        for _ in range(COMMIT_RETRIES):
+            fields = [acct.to_dict() if acct.is_new else acct.changes() for acct in accts]
+            ws = writes.copy() if writes else WriteSet()
+            for acct, f in zip(accts, fields):
+                ws.cas_update(COIN_DATA_FILE, acct.user_id, f, acct.version, VERSION_FIELD)
+            stale = {k[0] for k in await acommit(ws)}
+            if not stale:
+                return fields
+            for acct in accts:
+                if acct.user_id in stale:
+                    raw = await aload_record(COIN_DATA_FILE, acct.user_id, None)
+                    acct.rebase(Account(acct.user_id, raw if isinstance(raw, dict) else None, self._dividends))
+        raise AccountConflict(f"accounts {', '.join(sorted(stale))}: gave up after {COMMIT_RETRIES} conflicting writes")
+
+    async def commit(self, writes: WriteSet | None = None) -> int:
+        """
+        Write every account this session changed, plus any other records in
+        `writes`, all in one commit (see storage.WriteSet). Returns how many
+        accounts were written.
+        """
+        dirty = [acct for acct in self._accounts.values() if acct.touched()]
+        if not dirty and not writes:
+            return 0
+        written = await self._write(dirty, writes)
+        for acct, fields in zip(dirty, written):
+            acct.mark_saved()
+            if BALANCE_RANKS.ready:
+                BALANCE_RANKS.update(acct.user_id, balance_score(acct.wallet, acct.bank))
+            if HOLDINGS.ready:
+                HOLDINGS.update(acct.user_id, acct.owned(), acct.total)
+            if COOLDOWNS.ready:
+                COOLDOWNS.record(acct.user_id, fields)
+        return len(dirty)
+
+    async def __aenter__(self) -> "AccountSession":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.commit()
+        return False
+
+
+# -----------------------
+# Balance leaderboard
+# -----------------------
+# (wallet + bank, wallet, bank) per user; built from coins.json once, then kept current by commits
+BALANCE_RANKS = RankIndex()
+
+
+def balance_score(wallet, bank) -> tuple[int, int, int]:
+    """BALANCE_RANKS score: ranked by the total, with the split kept for display."""
+    wallet, bank = int(wallet), int(bank)
+    return wallet + bank, wallet, bank
+
+
+async def balance_ranks() -> RankIndex:
+    if not BALANCE_RANKS.ready:
+        coins = await aload_json(COIN_DATA_FILE, {}, readonly=True)
+        BALANCE_RANKS.rebuild(
+            (uid, balance_score(e.get("wallet", 0), e.get("bank", 0)))
+            for uid, e in coins.items() if isinstance(e, Mapping)
+        )
+    return BALANCE_RANKS
+
+
+def _owned_row(entry: Mapping) -> list[int]:
+    """A raw coins.json entry's portfolio plus escrow, in STOCKS order."""
+    pf, esc = entry.get("portfolio") or {}, entry.get("escrow") or {}
+    return [int(pf.get(s, 0)) + int(esc.get(s, 0)) for s in STOCKS]
+
+
+async def holdings_matrix() -> HoldingsMatrix:
+    """HOLDINGS, built from coins.json and stocks.json on first use."""
+    if not HOLDINGS.ready:
+        coins = await aload_json(COIN_DATA_FILE, {}, readonly=True)
+        HOLDINGS.rebuild(
+            (uid, _owned_row(e), int(e.get("wallet", 0)) + int(e.get("bank", 0)))
+            for uid, e in coins.items() if isinstance(e, Mapping)
+        )
+        HOLDINGS.set_prices(await aload_json(STOCK_FILE, {}, readonly=True))
+    return HOLDINGS
+
+
+async def cooldown_index() -> CooldownIndex:
+    """COOLDOWNS, hydrated from coins.json on first use; no storage access after that."""
+    if not COOLDOWNS.ready:
+        COOLDOWNS.rebuild(await aload_json(COIN_DATA_FILE, {}, readonly=True))
+    return COOLDOWNS
+
+
+async def get_account(user_id: int | str) -> Account:
+    """Read-only convenience: one load, nothing written."""
+    return await AccountSession().get(user_id)
+
+
+_last_materialized = 0.0
+
+
+async def materialize_accounts(max_age: float = 0) -> int:
+    """
+    Accrue interest and settle dividends on every account in one
+    compare-and-swap write, then drop the payouts every stored account has
+    been credited for. For views over all accounts (leaderboards, backups)
+    and startup; with `max_age` it is skipped if a full pass already ran that
+    recently. Accounts written concurrently are skipped; they settle lazily.
+    """
+    global _last_materialized
+    if max_age and time.time() - _last_materialized < max_age:
+        return 0
+    _last_materialized = time.time()
+
+    log = await load_dividend_log()
+    coins = await aload_json(COIN_DATA_FILE, {})
+    accts = {}
+    for uid, entry in coins.items():
+        if not isinstance(entry, dict):
+            continue
+        acct = Account(uid, entry, log)
+        if acct.dirty() or acct._missing & {"bank_accrued_at", "dividend_epoch"}:
+            accts[acct.user_id] = acct
+        if BALANCE_RANKS.ready:
+            BALANCE_RANKS.update(uid, balance_score(acct.wallet, acct.bank))
+        if HOLDINGS.ready:
+            HOLDINGS.update(uid, acct.owned(), acct.total)
+
+    for _ in range(COMMIT_RETRIES):
+        if not accts:
+            break
+        items = [(uid, acct.to_dict() if acct.is_new else acct.changes(), acct.version) for uid, acct in accts.items()]
+        stale = await acas_update_records(COIN_DATA_FILE, items, VERSION_FIELD)
+        if not stale:
+            break
+        for k in stale:
+            accts.pop(k[0], None)
+    changed = len(accts)
+
+    # the new epochs must be on disk before the payouts they cover are dropped
+    await aflush(COIN_DATA_FILE)
+    base = int(log.get("base", 0))
+    coins = await aload_json(COIN_DATA_FILE, {}, readonly=True)
+    credited = min(
+        (int(e.get("dividend_epoch") if e.get("dividend_epoch") is not None else base) for e in coins.values() if isinstance(e, Mapping)),
+        default=dividend_epoch(log),
+    )
+    if credited > base:
+        # re-read under the edit lock so a payout made meanwhile is kept
+        async with edit_lock(STOCK_FILE):
+            stocks = await aload_json(STOCK_FILE, {})
+            cur = stocks.get("dividends") or {}
+            cur_base = int(cur.get("base", 0))
+            drop = min(credited, dividend_epoch(cur)) - cur_base
+            if drop > 0:
+                stocks["dividends"] = {"base": cur_base + drop, "prices": (cur.get("prices") or [])[drop:]}
+                await asave_json(STOCK_FILE, stocks)
+    return changed
@@ -0,0 +1,84 @@
+import asyncio
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from bot.chartrender import render_chart
+
+from .pricehistory import PRICE_HISTORY
+
+# Chart rendering runs in worker processes so matplotlib never holds the event loop (or the GIL);
+# render_chart lives outside utils so a worker never imports the storage layer
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "64"))
+
+
+class ChartCache:
+    """
+    Rendered PNGs keyed by (ticker, range, history version), least recently
+    used first out. The version is the ticker's raw row count, so a new tick
+    makes old entries unreachable; `invalidate()` (called by the tick) also
+    frees them. Concurrent requests for the same chart share one render.
+    """
+
+    def __init__(self, max_size: int = CHART_CACHE_SIZE, workers: int = CHART_WORKERS):
+        self.max_size = max_size
+        self.workers = workers
+        self._png: OrderedDict[tuple, bytes] = OrderedDict()
+        self._pending: dict[tuple, asyncio.Future] = {}
+        self._pool: ProcessPoolExecutor | None = None
+        self.hits = 0
+        self.renders = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that already runs storage threads is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=max(1, self.workers), mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def invalidate(self):
+        self._png.clear()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def get(self, ticker: str, range_name: str) -> bytes | None:
+        """PNG for a RANGES window of `ticker`, or None if there is no history yet."""
+        version = await PRICE_HISTORY.aversion(ticker)
+        key = (ticker, range_name, version)
+        png = self._png.get(key)
+        if png is not None:
+            self._png.move_to_end(key)
+            self.hits += 1
+            return png
+        if key in self._pending:
+            return await asyncio.shield(self._pending[key])
+
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[key] = fut
+        try:
+            columns = await PRICE_HISTORY.arange(ticker, range_name)
+            png = None
+            if len(columns["ts"]):
+                png = await asyncio.get_running_loop().run_in_executor(self._executor(), render_chart, ticker, range_name, columns)
+                self.renders += 1
+                self._png[key] = png
+                while len(self._png) > self.max_size:
+                    self._png.popitem(last=False)
+            fut.set_result(png)
+            return png
+        except BaseException as e:
+            if isinstance(e, Exception):
+                fut.set_exception(e)
+                fut.exception()  # retrieved here; waiters still get it
+            else:
+                fut.cancel()
+            raise
+        finally:
+            self._pending.pop(key, None)
+
+
+CHART_CACHE = ChartCache()
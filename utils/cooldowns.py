@@ -0,0 +1,50 @@
+import time
+from collections.abc import Mapping
+
+COOLDOWN_FIELDS = ("last_daily", "last_rob", "last_bankrob", "last_beg")
+_SLOT = {f: i for i, f in enumerate(COOLDOWN_FIELDS)}
+
+
+class CooldownIndex:
+    """
+    Last-use timestamps for the cooldown commands, one small tuple per user.
+
+    Built from coins.json once (`rebuild`) and then kept current by account
+    commits, so a command can turn away a user who is still on cooldown
+    without touching storage or taking a lock. The account itself stays the
+    source of truth; this is only the fast "no" in front of it.
+    """
+
+    def __init__(self):
+        self._times: dict[str, tuple[float, ...]] = {}
+        self.ready = False
+
+    def rebuild(self, coins: Mapping):
+        self._times = {
+            str(uid): tuple(float(entry.get(f, 0.0) or 0.0) for f in COOLDOWN_FIELDS)
+            for uid, entry in coins.items() if isinstance(entry, Mapping)
+        }
+        self.ready = True
+
+    def last(self, uid, field: str) -> float:
+        times = self._times.get(str(uid))
+        return times[_SLOT[field]] if times else 0.0
+
+    def remaining(self, uid, field: str, cooldown: float, now: float | None = None) -> float:
+        """Seconds until `field` is usable again (0 if it is)."""
+        now = time.time() if now is None else now
+        return max(0.0, self.last(uid, field) + cooldown - now)
+
+    def record(self, uid, values: Mapping):
+        """Store any cooldown fields present in `values` (an account's committed fields)."""
+        uid = str(uid)
+        if not any(f in values for f in COOLDOWN_FIELDS):
+            return
+        times = list(self._times.get(uid) or (0.0,) * len(COOLDOWN_FIELDS))
+        for f, i in _SLOT.items():
+            if f in values:
+                times[i] = float(values[f] or 0.0)
+        self._times[uid] = tuple(times)
+
+
+COOLDOWNS = CooldownIndex()
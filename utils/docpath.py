@@ -0,0 +1,44 @@
+from typing import Any
+
+# Helpers for addressing an entry inside a nested-dict JSON document by key path.
+
+def walk(doc: Any, key: tuple[str, ...], default: Any = None):
+    node = doc
+    for k in key:
+        if not isinstance(node, dict) or k not in node:
+            return default
+        node = node[k]
+    return node
+
+def place(doc: dict, key: tuple[str, ...], value: Any):
+    node = doc
+    for k in key[:-1]:
+        child = node.get(k)
+        if not isinstance(child, dict):
+            child = node[k] = {}
+        node = child
+    node[key[-1]] = value
+
+def remove(doc: dict, key: tuple[str, ...]) -> bool:
+    parent = walk(doc, key[:-1], None)
+    if isinstance(parent, dict) and key[-1] in parent:
+        del parent[key[-1]]
+        return True
+    return False
+
+def change(doc: dict, key: tuple[str, ...], op: str, value: Any = None):
+    """Apply one "put" (replace), "set" (update some fields, creating the record) or "del" change."""
+    if op == "del":
+        remove(doc, key)
+    elif op == "put":
+        place(doc, key, value)
+    else:
+        rec = walk(doc, key, None)
+        if not isinstance(rec, dict):
+            rec = {}
+            place(doc, key, rec)
+        rec.update(value)
+
+def version(rec: Any, field: str) -> int:
+    """A record's write counter for compare-and-swap (0 when it has none)."""
+    return int(rec.get(field, 0)) if isinstance(rec, dict) else 0
@@ -0,0 +1,106 @@
+import time
+import inspect
+from typing import Any, Callable
+
+from bot.config import EVENTS
+
+from .storage import load_json, aload_json, asave_json
+
+EVENT_FILE = "events.json"
+
+
+class EventRegistry:
+    """
+    The one place that knows which server event (config.EVENTS) is running.
+
+    events.json holds {"active": name, "started_at": ts, "ends_at": ts | None}.
+    It is read once; after that `modifier()` is a dict lookup, so hot paths
+    (XP per message, the stock tick, !daily) can call it freely. An event past
+    its `ends_at` reads as over straight away, and `expire()` makes it official.
+
+    Cogs `subscribe()` a callback `(name, modifiers, active)` that is awaited
+    whenever an event starts or ends.
+    """
+
+    def __init__(self):
+        self._state: dict | None = None
+        self._subscribers: list[Callable] = []
+
+    def _current(self) -> dict:
+        if self._state is None:
+            # first use before load(): one small synchronous read
+            self._state = dict(load_json(EVENT_FILE, {}) or {})
+        return self._state
+
+    async def load(self):
+        self._state = dict(await aload_json(EVENT_FILE, {}) or {})
+
+    def _due(self, state: dict, now: float | None = None) -> bool:
+        ends_at = state.get("ends_at")
+        return bool(ends_at) and (time.time() if now is None else now) >= float(ends_at)
+
+    def active(self) -> str | None:
+        state = self._current()
+        name = state.get("active")
+        if name not in EVENTS or self._due(state):
+            return None
+        return name
+
+    def info(self) -> dict:
+        """Active event with its timing, or {} when nothing is running."""
+        name = self.active()
+        if not name:
+            return {}
+        state = self._current()
+        return {"name": name, "started_at": state.get("started_at"), "ends_at": state.get("ends_at"), **EVENTS[name]}
+
+    def modifier(self, key: str, default: Any = None) -> Any:
+        name = self.active()
+        return EVENTS[name].get(key, default) if name else default
+
+    def subscribe(self, callback: Callable):
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    async def _notify(self, name: str, active: bool):
+        for cb in list(self._subscribers):
+            try:
+                result = cb(name, EVENTS.get(name, {}), active)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"[Events] subscriber {getattr(cb, '__qualname__', cb)} failed: {type(e).__name__}: {e}")
+
+    async def start(self, name: str, duration: float | None = None):
+        if name not in EVENTS:
+            raise KeyError(name)
+        previous = self.active()
+        now = time.time()
+        self._state = {"active": name, "started_at": now, "ends_at": now + duration if duration else None}
+        await asave_json(EVENT_FILE, self._state)
+        if previous and previous != name:
+            await self._notify(previous, False)
+        await self._notify(name, True)
+
+    async def stop(self) -> str | None:
+        name = self._current().get("active")
+        if not name:
+            return None
+        self._state = {}
+        await asave_json(EVENT_FILE, self._state)
+        if name in EVENTS:
+            await self._notify(name, False)
+        return name
+
+    async def expire(self) -> str | None:
+        """End the active event if its time is up. Returns its name if it ended."""
+        if self._current().get("active") and self._due(self._current()):
+            return await self.stop()
+        return None
+
+
+EVENT_REGISTRY = EventRegistry()
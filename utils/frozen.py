@@ -0,0 +1,64 @@
+import copy
+from collections.abc import Mapping, Sequence
+from typing import Any
+
+# Read-only views over parsed JSON, so one cached parse can be handed to
+# many read-only callers without any of them being able to change it.
+# `thaw()` gives back an ordinary, mutable deep copy.
+
+
+def freeze(obj: Any):
+    if isinstance(obj, dict):
+        return FrozenDict(obj)
+    if isinstance(obj, list):
+        return FrozenList(obj)
+    return obj
+
+
+def thaw(obj: Any):
+    if isinstance(obj, (FrozenDict, FrozenList)):
+        return copy.deepcopy(obj._data)
+    return copy.deepcopy(obj)
+
+
+class FrozenDict(Mapping):
+    __slots__ = ("_data",)
+
+    def __init__(self, data: dict):
+        self._data = data
+
+    def __getitem__(self, key):
+        return freeze(self._data[key])
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"FrozenDict({self._data!r})"
+
+    def copy(self) -> dict:
+        return thaw(self)
+
+
+class FrozenList(Sequence):
+    __slots__ = ("_data",)
+
+    def __init__(self, data: list):
+        self._data = data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FrozenList(self._data[index])
+        return freeze(self._data[index])
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"FrozenList({self._data!r})"
+
+    def copy(self) -> list:
+        return thaw(self)
@@ -0,0 +1,141 @@
+from collections.abc import Iterable, Mapping
+from typing import Callable
+
+import numpy as np
+
+from bot.config import STOCKS
+
+
+class HoldingsMatrix:
+    """
+    Every account's share counts (escrowed ones included) as one row of a
+    users x stocks int64 matrix, its cash (wallet + bank) and the coins it
+    has escrowed for open buy orders in parallel vectors, and each stock's
+    current price in `prices` (columns follow config.STOCKS).
+
+    Valuing one user is a row dot product and valuing the whole economy one
+    matrix-vector product, so net-worth views never loop over stocks or
+    re-read stocks.json. Built from coins.json once (`rebuild`), then kept
+    current by account commits and the price tick.
+    """
+
+    def __init__(self, stocks: Iterable[str] = STOCKS):
+        self.stocks = list(stocks)
+        self._row: dict[str, int] = {}
+        self._uids: list[str] = []
+        self._shares = np.zeros((0, len(self.stocks)), dtype=np.int64)
+        self._cash = np.zeros(0, dtype=np.int64)
+        self._bids = np.zeros(0, dtype=np.int64)
+        self._bid_totals: dict[str, int] = {}  # uid -> escrowed coins; set by the order book, kept across rebuilds
+        self.prices = np.zeros(len(self.stocks), dtype=np.int64)
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._uids)
+
+    def _index(self, uid: str) -> int:
+        i = self._row.get(uid)
+        if i is not None:
+            return i
+        i = len(self._uids)
+        if i == len(self._cash):
+            # grow by doubling so appends stay amortised O(1)
+            cap = max(16, 2 * i)
+            shares = np.zeros((cap, len(self.stocks)), dtype=np.int64)
+            shares[:i] = self._shares[:i]
+            cash = np.zeros(cap, dtype=np.int64)
+            cash[:i] = self._cash[:i]
+            bids = np.zeros(cap, dtype=np.int64)
+            bids[:i] = self._bids[:i]
+            self._shares, self._cash, self._bids = shares, cash, bids
+        self._row[uid] = i
+        self._uids.append(uid)
+        return i
+
+    def update(self, uid, holdings, cash: int | None = None):
+        """Set one user's share row (a sequence in STOCKS order) and optionally their cash."""
+        i = self._index(str(uid))
+        self._shares[i] = holdings
+        if cash is not None:
+            self._cash[i] = int(cash)
+
+    def set_bids(self, uid, coins: int):
+        """Coins `uid` has escrowed for open buy orders (the order book's total for them)."""
+        uid = str(uid)
+        if coins:
+            self._bid_totals[uid] = int(coins)
+        else:
+            self._bid_totals.pop(uid, None)
+        i = self._index(uid)  # may grow (replace) the arrays, so index before touching _bids
+        self._bids[i] = int(coins)
+
+    def rebuild(self, rows: Iterable[tuple[str, Iterable[int], int]]):
+        """Replace everything with (uid, holdings, cash) rows."""
+        self._row, self._uids = {}, []
+        self._shares = np.zeros((0, len(self.stocks)), dtype=np.int64)
+        self._cash = np.zeros(0, dtype=np.int64)
+        self._bids = np.zeros(0, dtype=np.int64)
+        for uid, holdings, cash in rows:
+            self.update(uid, list(holdings), cash)
+        for uid, coins in self._bid_totals.items():
+            i = self._index(uid)
+            self._bids[i] = coins
+        self.ready = True
+
+    def set_prices(self, stocks: Mapping):
+        """Take current prices from a stocks.json document."""
+        self.prices = np.array([int((stocks.get(s) or {}).get("price", 0)) for s in self.stocks], dtype=np.int64)
+
+    # ----- valuation -----
+    def stock_values(self, holdings) -> np.ndarray:
+        """Per-stock value of one holdings row."""
+        return np.asarray(holdings, dtype=np.int64) * self.prices
+
+    def value_of(self, holdings) -> int:
+        return int(np.dot(np.asarray(holdings, dtype=np.int64), self.prices))
+
+    def value(self, uid) -> int:
+        i = self._row.get(str(uid))
+        return 0 if i is None else int(self._shares[i] @ self.prices)
+
+    def bids(self, uid) -> int:
+        return self._bid_totals.get(str(uid), 0)
+
+    def values(self) -> np.ndarray:
+        """Stock value of every row, in one product."""
+        return self._shares[:len(self)] @ self.prices
+
+    def networth(self) -> np.ndarray:
+        n = len(self)
+        return self._cash[:n] + self._bids[:n] + self.values()
+
+    def market_cap(self) -> int:
+        """Value of every share held in the economy."""
+        return int(self._shares[:len(self)].sum(axis=0) @ self.prices)
+
+    def top(self, k: int, accept: Callable[[str], bool] | None = None) -> list[tuple[str, int, int]]:
+        """Best `k` (uid, net worth, stock value) by net worth, skipping uids `accept` rejects."""
+        stock = self.values()
+        worth = self._cash[:len(self)] + self._bids[:len(self)] + stock
+        out = []
+        for i in np.argsort(-worth, kind="stable"):
+            uid = self._uids[i]
+            if accept is None or accept(uid):
+                out.append((uid, int(worth[i]), int(stock[i])))
+                if len(out) >= k:
+                    break
+        return out
+
+    def rank_among(self, uid, accept: Callable[[str], bool] | None = None) -> int | None:
+        """1-based net-worth position of `uid` among accepted users."""
+        i = self._row.get(str(uid))
+        if i is None:
+            return None
+        worth = self.networth()
+        ahead = np.flatnonzero(worth > worth[i])
+        if accept is None:
+            return len(ahead) + 1
+        return sum(1 for j in ahead if accept(self._uids[j])) + 1
+
+
+HOLDINGS = HoldingsMatrix()
@@ -0,0 +1,104 @@
+import json
+import os
+import time
+from typing import Any
+
+from .docpath import walk, place, remove
+from .storage_stats import STATS
+
+
+def apply_op(doc: dict, op: dict):
+    """Apply one journal entry to a document in place."""
+    key = tuple(op["k"])
+    if op.get("del"):
+        remove(doc, key)
+    elif "put" in op:
+        place(doc, key, op["put"])
+    else:
+        rec = walk(doc, key, None)
+        if not isinstance(rec, dict):
+            rec = {}
+            place(doc, key, rec)
+        rec.update(op.get("set") or {})
+
+
+class Journal:
+    """
+    Append-only mutation log next to a JSON snapshot (`coins.json.journal`).
+
+    Each line is one record change: key path, the fields' new values and a
+    timestamp. Entries carry absolute values rather than deltas, so replaying
+    a journal over a snapshot that already contains it is harmless — which is
+    what happens if we crash between writing a snapshot and truncating.
+    """
+
+    def __init__(self, fp: str, fsync: bool = False, name: str | None = None):
+        self.fp = fp
+        self.fsync = fsync
+        self.name = name or fp
+        self._fh = None
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.fp)
+        except OSError:
+            return 0
+
+    def _line(self, key: tuple[str, ...], *, fields: dict | None = None, put: Any = None, delete: bool = False) -> str:
+        op: dict[str, Any] = {"ts": round(time.time(), 3), "k": list(key)}
+        if delete:
+            op["del"] = True
+        elif fields is not None:
+            op["set"] = fields
+        else:
+            op["put"] = put
+        return json.dumps(op, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+    def _write(self, body: str):
+        if self._fh is None:
+            os.makedirs(os.path.dirname(self.fp) or ".", exist_ok=True)
+            self._fh = open(self.fp, "a", encoding="utf-8")
+        self._fh.write(body)
+        self._fh.flush()
+        if self.fsync:
+            os.fsync(self._fh.fileno())
+        STATS.record_append(self.name, len(body.encode("utf-8")))
+
+    def append(self, key: tuple[str, ...], *, fields: dict | None = None, put: Any = None, delete: bool = False):
+        self._write(self._line(key, fields=fields, put=put, delete=delete))
+
+    def append_many(self, changes: list[tuple[tuple[str, ...], Any]], *, put: bool = False):
+        """Several changes in one write (and one fsync): [(key, fields), ...], or [(key, value), ...] with put=True."""
+        if changes:
+            self._write("".join(self._line(k, put=v) if put else self._line(k, fields=v) for k, v in changes))
+
+    def append_ops(self, ops: list[tuple[tuple[str, ...], str, Any]]):
+        """Mixed changes in one write: [(key, "put" | "set" | "del", value), ...] as in storage.WriteSet."""
+        if ops:
+            self._write("".join(
+                self._line(k, delete=True) if op == "del" else self._line(k, fields=v) if op == "set" else self._line(k, put=v)
+                for k, op, v in ops
+            ))
+
+    def replay(self, doc: dict) -> int:
+        """Apply every complete entry to `doc`. A torn last line is ignored."""
+        if not os.path.exists(self.fp):
+            return 0
+        applied = 0
+        with open(self.fp, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                apply_op(doc, op)
+                applied += 1
+        return applied
+
+    def reset(self):
+        """Drop all entries; call only once a snapshot containing them is on disk."""
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        if os.path.exists(self.fp):
+            open(self.fp, "w").close()
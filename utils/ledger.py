@@ -0,0 +1,187 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .storage import WriteSet, path, _off_loop, aload_json, acommit
+from .frozen import thaw
+
+LEDGER_FILE = os.getenv("LEDGER_FILE", "ledger.db")
+# ledger entries committed with their balances but not yet in LEDGER_FILE
+LEDGER_OUTBOX_FILE = "ledger_outbox.json"
+
+# One row per transaction; `participants` maps each user to their
+# transactions so a user's history is an index range, newest first.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    from_id TEXT,
+    to_id TEXT,
+    amount INTEGER NOT NULL,
+    meta TEXT,
+    ref TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_ts ON transactions (ts);
+CREATE INDEX IF NOT EXISTS transactions_kind_ts ON transactions (kind, ts);
+CREATE TABLE IF NOT EXISTS participants (
+    user_id TEXT NOT NULL,
+    tx_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, tx_id)
+) WITHOUT ROWID;
+"""
+
+
+class Ledger:
+    """
+    Append-only record of coin movements: (from, to, amount, kind, ts, meta).
+
+    `from_id`/`to_id` of None is the house (shop, market, dealer, rewards).
+    Rows are never updated or deleted. Transfers reach it through an outbox
+    committed with the balances (stage/adeliver), so a crash between the two
+    writes delays an entry until the next areplay_outbox() but never loses it.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            # databases from before the outbox have no `ref` column
+            if "ref" not in {r["name"] for r in self._conn.execute("PRAGMA table_info(transactions)")}:
+                self._conn.execute("ALTER TABLE transactions ADD COLUMN ref TEXT")
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS transactions_ref ON transactions (ref)")
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ----- writes -----
+    def record_many(self, entries: list[dict]) -> list[int]:
+        """
+        Append several transactions in one commit. Each entry: kind, from_id,
+        to_id, amount[, meta, ts, ref]. An entry whose `ref` is already in the
+        ledger is skipped, so replaying the outbox never records one twice.
+        """
+        ids = []
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for e in entries:
+                    src = str(e["from_id"]) if e.get("from_id") is not None else None
+                    dst = str(e["to_id"]) if e.get("to_id") is not None else None
+                    meta = json.dumps(e["meta"], separators=(",", ":")) if e.get("meta") else None
+                    cur = db.execute(
+                        "INSERT OR IGNORE INTO transactions (ts, kind, from_id, to_id, amount, meta, ref) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (e.get("ts") or time.time(), e["kind"], src, dst, int(e["amount"]), meta, e.get("ref")),
+                    )
+                    if cur.rowcount == 0:
+                        continue
+                    tx_id = cur.lastrowid
+                    db.executemany(
+                        "INSERT OR IGNORE INTO participants (user_id, tx_id) VALUES (?, ?)",
+                        [(uid, tx_id) for uid in {src, dst} if uid is not None],
+                    )
+                    ids.append(tx_id)
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        return ids
+
+    # ----- reads -----
+    @staticmethod
+    def _row(r: sqlite3.Row) -> dict:
+        out = dict(r)
+        out["meta"] = json.loads(out["meta"]) if out["meta"] else {}
+        return out
+
+    def count_for(self, user_id) -> int:
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM participants WHERE user_id = ?", (str(user_id),)).fetchone()[0]
+
+    def history(self, user_id, limit: int = 10, offset: int = 0) -> list[dict]:
+        """A user's transactions, newest first. Only the `limit` rows shown are read from `transactions`."""
+        sql = (
+            "SELECT * FROM transactions WHERE id IN ("
+            "  SELECT tx_id FROM participants WHERE user_id = ? ORDER BY tx_id DESC LIMIT ? OFFSET ?"
+            ") ORDER BY id DESC"
+        )
+        with self._lock:
+            rows = self._db().execute(sql, (str(user_id), int(limit), int(offset))).fetchall()
+        return [self._row(r) for r in rows]
+
+    def between(self, since: float, until: float | None = None, kind: str | None = None, limit: int = 500) -> list[dict]:
+        """Audit query over a time window (optionally one kind), served by the ts / (kind, ts) indexes."""
+        until = time.time() if until is None else until
+        if kind:
+            sql, args = "SELECT * FROM transactions WHERE kind = ? AND ts >= ? AND ts < ? ORDER BY ts LIMIT ?", (kind, since, until, limit)
+        else:
+            sql, args = "SELECT * FROM transactions WHERE ts >= ? AND ts < ? ORDER BY ts LIMIT ?", (since, until, limit)
+        with self._lock:
+            rows = self._db().execute(sql, args).fetchall()
+        return [self._row(r) for r in rows]
+
+    # ----- async -----
+    async def arecord_many(self, entries: list[dict]) -> list[int]:
+        return await _off_loop(LEDGER_FILE, self.record_many, entries)
+
+    # ----- outbox -----
+    @staticmethod
+    def stage(ws: WriteSet, entries: list[dict]) -> list[dict]:
+        """
+        Put `entries` in the ledger outbox as part of `ws`, so they are
+        committed with the balances they describe. Returns them with the
+        `ref` and `ts` they were staged under, for adeliver().
+        """
+        staged = []
+        for e in entries:
+            e = {**e, "ts": e.get("ts") or time.time(), "ref": uuid.uuid4().hex}
+            ws.put(LEDGER_OUTBOX_FILE, e["ref"], e)
+            staged.append(e)
+        return staged
+
+    async def adeliver(self, staged: list[dict]):
+        """Copy committed outbox entries into the ledger, then clear them from the outbox."""
+        if not staged:
+            return
+        await self.arecord_many(staged)
+        ws = WriteSet()
+        for e in staged:
+            ws.delete(LEDGER_OUTBOX_FILE, e["ref"])
+        await acommit(ws)
+
+    async def areplay_outbox(self) -> int:
+        """Deliver whatever the outbox still holds (a crash or ledger error after a commit). Returns how many."""
+        outbox = thaw(await aload_json(LEDGER_OUTBOX_FILE, {}, readonly=True))
+        staged = sorted((e for e in outbox.values() if isinstance(e, dict)), key=lambda e: e.get("ts") or 0)
+        await self.adeliver(staged)
+        return len(staged)
+
+    async def ahistory(self, user_id, limit: int = 10, offset: int = 0) -> tuple[list[dict], int]:
+        """(page rows, total count) for !history."""
+        rows = await _off_loop(LEDGER_FILE, self.history, user_id, limit, offset)
+        total = await _off_loop(LEDGER_FILE, self.count_for, user_id)
+        return rows, total
+
+    async def abetween(self, since: float, until: float | None = None, kind: str | None = None, limit: int = 500) -> list[dict]:
+        return await _off_loop(LEDGER_FILE, self.between, since, until, kind, limit)
+
+
+LEDGER = Ledger(path(LEDGER_FILE))
+
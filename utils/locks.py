@@ -1,4 +1,76 @@
 import asyncio
-from collections import defaultdict
+import os
+import time
+from contextlib import asynccontextmanager
 
-MONEY_LOCKS = defaultdict(asyncio.Lock)
+MONEY_LOCK_STRIPES = int(os.getenv("MONEY_LOCK_STRIPES", "64"))
+
+
+class StripedLocks:
+    """
+    A fixed pool of asyncio locks; a key (user id) always maps to the same
+    stripe, so memory stays constant however many users we see. Two keys
+    may share a stripe, which only costs a little extra waiting.
+
+        async with MONEY_LOCKS.hold(payer_id, payee_id):
+            ...
+
+    `hold()` takes the stripes in index order (each once), so two commands
+    locking the same users in a different order cannot deadlock.
+    """
+
+    def __init__(self, stripes: int = MONEY_LOCK_STRIPES):
+        self._locks = [asyncio.Lock() for _ in range(max(1, stripes))]
+        self._waiting = [0] * len(self._locks)
+        self.acquisitions = 0
+        self.waits = 0
+        self.wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.max_queue_depth = 0
+
+    def stripe(self, key) -> int:
+        return hash(str(key)) % len(self._locks)
+
+    async def _acquire(self, i: int):
+        lock = self._locks[i]
+        self.acquisitions += 1
+        if not lock.locked():
+            await lock.acquire()
+            return
+        self.waits += 1
+        self._waiting[i] += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._waiting[i])
+        t0 = time.perf_counter()
+        try:
+            await lock.acquire()
+        finally:
+            self._waiting[i] -= 1
+            ms = (time.perf_counter() - t0) * 1000
+            self.wait_ms += ms
+            self.max_wait_ms = max(self.max_wait_ms, ms)
+
+    @asynccontextmanager
+    async def hold(self, *keys):
+        held = []
+        try:
+            for i in sorted({self.stripe(k) for k in keys}):
+                await self._acquire(i)
+                held.append(i)
+            yield
+        finally:
+            for i in reversed(held):
+                self._locks[i].release()
+
+    def stats(self) -> dict:
+        return {
+            "stripes": len(self._locks),
+            "acquisitions": self.acquisitions,
+            "waits": self.waits,
+            "wait_ms_total": round(self.wait_ms, 3),
+            "wait_ms_max": round(self.max_wait_ms, 3),
+            "max_queue_depth": self.max_queue_depth,
+            "waiting_now": sum(self._waiting),
+        }
+
+
+MONEY_LOCKS = StripedLocks()
@@ -0,0 +1,119 @@
+from collections.abc import Iterable, Mapping
+
+import numpy as np
+
+from bot.config import STOCKS, STOCK_BASE_PRICES
+
+from .storage import aload_json
+
+STOCK_FILE = "stocks.json"
+
+# per-ticker outcome of the last tick (Market.moves)
+STEADY, CRASH, BOOM, MEGA_CRASH, MEGA_BOOM = range(5)
+
+CRASH_ABOVE, CRASH_MULT = 5000, (0.4, 0.8)
+BOOM_BELOW, BOOM_MULT = 3000, (2.3, 2.8)
+MEGA_CRASH_ABOVE, MEGA_CRASH_MULT, MEGA_CRASH_ODDS = 10000, (0.1, 0.3), 1 / 100
+MEGA_BOOM_BELOW, MEGA_BOOM_MULT, MEGA_BOOM_ODDS = 2000, (6.0, 7.0), 1 / 100
+
+
+class Market:
+    """
+    Prices, order flow and crash/boom state for every ticker, as arrays
+    indexed like config.STOCKS. The stocks cog ticks it and economy records
+    purchases into it; both use the one MARKET instance, so no demand is lost
+    between ticks however either module imports it.
+
+    A tick is a single vectorised pass: one crash/boom roll for the whole
+    market (as before), per-ticker eligibility by price band, then the
+    demand-driven drift for everything left steady.
+    """
+
+    def __init__(self, tickers: Iterable[str] = STOCKS, base_prices: Mapping[str, int] = STOCK_BASE_PRICES):
+        self.tickers = list(tickers)
+        self.index = {s: i for i, s in enumerate(self.tickers)}
+        self.base = np.array([int(base_prices.get(s, 100)) for s in self.tickers], dtype=np.int64)
+        self.prices = self.base.copy()
+        self.flow = np.zeros(len(self.tickers), dtype=np.int64)  # shares bought since the last tick
+        self.moves = np.zeros(len(self.tickers), dtype=np.int8)  # STEADY/CRASH/... per ticker, last tick
+        self.rng = np.random.default_rng()
+        self.ready = False
+
+    def load(self, stocks: Mapping):
+        """Take prices from a stocks.json document; unknown tickers start at their base price."""
+        self.prices = np.array(
+            [int((stocks.get(s) or {}).get("price", b)) for s, b in zip(self.tickers, self.base)],
+            dtype=np.int64,
+        )
+        self.ready = True
+
+    def price(self, ticker: str) -> int:
+        return int(self.prices[self.index[ticker]])
+
+    def record_buy(self, ticker: str, shares: int):
+        i = self.index.get(ticker)
+        if i is not None:
+            self.flow[i] += int(shares)
+
+    def tick(self, crash_odds: float = 1 / 15, boom_odds: float = 1 / 15) -> np.ndarray:
+        """
+        Move every price once and clear the order flow. Returns the previous
+        prices; `self.moves` says what happened to each ticker.
+        """
+        rng, n = self.rng, len(self.tickers)
+        old = self.prices
+        p = old.astype(np.float64)
+
+        crash_hit = rng.random() < crash_odds
+        boom_hit = rng.random() < boom_odds
+        mega_crash_hit = rng.random() < MEGA_CRASH_ODDS
+        mega_boom_hit = rng.random() < MEGA_BOOM_ODDS
+
+        # first matching rule wins, in this order
+        moves = np.full(n, STEADY, dtype=np.int8)
+        free = np.ones(n, dtype=bool)
+        for hit, mask, code in (
+            (mega_crash_hit, old > MEGA_CRASH_ABOVE, MEGA_CRASH),
+            (crash_hit, old > CRASH_ABOVE, CRASH),
+            (mega_boom_hit, old < MEGA_BOOM_BELOW, MEGA_BOOM),
+            (boom_hit, old < BOOM_BELOW, BOOM),
+        ):
+            if hit:
+                m = free & mask
+                moves[m] = code
+                free &= ~m
+
+        growth_bias = rng.uniform(0.01, 0.02)
+        total = int(self.flow.sum())
+        if total > 0:
+            # a ticker drawing more than its fair share of buying rises; the
+            # fair share was 0.25 with five tickers and scales as 1/(n-1)
+            fair = 1 / max(1, n - 1)
+            change = 0.5 * (self.flow / total - fair) + growth_bias
+        else:
+            change = rng.uniform(-0.05, 0.05, n) + growth_bias
+
+        new = np.maximum(1, (p * (1 + change)).astype(np.int64))
+        new = np.where(moves == MEGA_CRASH, np.maximum(1, (p * rng.uniform(*MEGA_CRASH_MULT)).astype(np.int64)), new)
+        new = np.where(moves == CRASH, np.maximum(1, (p * rng.uniform(*CRASH_MULT)).astype(np.int64)), new)
+        new = np.where(moves == MEGA_BOOM, (p * rng.uniform(*MEGA_BOOM_MULT)).astype(np.int64), new)
+        new = np.where(moves == BOOM, (p * rng.uniform(*BOOM_MULT)).astype(np.int64), new)
+
+        self.prices = new
+        self.moves = moves
+        self.flow = np.zeros(n, dtype=np.int64)
+        return old
+
+    def changed(self, old: np.ndarray, code: int) -> list[tuple[str, int, int]]:
+        """(ticker, old price, new price) for every ticker whose last move was `code`."""
+        return [(self.tickers[i], int(old[i]), int(self.prices[i])) for i in np.flatnonzero(self.moves == code)]
+
+
+MARKET = Market()
+
+
+async def load_market() -> Market:
+    """MARKET, priced from stocks.json on first use."""
+    if not MARKET.ready:
+        MARKET.load(await aload_json(STOCK_FILE, {}, readonly=True))
+    return MARKET
@@ -0,0 +1,340 @@
+import asyncio
+import heapq
+import os
+import time
+from collections.abc import Iterable, Mapping
+
+from sortedcontainers import SortedDict
+
+from bot.config import STOCKS
+
+from .storage import aload_json, asave_record
+from .holdings import HOLDINGS
+from .locks import MONEY_LOCKS
+from .market import MARKET
+from .transfers import Batch, apply_batch
+
+ORDER_FILE = "orders.json"
+MAX_OPEN_ORDERS = int(os.getenv("MAX_OPEN_ORDERS", "20"))
+
+# orders.json record holding the id high-water mark (not an order), and how
+# many ids each save of it reserves
+ORDER_ID_KEY = "next_id"
+ORDER_ID_BLOCK = int(os.getenv("ORDER_ID_BLOCK", "50"))
+
+BUY, SELL = "buy", "sell"
+
+
+class SelfTrade(Exception):
+    """An order would fill against one of the same user's resting orders."""
+
+    def __init__(self, order: "Order"):
+        super().__init__(f"would trade with own order #{order.id}")
+        self.order = order
+
+
+class Order:
+    """One resting (or incoming) limit order; `qty` is what is still open."""
+
+    __slots__ = ("id", "uid", "ticker", "side", "price", "qty", "filled", "ts")
+
+    def __init__(self, id: int, uid, ticker: str, side: str, price: int, qty: int, filled: int = 0, ts: float | None = None):
+        self.id = int(id)
+        self.uid = str(uid)
+        self.ticker = ticker
+        self.side = side
+        self.price = int(price)
+        self.qty = int(qty)
+        self.filled = int(filled)
+        self.ts = time.time() if ts is None else float(ts)
+
+    @property
+    def live(self) -> bool:
+        return self.qty > 0
+
+    def to_dict(self) -> dict:
+        return {"uid": self.uid, "ticker": self.ticker, "side": self.side, "price": self.price,
+                "qty": self.qty, "filled": self.filled, "ts": self.ts}
+
+    @classmethod
+    def from_dict(cls, id, d: Mapping) -> "Order":
+        return cls(id, d["uid"], d["ticker"], d["side"], d["price"], d["qty"], d.get("filled", 0), d.get("ts"))
+
+
+class OrderBook:
+    """
+    One ticker's resting limit orders in price-time priority: bids in a
+    max-heap on (price, arrival), asks in a min-heap. Order ids only grow,
+    so the id is the arrival tiebreak.
+
+    Cancelled and filled orders are left in the heaps and dropped when they
+    surface (lazy deletion), so adding, cancelling and taking the best order
+    are all O(log n); an incoming order that fills against k resting orders
+    costs O(k log n). Open shares and orders per price level are kept
+    alongside, so `depth()` never walks the heaps.
+    """
+
+    def __init__(self, ticker: str):
+        self.ticker = ticker
+        self._bids: list[tuple[int, int, Order]] = []  # (-price, id, order)
+        self._asks: list[tuple[int, int, Order]] = []  # (price, id, order)
+        self._levels = {BUY: SortedDict(), SELL: SortedDict()}  # side -> {price: [open shares, orders]}
+        self.lock = asyncio.Lock()  # one match-and-settle at a time per ticker
+
+    def _heap(self, side: str) -> list:
+        return self._bids if side == BUY else self._asks
+
+    def _level(self, order: Order, shares: int, orders: int):
+        levels = self._levels[order.side]
+        level = levels.setdefault(order.price, [0, 0])
+        level[0] += shares
+        level[1] += orders
+        if level[1] <= 0:
+            del levels[order.price]
+
+    def add(self, order: Order):
+        key = -order.price if order.side == BUY else order.price
+        heapq.heappush(self._heap(order.side), (key, order.id, order))
+        self._level(order, order.qty, 1)
+
+    def fill(self, order: Order, qty: int):
+        """Take `qty` shares off a resting order."""
+        order.qty -= qty
+        order.filled += qty
+        self._level(order, -qty, 0 if order.live else -1)
+
+    def cancel(self, order: Order):
+        self._level(order, -order.qty, -1)
+        order.qty = 0
+
+    def best(self, side: str) -> Order | None:
+        heap = self._heap(side)
+        while heap and not heap[0][2].live:
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def plan(self, order: Order) -> list[tuple[Order, int]]:
+        """
+        (resting order, shares) fills for `order` against the opposite side,
+        best price first, without changing anything. Raises SelfTrade if it
+        would reach one of the same user's orders.
+        """
+        heap = self._heap(SELL if order.side == BUY else BUY)
+        taken, fills, want = [], [], order.qty
+        try:
+            while want > 0:
+                while heap and not heap[0][2].live:
+                    heapq.heappop(heap)
+                if not heap:
+                    break
+                maker = heap[0][2]
+                if (maker.price > order.price) if order.side == BUY else (maker.price < order.price):
+                    break
+                if maker.uid == order.uid:
+                    raise SelfTrade(maker)
+                taken.append(heapq.heappop(heap))
+                n = min(want, maker.qty)
+                fills.append((maker, n))
+                want -= n
+        finally:
+            for entry in taken:
+                heapq.heappush(heap, entry)
+        return fills
+
+    def depth(self, side: str, levels: int = 5) -> list[tuple[int, int, int]]:
+        """Best `levels` price levels on one side as (price, shares, orders)."""
+        book = self._levels[side]
+        prices = book.keys()[max(0, len(book) - levels):][::-1] if side == BUY else book.keys()[:levels]
+        return [(p, *book[p]) for p in prices]
+
+
+class OrderBooks:
+    """Every ticker's OrderBook plus the open orders by id, mirrored in orders.json."""
+
+    def __init__(self, tickers: Iterable[str] = STOCKS):
+        self.books = {t: OrderBook(t) for t in tickers}
+        self.orders: dict[int, Order] = {}
+        self._user_ids: dict[str, set[int]] = {}  # uid -> ids of their open orders
+        self._bid_totals: dict[str, int] = {}  # uid -> coins escrowed in their open buy orders
+        self._next_id = 1
+        self._reserved = 1  # ids below this are covered by the saved ORDER_ID_KEY
+        self._id_lock = asyncio.Lock()
+        self.ready = False
+
+    def load(self, doc: Mapping):
+        self.books = {t: OrderBook(t) for t in self.books}
+        self.orders, self._user_ids, self._bid_totals = {}, {}, {}
+        for oid, d in doc.items():
+            if oid == ORDER_ID_KEY:
+                continue
+            order = Order.from_dict(oid, d)
+            if order.live and order.ticker in self.books:
+                self.rest(order)
+        # files from before the counter was saved only have the open orders to go on
+        self._next_id = self._reserved = max(int(doc.get(ORDER_ID_KEY, 1)), max(self.orders, default=0) + 1)
+        for uid in {o.uid for o in self.orders.values()}:
+            self.note_bids(uid)
+        self.ready = True
+
+    async def new_id(self) -> int:
+        """
+        A fresh order id, never handed out before, even across restarts:
+        ids are reserved ORDER_ID_BLOCK at a time by saving the high-water
+        mark to orders.json before any of them is used. A restart skips
+        whatever was left of the block.
+        """
+        async with self._id_lock:
+            if self._next_id >= self._reserved:
+                reserved = self._next_id + ORDER_ID_BLOCK
+                await asave_record(ORDER_FILE, ORDER_ID_KEY, reserved)
+                self._reserved = reserved
+            oid, self._next_id = self._next_id, self._next_id + 1
+        return oid
+
+    # ----- open-order state (the user and escrow totals move with every change) -----
+    def _escrow(self, uid: str, coins: int):
+        total = self._bid_totals.get(uid, 0) + coins
+        if total:
+            self._bid_totals[uid] = total
+        else:
+            self._bid_totals.pop(uid, None)
+
+    def _forget(self, order: Order):
+        self.orders.pop(order.id, None)
+        ids = self._user_ids.get(order.uid)
+        if ids is not None:
+            ids.discard(order.id)
+            if not ids:
+                del self._user_ids[order.uid]
+
+    def rest(self, order: Order):
+        """Put a live order on its book."""
+        self.orders[order.id] = order
+        self.books[order.ticker].add(order)
+        self._user_ids.setdefault(order.uid, set()).add(order.id)
+        if order.side == BUY:
+            self._escrow(order.uid, order.price * order.qty)
+
+    def fill(self, order: Order, qty: int):
+        """Take `qty` shares off a resting order; it leaves the book once nothing is open."""
+        if order.side == BUY:
+            self._escrow(order.uid, -order.price * qty)
+        self.books[order.ticker].fill(order, qty)
+        if not order.live:
+            self._forget(order)
+
+    def cancel(self, order: Order):
+        if order.side == BUY:
+            self._escrow(order.uid, -order.price * order.qty)
+        self.books[order.ticker].cancel(order)
+        self._forget(order)
+
+    def user_orders(self, uid) -> list[Order]:
+        return sorted((self.orders[i] for i in self._user_ids.get(str(uid), ())), key=lambda o: o.id)
+
+    def bid_escrow(self, uid) -> int:
+        """Coins `uid` has escrowed in open buy orders (part of their net worth)."""
+        return self._bid_totals.get(str(uid), 0)
+
+    def note_bids(self, uid):
+        """Pass `uid`'s bid escrow on to HOLDINGS after their orders change."""
+        HOLDINGS.set_bids(uid, self.bid_escrow(uid))
+
+
+ORDER_BOOKS = OrderBooks()
+
+
+async def order_books() -> OrderBooks:
+    """ORDER_BOOKS, loaded from orders.json on first use."""
+    if not ORDER_BOOKS.ready:
+        ORDER_BOOKS.load(await aload_json(ORDER_FILE, {}, readonly=True))
+    return ORDER_BOOKS
+
+
+def _write_order(batch: Batch, order: Order, qty: int, filled: int):
+    """Add `order`'s orders.json record as it will be once `batch` commits (dropped when nothing is left open)."""
+    if qty > 0:
+        batch.writes.put(ORDER_FILE, str(order.id), {**order.to_dict(), "qty": qty, "filled": filled})
+    else:
+        batch.writes.delete(ORDER_FILE, str(order.id))
+
+
+# -----------------------
+# Placing / cancelling
+# -----------------------
+# Coins for an open bid (qty x limit) and shares for an open ask are taken
+# from the account when the order rests and held until it fills or is
+# cancelled, so a resting order can always settle. Held shares move to the
+# account's escrow, where they keep earning dividends. Trades happen at the
+# resting order's price; a buyer who crosses below their limit pays less.
+async def place_order(uid, side: str, ticker: str, qty: int, price: int) -> tuple[Order, list[tuple[Order, int]]]:
+    """
+    Match a limit order against the book and settle every fill, the escrow
+    for any remainder and the new state of every order involved in one
+    batch commit, then rest the remainder. Returns the order (its `qty` is
+    what rests) and the (resting order, shares) fills. Raises SelfTrade or
+    TransferError (nothing changed) on failure.
+    """
+    books = await order_books()
+    book = books.books[ticker]
+    async with book.lock:
+        order = Order(await books.new_id(), uid, ticker, side, price, qty)
+        fills = book.plan(order)
+        rest = qty - sum(n for _, n in fills)
+
+        batch = Batch()
+        if side == BUY:
+            for maker, n in fills:
+                batch.shares(order.uid, ticker, n).escrow_shares(maker.uid, ticker, -n)
+                batch.move(order.uid, maker.uid, maker.price * n, "trade", stock=ticker, shares=n, price=maker.price)
+            batch.move(order.uid, None, price * rest, "order_escrow", stock=ticker, shares=rest, price=price, order=order.id)
+        else:
+            batch.shares(order.uid, ticker, -qty).escrow_shares(order.uid, ticker, rest)
+            for maker, n in fills:
+                # the buyer's coins were escrowed when their bid rested
+                batch.shares(maker.uid, ticker, n)
+                batch.move(None, order.uid, maker.price * n, "trade", stock=ticker, shares=n, price=maker.price, buyer=maker.uid)
+        for maker, n in fills:
+            _write_order(batch, maker, maker.qty - n, maker.filled + n)
+        if rest:
+            _write_order(batch, order, rest, qty - rest)
+
+        async with MONEY_LOCKS.hold(*batch.keys()):
+            await apply_batch(batch)
+
+        for maker, n in fills:
+            books.fill(maker, n)
+        order.qty, order.filled = rest, qty - rest
+        if order.live:
+            books.rest(order)
+        for u in {order.uid, *(m.uid for m, _ in fills)}:
+            books.note_bids(u)
+
+    if side == BUY and order.filled:
+        MARKET.record_buy(ticker, order.filled)
+    return order, fills
+
+
+async def cancel_order(uid, order_id: int) -> Order | None:
+    """Cancel one of `uid`'s open orders and return its escrow; None if there is no such order."""
+    books = await order_books()
+    order = books.orders.get(int(order_id))
+    if order is None or order.uid != str(uid):
+        return None
+    async with books.books[order.ticker].lock:
+        if not order.live:
+            return None  # filled while we waited
+        batch = Batch()
+        if order.side == BUY:
+            batch.move(None, order.uid, order.price * order.qty, "order_refund",
+                       stock=order.ticker, shares=order.qty, price=order.price, order=order.id)
+        else:
+            batch.shares(order.uid, order.ticker, order.qty).escrow_shares(order.uid, order.ticker, -order.qty)
+        _write_order(batch, order, 0, order.filled)
+        async with MONEY_LOCKS.hold(*batch.keys()):
+            await apply_batch(batch)
+
+        cancelled = Order(order.id, order.uid, order.ticker, order.side, order.price, order.qty, order.filled, order.ts)
+        books.cancel(order)
+        books.note_bids(order.uid)
+    return cancelled
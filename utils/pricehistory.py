@@ -0,0 +1,205 @@
+import os
+import re
+import threading
+import time
+from collections.abc import Iterable, Mapping
+
+import numpy as np
+
+from .storage import path, _off_loop
+
+PRICE_HISTORY_DIR = os.getenv("PRICE_HISTORY_DIR", "price_history")
+
+# resolution -> bar width in seconds; "raw" is one row per tick
+ROLLUPS = {"1h": 3600, "1d": 86400, "1w": 7 * 86400}
+RAW_COLUMNS = {"ts": "<f8", "price": "<i8"}
+BAR_COLUMNS = {"ts": "<f8", "open": "<i8", "high": "<i8", "low": "<i8", "close": "<i8"}
+
+# weekly bars start on Monday 00:00 UTC (the epoch was a Thursday)
+_WEEK_ORIGIN = 4 * 86400
+
+# !stockchart / !stockstats ranges: name -> (seconds back or None for all, resolution to read)
+RANGES = {
+    "1d": (86400, "raw"),
+    "1w": (7 * 86400, "1h"),
+    "1m": (30 * 86400, "1h"),
+    "3m": (90 * 86400, "1d"),
+    "1y": (365 * 86400, "1d"),
+    "all": (None, "1w"),
+}
+
+
+def bar_start(ts: float, width: int) -> float:
+    origin = _WEEK_ORIGIN if width == ROLLUPS["1w"] else 0
+    return float((ts - origin) // width * width + origin)
+
+
+class PriceHistory:
+    """
+    Append-only, columnar price history: one directory per ticker holding a
+    fixed-width little-endian file per column, for the raw ticks
+    (`raw.ts`, `raw.price`) and for OHLC bars at each ROLLUPS resolution
+    (`1h.ts`, `1h.open`, ... `1w.close`).
+
+    Timestamps only grow, so a window is two binary searches over a memory
+    map of `ts` and a slice of the other columns: O(log n + window), however
+    long the history. Bars are maintained as ticks arrive; the newest bar of
+    each resolution is rewritten in place until its period closes.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._rows: dict[tuple[str, str], int] = {}
+        self._bars: dict[tuple[str, str], list] = {}
+
+    # ----- files -----
+    def _dir(self, ticker: str) -> str:
+        return os.path.join(self.root, re.sub(r"[^\w.-]", "_", ticker))
+
+    def _file(self, ticker: str, res: str, col: str) -> str:
+        return os.path.join(self._dir(ticker), f"{res}.{col}")
+
+    @staticmethod
+    def _columns(res: str) -> dict[str, str]:
+        return RAW_COLUMNS if res == "raw" else BAR_COLUMNS
+
+    def _count(self, ticker: str, res: str) -> int:
+        """Rows in a series; a torn append (columns of unequal length) is cut back on first use."""
+        key = (ticker, res)
+        if key not in self._rows:
+            sizes = {}
+            for col, dt in self._columns(res).items():
+                fp = self._file(ticker, res, col)
+                sizes[col] = (os.path.getsize(fp) if os.path.exists(fp) else 0) // np.dtype(dt).itemsize
+            n = min(sizes.values())
+            for col, size in sizes.items():
+                if size > n:
+                    with open(self._file(ticker, res, col), "r+b") as f:
+                        f.truncate(n * np.dtype(self._columns(res)[col]).itemsize)
+            self._rows[key] = n
+        return self._rows[key]
+
+    def _append(self, ticker: str, res: str, row: dict):
+        os.makedirs(self._dir(ticker), exist_ok=True)
+        for col, dt in self._columns(res).items():
+            with open(self._file(ticker, res, col), "ab") as f:
+                f.write(np.array([row[col]], dtype=dt).tobytes())
+        self._rows[(ticker, res)] = self._count(ticker, res) + 1
+
+    def _overwrite_last(self, ticker: str, res: str, row: dict):
+        n = self._count(ticker, res)
+        for col, dt in self._columns(res).items():
+            if col == "ts":
+                continue
+            size = np.dtype(dt).itemsize
+            with open(self._file(ticker, res, col), "r+b") as f:
+                f.seek((n - 1) * size)
+                f.write(np.array([row[col]], dtype=dt).tobytes())
+
+    def _read(self, ticker: str, res: str, col: str, i: int, j: int) -> np.ndarray:
+        dt = self._columns(res)[col]
+        if j <= i:
+            return np.empty(0, dtype=dt)
+        mm = np.memmap(self._file(ticker, res, col), dtype=dt, mode="r", shape=(self._count(ticker, res),))
+        return np.array(mm[i:j])
+
+    def _last_bar(self, ticker: str, res: str) -> list | None:
+        key = (ticker, res)
+        if key not in self._bars:
+            n = self._count(ticker, res)
+            self._bars[key] = [self._read(ticker, res, c, n - 1, n)[0].item() for c in BAR_COLUMNS] if n else None
+        return self._bars[key]
+
+    # ----- writes -----
+    def append(self, ticker: str, ts: float, price: int):
+        """One tick: a raw row, and the current bar of every rollup updated (or a new one opened)."""
+        price = int(price)
+        with self._lock:
+            n = self._count(ticker, "raw")
+            if n:
+                # keep ts sorted if the clock steps back
+                ts = max(ts, self._read(ticker, "raw", "ts", n - 1, n)[0].item())
+            self._append(ticker, "raw", {"ts": ts, "price": price})
+            for res, width in ROLLUPS.items():
+                start = bar_start(ts, width)
+                bar = self._last_bar(ticker, res)
+                if bar is not None and bar[0] == start:
+                    bar[2], bar[3], bar[4] = max(bar[2], price), min(bar[3], price), price
+                    self._overwrite_last(ticker, res, dict(zip(BAR_COLUMNS, bar)))
+                else:
+                    bar = [start, price, price, price, price]
+                    self._append(ticker, res, dict(zip(BAR_COLUMNS, bar)))
+                    self._bars[(ticker, res)] = bar
+
+    def append_tick(self, prices: Iterable[tuple[str, int]], ts: float | None = None):
+        ts = time.time() if ts is None else ts
+        for ticker, price in prices:
+            self.append(ticker, ts, price)
+
+    def seed(self, ticker: str, prices: list[int], interval: float, until: float | None = None):
+        """Backfill an empty series with untimed prices (stocks.json's old `history` list), `interval` apart."""
+        if self.version(ticker) or not prices:
+            return
+        until = time.time() if until is None else until
+        for k, price in enumerate(prices):
+            self.append(ticker, until - (len(prices) - k) * interval, int(price))
+
+    # ----- reads -----
+    def version(self, ticker: str) -> int:
+        """Raw rows recorded for `ticker`; changes on every tick (a cheap cache key)."""
+        with self._lock:
+            return self._count(ticker, "raw")
+
+    def window(self, ticker: str, start: float | None = None, end: float | None = None, res: str = "raw") -> dict[str, np.ndarray]:
+        """Columns of `res` rows with start <= ts <= end (either bound optional)."""
+        with self._lock:
+            n = self._count(ticker, res)
+            if not n:
+                return {c: np.empty(0, dtype=dt) for c, dt in self._columns(res).items()}
+            ts = np.memmap(self._file(ticker, res, "ts"), dtype="<f8", mode="r", shape=(n,))
+            i = int(np.searchsorted(ts, start, "left")) if start is not None else 0
+            j = int(np.searchsorted(ts, end, "right")) if end is not None else n
+            return {c: self._read(ticker, res, c, i, j) for c in self._columns(res)}
+
+    def range(self, ticker: str, name: str, now: float | None = None) -> dict[str, np.ndarray]:
+        """A RANGES window, read at that range's resolution."""
+        seconds, res = RANGES[name]
+        now = time.time() if now is None else now
+        return self.window(ticker, None if seconds is None else now - seconds, None, res)
+
+    def stats(self, ticker: str, name: str, now: float | None = None) -> dict | None:
+        """Open/high/low/close and change over a RANGES window, or None with no data."""
+        w = self.range(ticker, name, now)
+        if not len(w["ts"]):
+            return None
+        if "price" in w:
+            first, last, hi, lo = w["price"][0], w["price"][-1], w["price"].max(), w["price"].min()
+        else:
+            first, last, hi, lo = w["open"][0], w["close"][-1], w["high"].max(), w["low"].min()
+        return {
+            "open": int(first), "close": int(last), "high": int(hi), "low": int(lo),
+            "change_pct": (int(last) - int(first)) / max(1, int(first)) * 100,
+            "points": len(w["ts"]), "since": float(w["ts"][0]),
+        }
+
+    # ----- async -----
+    async def aappend_tick(self, prices: Iterable[tuple[str, int]], ts: float | None = None):
+        await _off_loop(PRICE_HISTORY_DIR, self.append_tick, list(prices), ts)
+
+    async def aseed(self, stocks: Mapping, interval: float):
+        for ticker, entry in stocks.items():
+            if isinstance(entry, Mapping) and entry.get("history"):
+                await _off_loop(PRICE_HISTORY_DIR, self.seed, ticker, list(entry["history"]), interval)
+
+    async def aversion(self, ticker: str) -> int:
+        return await _off_loop(PRICE_HISTORY_DIR, self.version, ticker)
+
+    async def arange(self, ticker: str, name: str) -> dict[str, np.ndarray]:
+        return await _off_loop(PRICE_HISTORY_DIR, self.range, ticker, name)
+
+    async def astats(self, ticker: str, name: str) -> dict | None:
+        return await _off_loop(PRICE_HISTORY_DIR, self.stats, ticker, name)
+
+
+PRICE_HISTORY = PriceHistory(path(PRICE_HISTORY_DIR))
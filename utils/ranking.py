@@ -0,0 +1,124 @@
+from typing import Any, Callable, Iterable, Iterator
+
+from sortedcontainers import SortedList
+
+
+class RankIndex:
+    """
+    Leaderboard kept sorted as scores change, so rank and top-k never need a
+    full sort. Scores can be anything orderable (ints, tuples); ties are
+    broken by user id so every user has one fixed position.
+
+    Entries live in a SortedList, so an update, a rank lookup and the k-th
+    entry are all O(log n). `view(guild_id, members)` gives a second index
+    over one guild's members that every update keeps current, so guild
+    leaderboards never walk past users from elsewhere; `join()`/`leave()`
+    track membership changes. `ready` stays False until the first
+    `rebuild()` from the stored data.
+    """
+
+    def __init__(self):
+        self._keys: SortedList = SortedList()   # ascending (score, uid)
+        self._scores: dict[str, Any] = {}
+        self._views: dict[int, tuple[set[str], "RankIndex"]] = {}  # guild id -> (member uids, index)
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, uid) -> bool:
+        return str(uid) in self._scores
+
+    def score(self, uid) -> Any:
+        return self._scores.get(str(uid))
+
+    def _set(self, uid: str, score):
+        old = self._scores.get(uid)
+        if uid in self._scores:
+            if old == score:
+                return
+            self._keys.remove((old, uid))
+        self._scores[uid] = score
+        self._keys.add((score, uid))
+
+    def _unset(self, uid: str):
+        if uid in self._scores:
+            self._keys.remove((self._scores.pop(uid), uid))
+
+    def update(self, uid, score):
+        uid = str(uid)
+        self._set(uid, score)
+        for members, view in self._views.values():
+            if uid in members:
+                view._set(uid, score)
+
+    def remove(self, uid):
+        uid = str(uid)
+        self._unset(uid)
+        for _, view in self._views.values():
+            view._unset(uid)
+
+    def clear(self):
+        self._keys.clear()
+        self._scores.clear()
+        self._views.clear()
+        self.ready = False
+
+    def rebuild(self, rows):
+        """Replace the contents with (uid, score) pairs."""
+        self._keys = SortedList((score, str(uid)) for uid, score in rows)
+        self._scores = {uid: score for score, uid in self._keys}
+        self._views.clear()
+        self.ready = True
+
+    # ----- per-guild views -----
+    def view(self, guild_id: int, members: Iterable) -> "RankIndex":
+        """
+        The index restricted to one guild. `members` (uids) is read only the
+        first time; after that the view is kept current by updates and by
+        join()/leave().
+        """
+        if guild_id not in self._views:
+            uids = {str(m) for m in members}
+            view = RankIndex()
+            view.rebuild((uid, self._scores[uid]) for uid in uids if uid in self._scores)
+            self._views[guild_id] = (uids, view)
+        return self._views[guild_id][1]
+
+    def join(self, guild_id: int, uid):
+        if guild_id in self._views:
+            uid = str(uid)
+            members, view = self._views[guild_id]
+            members.add(uid)
+            if uid in self._scores:
+                view._set(uid, self._scores[uid])
+
+    def leave(self, guild_id: int, uid):
+        if guild_id in self._views:
+            uid = str(uid)
+            members, view = self._views[guild_id]
+            members.discard(uid)
+            view._unset(uid)
+
+    # ----- queries -----
+    def rank(self, uid) -> int | None:
+        """1-based position over everyone in the index."""
+        uid = str(uid)
+        if uid not in self._scores:
+            return None
+        return len(self._keys) - self._keys.bisect_left((self._scores[uid], uid))
+
+    def descending(self, accept: Callable[[str], bool] | None = None) -> Iterator[tuple[str, Any]]:
+        for score, uid in reversed(self._keys):
+            if accept is None or accept(uid):
+                yield uid, score
+
+    def top(self, k: int, accept: Callable[[str], bool] | None = None) -> list[tuple[str, Any]]:
+        if accept is None:
+            return [(uid, score) for score, uid in reversed(self._keys[max(0, len(self._keys) - k):])]
+        out = []
+        for row in self.descending(accept):
+            out.append(row)
+            if len(out) >= k:
+                break
+        return out
@@ -0,0 +1,403 @@
+import json
+import sqlite3
+import threading
+from typing import Any
+
+from .docpath import walk, place, remove, change, version
+from .storage_stats import STATS, timer
+
+# Per-domain tables. Anything that isn't mapped here is stored as a whole
+# JSON document in `documents`, so every filename still round-trips.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS accounts (
+    user_id TEXT PRIMARY KEY,
+    wallet NUMERIC,
+    bank NUMERIC,
+    last_daily REAL,
+    last_rob REAL,
+    last_bankrob REAL,
+    last_beg REAL,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS portfolios (
+    user_id TEXT NOT NULL,
+    stock TEXT NOT NULL,
+    shares INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, stock)
+);
+CREATE TABLE IF NOT EXISTS xp (
+    guild_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    xp INTEGER,
+    level INTEGER,
+    extra TEXT,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS inventories (
+    user_id TEXT NOT NULL,
+    item TEXT NOT NULL,
+    qty INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, item)
+);
+CREATE TABLE IF NOT EXISTS trivia_stats (
+    user_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    correct INTEGER,
+    attempts INTEGER,
+    PRIMARY KEY (user_id, category)
+);
+"""
+
+
+def _size(value: Any) -> int:
+    """Bytes `value` would take as compact JSON, for the stats of row reads and writes."""
+    return len(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+class _Table:
+    """
+    A JSON document of nested dicts whose leaves live one-per-row.
+
+    `key_cols` are the nesting levels (e.g. guild_id -> user_id), `value_cols`
+    the leaf fields. With `scalar=True` the leaf is the single value column
+    instead of a dict. Unknown leaf fields go to the `extra` JSON column.
+    """
+
+    def __init__(self, table: str, key_cols: tuple[str, ...], value_cols: tuple[str, ...],
+                 scalar: bool = False, extra: bool = False):
+        self.table = table
+        self.key_cols = key_cols
+        self.value_cols = value_cols
+        self.scalar = scalar
+        self.extra = extra
+
+    @property
+    def depth(self) -> int:
+        return len(self.key_cols)
+
+    def _where(self, key: tuple[str, ...]) -> tuple[str, list[str]]:
+        if not key:
+            return "", []
+        clause = " AND ".join(f"{c} = ?" for c in self.key_cols[:len(key)])
+        return f" WHERE {clause}", list(key)
+
+    def _columns(self) -> list[str]:
+        cols = list(self.key_cols) + list(self.value_cols)
+        if self.extra:
+            cols.append("extra")
+        return cols
+
+    def _leaf_from_row(self, row: sqlite3.Row) -> Any:
+        if self.scalar:
+            return row[self.value_cols[0]]
+        leaf = {c: row[c] for c in self.value_cols if row[c] is not None}
+        if self.extra and row["extra"]:
+            leaf.update(json.loads(row["extra"]))
+        return leaf
+
+    def _row_from_leaf(self, key: tuple[str, ...], leaf: Any) -> list[Any]:
+        if self.scalar:
+            return list(key) + [leaf]
+        leaf = dict(leaf)
+        values = [leaf.pop(c, None) for c in self.value_cols]
+        row = list(key) + values
+        if self.extra:
+            row.append(json.dumps(leaf, ensure_ascii=False) if leaf else None)
+        return row
+
+    def load(self, cur: sqlite3.Cursor, key: tuple[str, ...]) -> Any:
+        where, args = self._where(key)
+        rows = cur.execute(f"SELECT * FROM {self.table}{where}", args).fetchall()
+        if not rows:
+            return None
+        if len(key) == self.depth:
+            return self._leaf_from_row(rows[0])
+
+        out: dict = {}
+        for row in rows:
+            node = out
+            rest = [row[c] for c in self.key_cols[len(key):]]
+            for k in rest[:-1]:
+                node = node.setdefault(k, {})
+            node[rest[-1]] = self._leaf_from_row(row)
+        return out
+
+    def _flatten(self, key: tuple[str, ...], value: Any):
+        if len(key) == self.depth:
+            yield self._row_from_leaf(key, value)
+            return
+        for k, child in (value or {}).items():
+            yield from self._flatten(key + (str(k),), child)
+
+    def save(self, cur: sqlite3.Cursor, key: tuple[str, ...], value: Any):
+        self.delete(cur, key)
+        cols = self._columns()
+        sql = f"INSERT INTO {self.table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        cur.executemany(sql, self._flatten(key, value))
+
+    def delete(self, cur: sqlite3.Cursor, key: tuple[str, ...]):
+        where, args = self._where(key)
+        cur.execute(f"DELETE FROM {self.table}{where}", args)
+
+
+class _AccountsTable(_Table):
+    """coins.json: one `accounts` row per user plus their `portfolios` rows."""
+
+    def __init__(self):
+        super().__init__(
+            "accounts",
+            ("user_id",),
+            ("wallet", "bank", "last_daily", "last_rob", "last_bankrob", "last_beg"),
+            extra=True,
+        )
+        self.portfolios = _Table("portfolios", ("user_id", "stock"), ("shares",), scalar=True)
+
+    def load(self, cur, key):
+        accounts = super().load(cur, key)
+        if accounts is None:
+            return None
+        holdings = self.portfolios.load(cur, key) or {}
+        if len(key) == self.depth:
+            accounts["portfolio"] = holdings
+            return accounts
+        for uid, acct in accounts.items():
+            acct["portfolio"] = holdings.get(uid, {})
+        return accounts
+
+    def _split(self, key, value):
+        if len(key) == self.depth:
+            value = dict(value)
+            return value, value.pop("portfolio", None) or {}
+        accounts, holdings = {}, {}
+        for uid, acct in (value or {}).items():
+            accounts[uid], holdings[uid] = self._split(key + (str(uid),), acct)
+        return accounts, holdings
+
+    def save(self, cur, key, value):
+        accounts, holdings = self._split(key, value)
+        super().save(cur, key, accounts)
+        self.portfolios.save(cur, key, holdings)
+
+    def delete(self, cur, key):
+        super().delete(cur, key)
+        self.portfolios.delete(cur, key)
+
+
+DOMAIN_TABLES: dict[str, _Table] = {
+    "coins.json": _AccountsTable(),
+    "data.json": _Table("xp", ("guild_id", "user_id"), ("xp", "level"), extra=True),
+    "inventories.json": _Table("inventories", ("user_id", "item"), ("qty",), scalar=True),
+    "trivia_stats.json": _Table("trivia_stats", ("user_id", "category"), ("correct", "attempts")),
+}
+
+
+class SqliteBackend:
+    """
+    Single-database backend in WAL mode.
+
+    Domain files (coins, xp, inventories, trivia stats) are real tables, so a
+    record read/write touches only that user's rows. The connection is shared
+    and serialised with a lock so it can be used from worker threads.
+    """
+
+    name = "sqlite"
+    row_level = True
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _run(self, fn, write: bool = False):
+        with self._lock:
+            cur = self._conn.cursor()
+            if not write:
+                return fn(cur)
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(cur)
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            cur.execute("COMMIT")
+            return out
+
+    # ----- whole documents -----
+    def exists(self, filename: str) -> bool:
+        table = DOMAIN_TABLES.get(filename)
+        if table is not None:
+            sql, args = f"SELECT 1 FROM {table.table} LIMIT 1", []
+        else:
+            sql, args = "SELECT 1 FROM documents WHERE name = ?", [filename]
+        return self._run(lambda cur: cur.execute(sql, args).fetchone() is not None)
+
+    def load(self, filename: str, default: Any):
+        table = DOMAIN_TABLES.get(filename)
+        if table is not None:
+            with timer() as t:
+                out = self._run(lambda cur: table.load(cur, ()))
+            STATS.record_load(filename, _size(out) if out is not None else 0, t.ms)
+            return default if out is None else out
+
+        row = self._run(lambda cur: cur.execute(
+            "SELECT body FROM documents WHERE name = ?", (filename,)
+        ).fetchone())
+        if row is None:
+            return default
+        try:
+            with timer() as t:
+                obj = json.loads(row["body"])
+        except json.JSONDecodeError:
+            return default
+        STATS.record_load(filename, len(row["body"]), t.ms)
+        return obj
+
+    def load_readonly(self, filename: str, default: Any):
+        # no parse to share: domain tables are already read per row
+        return self.load(filename, default)
+
+    def save(self, filename: str, obj: Any):
+        table = DOMAIN_TABLES.get(filename)
+        if table is not None:
+            with timer() as t:
+                self._run(lambda cur: table.save(cur, (), obj), write=True)
+            STATS.record_save(filename, _size(obj), t.ms)
+            return
+        with timer() as t:
+            body = json.dumps(obj, ensure_ascii=False)
+        STATS.record_save(filename, len(body), t.ms)
+        self._run(lambda cur: cur.execute(
+            "INSERT INTO documents (name, body) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET body = excluded.body",
+            (filename, body),
+        ), write=True)
+
+    # ----- single records -----
+    def load_record(self, filename: str, key: tuple[str, ...], default: Any):
+        table = DOMAIN_TABLES.get(filename)
+        if table is None or len(key) > table.depth:
+            return walk(self.load(filename, {}), key, default)
+        with timer() as t:
+            out = self._run(lambda cur: table.load(cur, key))
+        # a row read is a real read, not a memory hit
+        STATS.record_load(filename, _size(out) if out is not None else 0, t.ms)
+        return default if out is None else out
+
+    def save_record(self, filename: str, key: tuple[str, ...], value: Any):
+        table = DOMAIN_TABLES.get(filename)
+        if table is None or len(key) > table.depth:
+            doc = self.load(filename, {})
+            place(doc, key, value)
+            return self.save(filename, doc)
+        self._run(lambda cur: table.save(cur, key, value), write=True)
+        STATS.record_append(filename, _size(value))
+
+    def save_records(self, filename: str, items: list[tuple[tuple[str, ...], Any]]):
+        """Several records in one transaction (or one document save)."""
+        table = DOMAIN_TABLES.get(filename)
+        if table is None or any(len(key) > table.depth for key, _ in items):
+            doc = self.load(filename, {})
+            for key, value in items:
+                place(doc, key, value)
+            return self.save(filename, doc)
+
+        def write(cur):
+            for key, value in items:
+                table.save(cur, key, value)
+        self._run(write, write=True)
+        STATS.record_append(filename, sum(_size(value) for _, value in items))
+
+    def delete_record(self, filename: str, key: tuple[str, ...]):
+        table = DOMAIN_TABLES.get(filename)
+        if table is None or len(key) > table.depth:
+            doc = self.load(filename, {})
+            if remove(doc, key):
+                self.save(filename, doc)
+            return
+        self._run(lambda cur: table.delete(cur, key), write=True)
+
+    # ----- several files at once -----
+    @staticmethod
+    def _load_doc(cur: sqlite3.Cursor, filename: str) -> Any:
+        table = DOMAIN_TABLES.get(filename)
+        if table is not None:
+            return table.load(cur, ()) or {}
+        row = cur.execute("SELECT body FROM documents WHERE name = ?", (filename,)).fetchone()
+        return json.loads(row["body"]) if row is not None else {}
+
+    @staticmethod
+    def _save_doc(cur: sqlite3.Cursor, filename: str, obj: Any) -> int:
+        table = DOMAIN_TABLES.get(filename)
+        if table is not None:
+            table.save(cur, (), obj)
+            return _size(obj)
+        body = json.dumps(obj, ensure_ascii=False)
+        cur.execute(
+            "INSERT INTO documents (name, body) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET body = excluded.body",
+            (filename, body),
+        )
+        return len(body)
+
+    def _load_in(self, cur: sqlite3.Cursor, filename: str, key: tuple[str, ...]) -> Any:
+        table = DOMAIN_TABLES.get(filename)
+        if table is None or len(key) > table.depth:
+            return walk(self._load_doc(cur, filename), key, None)
+        return table.load(cur, key)
+
+    def commit(self, ops: dict, docs: dict, checks: dict, journal: dict) -> list[tuple[str, ...]]:
+        """
+        Several files' changes (see storage.WriteSet) in one transaction. The
+        version checks run first inside it; if any is stale nothing is
+        written. There are no journals on this backend, so `journal` is empty.
+        """
+        saves: dict[str, tuple[int, float]] = {}  # whole documents: (bytes, ms)
+        appends: dict[str, int] = {}  # row writes: bytes
+
+        def write(cur):
+            conflicts = [k for name, entries in checks.items() for k, expected, field in entries
+                         if version(self._load_in(cur, name, k), field) != expected]
+            if conflicts:
+                return conflicts
+            for name in {*ops, *docs}:
+                table = DOMAIN_TABLES.get(name)
+                changes = ops.get(name, [])
+                if name in docs or table is None or any(len(k) > table.depth for k, _, _ in changes):
+                    doc = docs[name] if name in docs else self._load_doc(cur, name)
+                    for k, op, value in changes:
+                        change(doc, k, op, value)
+                    with timer() as t:
+                        size = self._save_doc(cur, name, doc)
+                    saves[name] = (size, t.ms)
+                    continue
+                appends[name] = 0
+                for k, op, value in changes:
+                    if op == "del":
+                        table.delete(cur, k)
+                        continue
+                    if op == "set":
+                        rec = table.load(cur, k)
+                        value = {**(rec if isinstance(rec, dict) else {}), **value}
+                    table.save(cur, k, value)
+                    appends[name] += _size(value)
+            return []
+
+        conflicts = self._run(write, write=True)
+        for name, (size, ms) in saves.items():
+            STATS.record_save(name, size, ms)
+        for name, size in appends.items():
+            STATS.record_append(name, size)
+        return conflicts
+
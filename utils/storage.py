@@ -1,30 +1,854 @@
+import asyncio
+import atexit
+import contextlib
+import copy
+import functools
 import json
 import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
+from .docpath import walk, place, remove, change, version
+from .frozen import freeze
+from .journal import Journal
+from .sqlite_store import SqliteBackend
+from .storage_stats import STATS, timer
+
 # Put your JSON files in a persistent folder if set (Railway volume recommended)
 DATA_DIR = os.getenv("DATA_DIR", ".")
 
+# "json" keeps one file per document (fine for small installs),
+# "sqlite" keeps everything in one WAL-mode database with per-domain tables.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").strip().lower()
+SQLITE_FILE = os.getenv("SQLITE_FILE", "qmbot.db")
+
+# Hot documents kept parsed in memory and written back in the background.
+CACHED_FILES = {f.strip() for f in os.getenv("STORAGE_CACHED_FILES", "coins.json,data.json").split(",") if f.strip()}
+FLUSH_INTERVAL = float(os.getenv("STORAGE_FLUSH_INTERVAL", "2"))  # seconds
+
+# JSON-backend files whose record changes go to an append-only journal instead
+# of rewriting the file; the journal is folded into a snapshot once it's big.
+JOURNALED_FILES = {f.strip() for f in os.getenv("STORAGE_JOURNALED_FILES", "coins.json").split(",") if f.strip()}
+JOURNAL_COMPACT_BYTES = int(os.getenv("STORAGE_JOURNAL_COMPACT_BYTES", str(256 * 1024)))
+JOURNAL_FSYNC = os.getenv("STORAGE_JOURNAL_FSYNC", "0") == "1"
+
+# Worker threads for the async API (serialisation + disk I/O off the event loop)
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "4"))
+
 def path(name: str) -> str:
     return os.path.join(DATA_DIR, name)
 
-def load_json(filename: str, default: Any):
-    fp = path(filename)
-    if not os.path.exists(fp):
-        return default
-    try:
-        with open(fp, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return default
+def abs_path(name: str) -> str:
+    return os.path.abspath(path(name))
+
+def _key(key) -> tuple[str, ...]:
+    if isinstance(key, (tuple, list)):
+        return tuple(str(k) for k in key)
+    return (str(key),)
+
+
+class JsonBackend:
+    """
+    One JSON file per document; record access loads and rewrites the whole file.
+
+    JOURNALED_FILES also have a `<name>.journal` beside them: loading replays
+    it over the snapshot, and saving a snapshot truncates it.
+
+    Read-only loads keep the last parse per file and reuse it while the
+    file's (st_mtime_ns, st_size) is unchanged, so they cost one stat().
+    """
+
+    name = "json"
+    row_level = False
+
+    def __init__(self):
+        self._journals: dict[str, Journal] = {}
+        self._parsed: dict[str, tuple[tuple, Any]] = {}
+
+    def journal(self, filename: str) -> Journal | None:
+        if filename not in JOURNALED_FILES:
+            return None
+        if filename not in self._journals:
+            self._journals[filename] = Journal(path(f"{filename}.journal"), fsync=JOURNAL_FSYNC, name=filename)
+        return self._journals[filename]
+
+    def needs_compaction(self, filename: str) -> bool:
+        j = self.journal(filename)
+        return j is not None and j.size() > JOURNAL_COMPACT_BYTES
+
+    def exists(self, filename: str) -> bool:
+        return os.path.exists(path(filename))
+
+    def _signature(self, filename: str) -> tuple | None:
+        try:
+            st = os.stat(path(filename))
+        except OSError:
+            return None
+        j = self.journal(filename)
+        return (st.st_mtime_ns, st.st_size, j.size() if j is not None else 0)
+
+    def load_readonly(self, filename: str, default: Any):
+        """Shared parse for callers that promise not to mutate it."""
+        sig = self._signature(filename)
+        hit = self._parsed.get(filename)
+        if sig is not None and hit is not None and hit[0] == sig:
+            STATS.record_hit(filename)
+            return hit[1]
+        obj = self.load(filename, None)
+        if obj is None:
+            return default
+        if sig is not None:
+            self._parsed[filename] = (sig, obj)
+        return obj
+
+    def load(self, filename: str, default: Any):
+        fp = path(filename)
+        j = self.journal(filename)
+        if not os.path.exists(fp):
+            if j is None or not j.size():
+                return default
+            obj = {}
+        else:
+            with open(fp, "rb") as f:
+                raw = f.read()
+            try:
+                with timer() as t:
+                    obj = json.loads(raw)
+            except json.JSONDecodeError:
+                return default
+            STATS.record_load(filename, len(raw), t.ms)
+        if j is not None and isinstance(obj, dict):
+            replayed = j.replay(obj)
+            if replayed:
+                print(f"[Storage] Replayed {replayed} journal entries onto {filename}.")
+        return obj
+
+    def save(self, filename: str, obj: Any):
+        self._swap(filename, *self._write_tmp(filename, obj))
+
+    def _write_tmp(self, filename: str, obj: Any) -> tuple[str, int, float]:
+        """Serialise `obj` to `<name>.tmp` and fsync it; returns (tmp path, bytes, serialise ms)."""
+        fp = path(filename)
+        os.makedirs(os.path.dirname(fp) or ".", exist_ok=True)
+        tmp = f"{fp}.tmp"
+        with timer() as t:
+            body = json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+        with open(tmp, "wb") as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp, len(body), t.ms
+
+    def _swap(self, filename: str, tmp: str, size: int, ms: float):
+        os.replace(tmp, path(filename))
+        STATS.record_save(filename, size, ms)
+        self._parsed.pop(filename, None)
+        j = self.journal(filename)
+        if j is not None:
+            j.reset()
+
+    def load_record(self, filename: str, key: tuple[str, ...], default: Any):
+        # copy just the record out of the shared parse instead of re-parsing the file
+        value = walk(self.load_readonly(filename, {}), key, _MISSING)
+        return default if value is _MISSING else copy.deepcopy(value)
+
+    def save_record(self, filename: str, key: tuple[str, ...], value: Any):
+        doc = self.load(filename, {})
+        place(doc, key, value)
+        self.save(filename, doc)
+
+    def save_records(self, filename: str, items: list[tuple[tuple[str, ...], Any]]):
+        """Several records, one rewrite."""
+        doc = self.load(filename, {})
+        for key, value in items:
+            place(doc, key, value)
+        self.save(filename, doc)
+
+    def delete_record(self, filename: str, key: tuple[str, ...]):
+        doc = self.load(filename, {})
+        if remove(doc, key):
+            self.save(filename, doc)
+
+    def commit(self, ops: dict, docs: dict, checks: dict, journal: dict) -> list[tuple[str, ...]]:
+        """
+        Several files' changes together (see WriteSet). Every file is
+        rewritten into its temp file first; only when all of them are on
+        disk and no version check failed are the journal entries appended
+        and the temp files swapped in, so a failure part-way writes nothing.
+        Returns the stale keys.
+        """
+        out, conflicts = {}, []
+        for name in {*ops, *docs, *checks}:
+            doc = docs[name] if name in docs else self.load(name, {})
+            conflicts += [k for k, expected, field in checks.get(name, []) if version(walk(doc, k, None), field) != expected]
+            for k, op, value in ops.get(name, []):
+                change(doc, k, op, value)
+            out[name] = doc
+        if conflicts:
+            return conflicts
+
+        staged = [(name, self._write_tmp(name, doc)) for name, doc in out.items()]
+        for name, changes in journal.items():
+            self.journal(name).append_ops(changes)
+        for name, tmp in staged:
+            self._swap(name, *tmp)
+        return []
+
+
+_MISSING = object()
+
+def _make_backend(kind: str):
+    if kind == "sqlite":
+        os.makedirs(DATA_DIR, exist_ok=True)
+        return SqliteBackend(path(SQLITE_FILE))
+    if kind != "json":
+        print(f"[Storage] Unknown STORAGE_BACKEND {kind!r}, using json.")
+    return JsonBackend()
+
+BACKEND = _make_backend(STORAGE_BACKEND)
+
+
+class DocumentCache:
+    """
+    Write-behind cache for CACHED_FILES.
+
+    The parsed document stays resident and is shared by every caller, so a
+    load is a dict lookup and a save only marks it dirty. `flush()` writes
+    each dirty document once, however many saves happened since.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._docs: dict[str, Any] = {}
+        self._dirty: set[str] = set()
+        self._lock = threading.Lock()
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in CACHED_FILES
+
+    def get(self, filename: str, default: Any):
+        if filename not in self._docs:
+            obj = self.backend.load(filename, None)
+            if obj is None:
+                if default is None:
+                    return None
+                obj = default
+            self._docs[filename] = obj
+        return self._docs[filename]
+
+    def put(self, filename: str, obj: Any):
+        self._docs[filename] = obj
+        self.mark_dirty(filename)
+
+    def mark_dirty(self, filename: str):
+        with self._lock:
+            self._dirty.add(filename)
+
+    def is_dirty(self, filename: str) -> bool:
+        return filename in self._dirty
+
+    def loaded(self, filename: str) -> bool:
+        return filename in self._docs
+
+    def journal(self, filename: str) -> Journal | None:
+        get = getattr(self.backend, "journal", None)
+        return get(filename) if get and filename in self._docs else None
+
+    def take_dirty(self, filename: str | None = None) -> list[str]:
+        """Claim the documents that need writing (dirty, or with an oversized journal)."""
+        with self._lock:
+            for name in self._docs:
+                if getattr(self.backend, "needs_compaction", None) and self.backend.needs_compaction(name):
+                    self._dirty.add(name)
+            names = [filename] if filename else list(self._dirty)
+            names = [n for n in names if n in self._dirty]
+            self._dirty.difference_update(names)
+        return names
+
+    def snapshot(self, name: str) -> Any:
+        """
+        A private copy of a resident document. Take it on the event loop (the
+        only thread that mutates documents) so a worker never serialises a
+        dict while a command is halfway through changing it.
+        """
+        return copy.deepcopy(self._docs[name])
+
+    def write(self, name: str, doc: Any = None) -> bool:
+        try:
+            self.backend.save(name, self._docs[name] if doc is None else doc)
+            return True
+        except Exception as e:
+            self.mark_dirty(name)
+            print(f"[Storage] Flush of {name} failed: {type(e).__name__}: {e}")
+            return False
+
+    def flush(self, filename: str | None = None) -> int:
+        """Write dirty documents, and compact journals that grew past the threshold."""
+        return sum(self.write(name) for name in self.take_dirty(filename))
+
+CACHE = DocumentCache(BACKEND)
+
+# Per-file thread locks around every read-modify-write of a file (or its
+# journal). The async API takes them on the worker thread, inside
+# _FILE_LOCKS; the sync entry points take them directly, so a sync write
+# (the atexit flushes) can't interleave with an executor write to the same file.
+_IO_LOCKS: defaultdict[str, threading.RLock] = defaultdict(threading.RLock)
+_IO_LOCKS_GUARD = threading.Lock()
+
+@contextlib.contextmanager
+def _io_lock(*filenames: str):
+    """Hold the thread locks of `filenames`, taken in name order."""
+    with contextlib.ExitStack() as stack:
+        for name in sorted(set(filenames)):
+            with _IO_LOCKS_GUARD:
+                lock = _IO_LOCKS[name]
+            stack.enter_context(lock)
+        yield
+
+def _locked(filenames, fn, *args):
+    with _io_lock(*filenames):
+        return fn(*args)
+
+# readonly=True returns a FrozenDict/FrozenList view that may be shared with
+# other callers; use it for display-only commands, and .copy() if you must edit.
+def load_json(filename: str, default: Any, *, readonly: bool = False):
+    with _io_lock(filename):
+        return _load_json(filename, default, readonly)
+
+def _load_json(filename: str, default: Any, readonly: bool):
+    if filename in CACHE:
+        if CACHE.loaded(filename):
+            STATS.record_hit(filename)
+        obj = CACHE.get(filename, default)
+        return freeze(obj) if readonly else obj
+    if readonly:
+        return freeze(BACKEND.load_readonly(filename, default))
+    return BACKEND.load(filename, default)
 
 def save_json(filename: str, obj: Any):
-    fp = path(filename)
-    os.makedirs(os.path.dirname(fp) or ".", exist_ok=True)
-    with open(fp, "w", encoding="utf-8") as f:
-        json.dump(obj, f, indent=2, ensure_ascii=False)
+    with _io_lock(filename):
+        if filename in CACHE:
+            return CACHE.put(filename, obj)
+        BACKEND.save(filename, obj)
+
+def flush_all() -> int:
+    written = 0
+    for name in CACHE.take_dirty():
+        with _io_lock(name):
+            written += CACHE.write(name)
+    return written
+
+def storage_stats() -> dict:
+    """Per-file load/save counts, bytes and parse/serialise latency histograms."""
+    return STATS.snapshot()
+
+async def flush_loop(interval: float = FLUSH_INTERVAL):
+    """Background task: write dirty cached documents every `interval` seconds."""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            await aflush_all()
+    finally:
+        flush_all()
+
+atexit.register(flush_all)
+
+def exists_file(filename: str) -> bool:
+    if filename in CACHE and CACHE.is_dirty(filename):
+        return True
+    return BACKEND.exists(filename)
 
 def ensure_file(filename: str, default: Any):
-    fp = path(filename)
-    if not os.path.exists(fp):
+    if not exists_file(filename):
         save_json(filename, default)
+
+# key is a top-level key ("123") or a path (("guild", "user")) into the document.
+# Cached files are served from memory. Journaled files append the change to
+# their journal, row-level backends write the record straight through, and
+# anything else picks it up on the next flush.
+#
+# The _stage_* helpers apply a change to the resident copy right away and
+# return whatever disk I/O is still owed, so the async API can run just that
+# part on a worker thread.
+def _stage_load_record(filename: str, k: tuple[str, ...], default: Any):
+    if filename in CACHE and CACHE.loaded(filename):
+        STATS.record_hit(filename)
+        return walk(CACHE.get(filename, {}), k, default), None
+    if filename in CACHE:
+        return None, lambda: walk(CACHE.get(filename, {}), k, default)
+    return None, lambda: BACKEND.load_record(filename, k, default)
+
+def _stage_save_record(filename: str, k: tuple[str, ...], value: Any):
+    if filename not in CACHE:
+        return lambda: BACKEND.save_record(filename, k, value)
+    place(CACHE.get(filename, {}), k, value)
+    j = CACHE.journal(filename)
+    if j is not None:
+        return lambda: j.append(k, put=value)
+    if not BACKEND.row_level:
+        CACHE.mark_dirty(filename)
+        return None
+    return lambda: BACKEND.save_record(filename, k, value)
+
+def _stage_update_record(filename: str, k: tuple[str, ...], fields: dict):
+    if filename not in CACHE:
+        def io():
+            rec = BACKEND.load_record(filename, k, None)
+            rec = rec if isinstance(rec, dict) else {}
+            rec.update(fields)
+            BACKEND.save_record(filename, k, rec)
+        return io
+
+    doc = CACHE.get(filename, {})
+    rec = walk(doc, k, None)
+    if not isinstance(rec, dict):
+        rec = {}
+        place(doc, k, rec)
+    rec.update(fields)
+    j = CACHE.journal(filename)
+    if j is not None:
+        return lambda: j.append(k, fields=fields)
+    if not BACKEND.row_level:
+        CACHE.mark_dirty(filename)
+        return None
+    return lambda: BACKEND.save_record(filename, k, rec)
+
+def _stage_cas_update_record(filename: str, k: tuple[str, ...], fields: dict, expected: int, version_field: str):
+    """
+    Like _stage_update_record, but only if the record's `version_field` (0 when
+    absent) still equals `expected`; the write bumps it by one. Returns
+    (applied, io). For resident files the check and the in-memory update happen
+    together with no await in between, so they are atomic on the event loop.
+    """
+    fields = {**fields, version_field: expected + 1}
+    if filename not in CACHE:
+        def io():
+            rec = BACKEND.load_record(filename, k, None)
+            rec = rec if isinstance(rec, dict) else {}
+            if int(rec.get(version_field, 0)) != expected:
+                return False
+            rec.update(fields)
+            BACKEND.save_record(filename, k, rec)
+            return True
+        return None, io
+
+    rec = walk(CACHE.get(filename, {}), k, None)
+    current = int(rec.get(version_field, 0)) if isinstance(rec, dict) else 0
+    if current != expected:
+        return False, None
+    return True, _stage_update_record(filename, k, fields)
+
+def _stage_save_records(filename: str, items: list[tuple[tuple[str, ...], Any]]):
+    """_stage_save_record for several records, owing a single write."""
+    if filename not in CACHE:
+        return lambda: BACKEND.save_records(filename, items)
+    doc = CACHE.get(filename, {})
+    for k, value in items:
+        place(doc, k, value)
+    j = CACHE.journal(filename)
+    if j is not None:
+        return lambda: j.append_many(items, put=True)
+    if not BACKEND.row_level:
+        CACHE.mark_dirty(filename)
+        return None
+    return lambda: BACKEND.save_records(filename, items)
+
+def _stage_update_records(filename: str, items: list[tuple[tuple[str, ...], dict]]):
+    """_stage_update_record for several records, owing a single write (journal append, file save or transaction)."""
+    if filename not in CACHE:
+        def io():
+            out = []
+            for k, fields in items:
+                rec = BACKEND.load_record(filename, k, None)
+                rec = rec if isinstance(rec, dict) else {}
+                rec.update(fields)
+                out.append((k, rec))
+            BACKEND.save_records(filename, out)
+        return io
+
+    doc = CACHE.get(filename, {})
+    recs = []
+    for k, fields in items:
+        rec = walk(doc, k, None)
+        if not isinstance(rec, dict):
+            rec = {}
+            place(doc, k, rec)
+        rec.update(fields)
+        recs.append((k, rec))
+    j = CACHE.journal(filename)
+    if j is not None:
+        return lambda: j.append_many(items)
+    if not BACKEND.row_level:
+        CACHE.mark_dirty(filename)
+        return None
+    return lambda: BACKEND.save_records(filename, recs)
+
+def _stage_cas_update_records(filename: str, items: list[tuple[tuple[str, ...], dict, int]], version_field: str):
+    """
+    All-or-nothing _stage_cas_update_record over several records. Returns
+    (conflicts, io): the keys whose version moved (nothing is written unless
+    that list is empty), or None for uncached files, whose io returns it.
+    """
+    staged = [(k, {**fields, version_field: expected + 1}) for k, fields, expected in items]
+
+    def stale(rec, expected) -> bool:
+        return version(rec, version_field) != expected
+
+    if filename not in CACHE:
+        def io():
+            out, conflicts = [], []
+            for (k, fields, expected), (_, new) in zip(items, staged):
+                rec = BACKEND.load_record(filename, k, None)
+                if stale(rec, expected):
+                    conflicts.append(k)
+                    continue
+                rec = rec if isinstance(rec, dict) else {}
+                rec.update(new)
+                out.append((k, rec))
+            if not conflicts:
+                BACKEND.save_records(filename, out)
+            return conflicts
+        return None, io
+
+    doc = CACHE.get(filename, {})
+    conflicts = [k for k, _, expected in items if stale(walk(doc, k, None), expected)]
+    if conflicts:
+        return conflicts, None
+    return [], _stage_update_records(filename, staged)
+
+def _stage_delete_record(filename: str, k: tuple[str, ...]):
+    if filename not in CACHE:
+        return lambda: BACKEND.delete_record(filename, k)
+    remove(CACHE.get(filename, {}), k)
+    j = CACHE.journal(filename)
+    if j is not None:
+        return lambda: j.append(k, delete=True)
+    if not BACKEND.row_level:
+        CACHE.mark_dirty(filename)
+        return None
+    return lambda: BACKEND.delete_record(filename, k)
+
+class WriteSet:
+    """
+    Record changes to several files that must land together:
+
+        ws = WriteSet().put("inventories.json", uid, inv).delete("orders.json", "17")
+        ws.cas_update("coins.json", uid, fields, expected=3)
+        stale = await acommit(ws)
+
+    `acommit()` checks every compare-and-swap entry first and writes nothing
+    if one is stale. SQLite commits the rest in one transaction; the JSON
+    backend writes every rewritten file to its temp file before swapping any
+    of them in (journaled files get their entries appended just before the
+    swap). Keys are the same as for save_record(). A `save()`d document
+    replaces the file, and record changes to that file apply on top of it.
+    """
+
+    def __init__(self):
+        self.ops: dict[str, list[tuple[tuple[str, ...], str, Any]]] = {}  # filename -> [(key, "put" | "set" | "del", value)]
+        self.docs: dict[str, Any] = {}  # filename -> whole document
+        self.cas: dict[str, list[tuple[tuple[str, ...], dict, int, str]]] = {}  # filename -> [(key, fields, expected, version field)]
+
+    def __bool__(self) -> bool:
+        return bool(self.ops or self.docs or self.cas)
+
+    def files(self) -> set[str]:
+        return {*self.ops, *self.docs, *self.cas}
+
+    def copy(self) -> "WriteSet":
+        out = WriteSet()
+        out.ops = {name: list(changes) for name, changes in self.ops.items()}
+        out.docs = dict(self.docs)
+        out.cas = {name: list(items) for name, items in self.cas.items()}
+        return out
+
+    def _op(self, filename: str, key, op: str, value: Any) -> "WriteSet":
+        self.ops.setdefault(filename, []).append((_key(key), op, value))
+        return self
+
+    def put(self, filename: str, key, value: Any) -> "WriteSet":
+        return self._op(filename, key, "put", value)
+
+    def update(self, filename: str, key, fields: dict) -> "WriteSet":
+        return self._op(filename, key, "set", fields)
+
+    def delete(self, filename: str, key) -> "WriteSet":
+        return self._op(filename, key, "del", None)
+
+    def save(self, filename: str, doc: Any) -> "WriteSet":
+        self.docs[filename] = doc
+        self.ops.pop(filename, None)
+        return self
+
+    def cas_update(self, filename: str, key, fields: dict, expected: int, version_field: str = "version") -> "WriteSet":
+        """update() only if the record is still at version `expected`; the write bumps it by one."""
+        self.cas.setdefault(filename, []).append((_key(key), fields, int(expected), version_field))
+        return self
+
+    def changes(self, filename: str) -> list[tuple[tuple[str, ...], str, Any]]:
+        """One file's record changes in order, compare-and-swaps as their version-bumped updates."""
+        bumped = [(k, "set", {**fields, field: expected + 1}) for k, fields, expected, field in self.cas.get(filename, [])]
+        return bumped + self.ops.get(filename, [])
+
+def _stage_commit(ws: WriteSet):
+    """
+    Check a WriteSet's resident compare-and-swaps and apply its changes to
+    the resident documents. Returns (stale keys, io, undo): if resident keys
+    are stale, nothing changed and io is None. Otherwise io makes the one
+    backend call that commits everything (and returns the stale keys of
+    files that aren't resident); run undo on the loop if it doesn't go
+    through, to put the resident documents back.
+    """
+    names = sorted(ws.files())
+    conflicts = [k for name in names if name in CACHE for k, _, expected, field in ws.cas.get(name, [])
+                 if version(walk(CACHE.get(name, {}), k, None), field) != expected]
+    if conflicts:
+        return conflicts, None, None
+
+    ops, docs, checks, journal, undo_log = {}, {}, {}, {}, []
+    for name in names:
+        changes = ws.changes(name)
+        if name not in CACHE:
+            if name in ws.docs:
+                docs[name] = ws.docs[name]
+            if changes:
+                ops[name] = changes
+            if name in ws.cas:
+                checks[name] = [(k, expected, field) for k, _, expected, field in ws.cas[name]]
+            continue
+
+        if name in ws.docs:
+            undo_log.append((name, None, CACHE.get(name, {})))
+            CACHE.put(name, ws.docs[name])
+        doc = CACHE.get(name, {})
+        for k, op, value in changes:
+            undo_log.append((name, k, copy.deepcopy(walk(doc, k, _MISSING))))
+            change(doc, k, op, value)
+        j = CACHE.journal(name)
+        if name in ws.docs or (j is None and not BACKEND.row_level):
+            docs[name] = CACHE.snapshot(name)
+        elif j is not None:
+            journal[name] = copy.deepcopy(changes)
+        else:
+            # row-level backends get each changed record whole
+            ops[name] = [(k, "del", None) if op == "del" else (k, "put", copy.deepcopy(walk(doc, k, None)))
+                         for k, op, _ in changes]
+
+    def undo():
+        for name, k, prev in reversed(undo_log):
+            if k is None:
+                CACHE.put(name, prev)
+            elif prev is _MISSING:
+                remove(CACHE.get(name, {}), k)
+            else:
+                place(CACHE.get(name, {}), k, prev)
+
+    return [], functools.partial(BACKEND.commit, ops, docs, checks, journal), undo
+
+def _run(io):
+    return io() if io is not None else None
+
+def load_record(filename: str, key, default: Any = None):
+    with _io_lock(filename):
+        value, io = _stage_load_record(filename, _key(key), default)
+        return value if io is None else io()
+
+def save_record(filename: str, key, value: Any):
+    with _io_lock(filename):
+        _run(_stage_save_record(filename, _key(key), value))
+
+def update_record(filename: str, key, fields: dict):
+    """Set some fields of one record (creating it if missing). Journals log only these fields."""
+    with _io_lock(filename):
+        _run(_stage_update_record(filename, _key(key), fields))
+
+def delete_record(filename: str, key):
+    with _io_lock(filename):
+        _run(_stage_delete_record(filename, _key(key)))
+
+def cas_update_record(filename: str, key, fields: dict, expected: int, version_field: str = "version") -> bool:
+    """update_record only if the record is still at version `expected`; True if it was written."""
+    with _io_lock(filename):
+        applied, io = _stage_cas_update_record(filename, _key(key), fields, expected, version_field)
+        if applied is None:
+            return io()
+        _run(io)
+        return applied
+
+
+def save_records(filename: str, items: list):
+    """save_record for several (key, value) pairs, written together."""
+    with _io_lock(filename):
+        _run(_stage_save_records(filename, [(_key(k), v) for k, v in items]))
+
+def update_records(filename: str, items: list):
+    """update_record for several (key, fields) pairs, written together."""
+    with _io_lock(filename):
+        _run(_stage_update_records(filename, [(_key(k), f) for k, f in items]))
+
+def cas_update_records(filename: str, items: list, version_field: str = "version") -> list[tuple[str, ...]]:
+    """
+    cas_update_record for several (key, fields, expected) triples, all or
+    nothing. Returns the keys that were stale; empty means everything was written.
+    """
+    with _io_lock(filename):
+        conflicts, io = _stage_cas_update_records(filename, [(_key(k), f, e) for k, f, e in items], version_field)
+        if conflicts is None:
+            return io()
+        _run(io)
+        return conflicts
+
+def commit(ws: WriteSet) -> list[tuple[str, ...]]:
+    """Write every change in `ws` together (see WriteSet). Returns the stale keys; empty means it all landed."""
+    if not ws:
+        return []
+    with _io_lock(*ws.files()):
+        conflicts, io, undo = _stage_commit(ws)
+        if io is None:
+            return conflicts
+        try:
+            conflicts = io()
+        except Exception:
+            undo()
+            raise
+        if conflicts:
+            undo()
+        return conflicts
+
+# -----------------------
+# Async API
+# -----------------------
+# Same semantics as the functions above, but parsing, serialising and disk
+# I/O happen on a bounded thread pool. Writes to one file are serialised by a
+# per-file lock so they land in the order they were issued.
+_EXECUTOR = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix="storage")
+_FILE_LOCKS: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+# Held by callers across a whole load -> modify -> save of one document, so
+# two editors can't interleave and drop each other's change. Separate from
+# _FILE_LOCKS, which every single load or save takes for itself.
+_EDIT_LOCKS: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+def edit_lock(filename: str) -> asyncio.Lock:
+    return _EDIT_LOCKS[filename]
+
+async def _off_loop(filename: str, fn, *args):
+    async with _FILE_LOCKS[filename]:
+        return await asyncio.get_running_loop().run_in_executor(_EXECUTOR, functools.partial(_locked, (filename,), fn, *args))
+
+async def aload_json(filename: str, default: Any, *, readonly: bool = False):
+    if filename in CACHE and CACHE.loaded(filename):
+        STATS.record_hit(filename)
+        obj = CACHE.get(filename, default)
+        return freeze(obj) if readonly else obj
+    return await _off_loop(filename, functools.partial(load_json, readonly=readonly), filename, default)
+
+async def asave_json(filename: str, obj: Any):
+    if filename in CACHE:
+        return CACHE.put(filename, obj)
+    await _off_loop(filename, BACKEND.save, filename, obj)
+
+async def aload_record(filename: str, key, default: Any = None):
+    value, io = _stage_load_record(filename, _key(key), default)
+    return value if io is None else await _off_loop(filename, io)
+
+async def _arun(filename: str, io):
+    if io is not None:
+        await _off_loop(filename, io)
+
+async def asave_record(filename: str, key, value: Any):
+    await _arun(filename, _stage_save_record(filename, _key(key), value))
+
+async def aupdate_record(filename: str, key, fields: dict):
+    await _arun(filename, _stage_update_record(filename, _key(key), fields))
+
+async def adelete_record(filename: str, key):
+    await _arun(filename, _stage_delete_record(filename, _key(key)))
+
+async def acas_update_record(filename: str, key, fields: dict, expected: int, version_field: str = "version") -> bool:
+    applied, io = _stage_cas_update_record(filename, _key(key), fields, expected, version_field)
+    if applied is None:
+        return await _off_loop(filename, io)
+    await _arun(filename, io)
+    return applied
+
+async def asave_records(filename: str, items: list):
+    await _arun(filename, _stage_save_records(filename, [(_key(k), v) for k, v in items]))
+
+async def aupdate_records(filename: str, items: list):
+    await _arun(filename, _stage_update_records(filename, [(_key(k), f) for k, f in items]))
+
+async def acas_update_records(filename: str, items: list, version_field: str = "version") -> list[tuple[str, ...]]:
+    conflicts, io = _stage_cas_update_records(filename, [(_key(k), f, e) for k, f, e in items], version_field)
+    if conflicts is None:
+        return await _off_loop(filename, io)
+    await _arun(filename, io)
+    return conflicts
+
+async def acommit(ws: WriteSet) -> list[tuple[str, ...]]:
+    # every file's lock is taken (in name order) before staging, so nothing
+    # staged after this commit can reach the disk ahead of it
+    if not ws:
+        return []
+    async with contextlib.AsyncExitStack() as stack:
+        for name in sorted(ws.files()):
+            await stack.enter_async_context(_FILE_LOCKS[name])
+        conflicts, io, undo = _stage_commit(ws)
+        if io is None:
+            return conflicts
+        try:
+            conflicts = await asyncio.get_running_loop().run_in_executor(_EXECUTOR, _locked, tuple(ws.files()), io)
+        except Exception:
+            undo()
+            raise
+        if conflicts:
+            undo()
+        return conflicts
+
+async def aexists_file(filename: str) -> bool:
+    return await _off_loop(filename, exists_file, filename)
+
+async def apreload():
+    """Parse the cached documents up front so the first command doesn't pay for it on the loop."""
+    for name in sorted(CACHED_FILES):
+        await aload_json(name, {})
+
+async def aflush_all() -> int:
+    return await aflush()
+
+async def aflush(filename: str | None = None) -> int:
+    """Write one dirty cached document now (or every one, with no name)."""
+    written = 0
+    for name in CACHE.take_dirty(filename):
+        async with _FILE_LOCKS[name]:
+            # copied here, under the file's lock, so only the copy crosses to the thread
+            doc = CACHE.snapshot(name)
+            written += await asyncio.get_running_loop().run_in_executor(_EXECUTOR, _locked, (name,), CACHE.write, name, doc)
+    return written
+
+def migrate_json_to_sqlite(filenames: list[str] | None = None, db_file: str = SQLITE_FILE) -> list[str]:
+    """Copy every JSON document in DATA_DIR into the SQLite database. Safe to re-run."""
+    src = JsonBackend()
+    dst = BACKEND if isinstance(BACKEND, SqliteBackend) else SqliteBackend(path(db_file))
+    if filenames is None:
+        filenames = sorted(f for f in os.listdir(DATA_DIR) if f.endswith(".json"))
+
+    flush_all()
+    migrated = []
+    try:
+        for name in filenames:
+            obj = src.load(name, None)
+            if obj is None:
+                continue
+            dst.save(name, obj)
+            migrated.append(name)
+    finally:
+        if dst is not BACKEND:
+            dst.close()
+    return migrated
+
+if __name__ == "__main__":
+    done = migrate_json_to_sqlite()
+    print(f"[Storage] Migrated {len(done)} file(s) into {abs_path(SQLITE_FILE)}: {', '.join(done)}")
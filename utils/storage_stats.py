@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import defaultdict
+
+# Upper bounds (milliseconds) of the latency buckets; anything slower lands in "+inf".
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        i = 0
+        while i < len(LATENCY_BUCKETS_MS) and ms > LATENCY_BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile (max for the last bucket)."""
+        if not self.count:
+            return 0.0
+        target = p / 100 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> dict:
+        labels = [f"<={b}" for b in LATENCY_BUCKETS_MS] + ["+inf"]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class FileStats:
+    __slots__ = ("loads", "saves", "hits", "appends", "bytes_read", "save_bytes", "append_bytes", "parse", "serialize")
+
+    def __init__(self):
+        self.loads = 0          # real reads from the backend
+        self.saves = 0          # full document writes
+        self.hits = 0           # served from memory (resident or unchanged parse)
+        self.appends = 0        # journal entries / single-row writes
+        self.bytes_read = 0
+        self.save_bytes = 0
+        self.append_bytes = 0
+        self.parse = Histogram()
+        self.serialize = Histogram()
+
+
+class StorageStats:
+    """Per-file counters for the storage layer. Safe to update from worker threads."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._files: defaultdict[str, FileStats] = defaultdict(FileStats)
+        self._lock = threading.Lock()
+
+    def record_load(self, filename: str, nbytes: int, parse_ms: float):
+        with self._lock:
+            f = self._files[filename]
+            f.loads += 1
+            f.bytes_read += nbytes
+            f.parse.observe(parse_ms)
+
+    def record_save(self, filename: str, nbytes: int, serialize_ms: float):
+        with self._lock:
+            f = self._files[filename]
+            f.saves += 1
+            f.save_bytes += nbytes
+            f.serialize.observe(serialize_ms)
+
+    def record_append(self, filename: str, nbytes: int):
+        with self._lock:
+            f = self._files[filename]
+            f.appends += 1
+            f.append_bytes += nbytes
+
+    def record_hit(self, filename: str):
+        with self._lock:
+            self._files[filename].hits += 1
+
+    def reset(self):
+        with self._lock:
+            self._files.clear()
+            self.started_at = time.time()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            minutes = max((time.time() - self.started_at) / 60, 1e-9)
+            files = {}
+            for name, f in sorted(self._files.items()):
+                files[name] = {
+                    "loads": f.loads,
+                    "saves": f.saves,
+                    "hits": f.hits,
+                    "appends": f.appends,
+                    "bytes_read": f.bytes_read,
+                    "bytes_written": f.save_bytes + f.append_bytes,
+                    "saves_per_min": round(f.saves / minutes, 2),
+                    "avg_save_bytes": f.save_bytes // f.saves if f.saves else 0,
+                    "parse": f.parse.to_dict(),
+                    "serialize": f.serialize.to_dict(),
+                }
+            return {"since": self.started_at, "uptime_min": round(minutes, 2), "files": files}
+
+
+STATS = StorageStats()
+
+
+class timer:
+    """`with timer() as t: ...` then `t.ms`."""
+
+    __slots__ = ("_t0", "ms")
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        self.ms = 0.0
+        return self
+
+    def __exit__(self, *exc):
+        self.ms = (time.perf_counter() - self._t0) * 1000
+        return False
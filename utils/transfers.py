@@ -0,0 +1,203 @@
+from .storage import WriteSet, aload_json, aload_record
+from .accounts import AccountSession, AccountConflict, CONFLICT_RETRIES
+from .ledger import LEDGER
+from .locks import MONEY_LOCKS
+
+INVENTORY_FILE = "inventories.json"
+SHOP_FILE = "shop_stock.json"
+
+# owner id for the shop's stock in item deltas (also its MONEY_LOCKS key)
+SHOP = "shop"
+
+BALANCE_FIELDS = ("wallet", "bank")
+
+
+class TransferError(Exception):
+    """A batch would leave `owner`'s `what` (a balance field or an item) below zero."""
+
+    def __init__(self, owner: str, what: str, have: int, need: int):
+        super().__init__(f"{owner}: {what} {have} < {need}")
+        self.owner = owner
+        self.what = what
+        self.have = have
+        self.need = need
+
+
+class Batch:
+    """
+    Balance, share and item deltas across any number of accounts, plus the
+    ledger entries describing them. Build one, then hand it to `apply_batch()`:
+
+        batch = Batch().move(payer, payee, 50, "pay")
+        batch.give(SHOP, "Crash Token", -1).give(payer, "Crash Token", 1)
+
+    A `None` account is the house (shop till, dealer, rewards): nothing is
+    debited or credited for it. Other records that must land with the money
+    (an order's new state, a fired trigger's removal) go in `batch.writes`.
+    """
+
+    def __init__(self):
+        self.coins: dict[str, dict[str, int]] = {}  # uid -> {field: delta}
+        self.stocks: dict[str, dict[str, int]] = {}  # uid -> {stock: delta}
+        self.escrow: dict[str, dict[str, int]] = {}  # uid -> {stock: delta} of shares held for sell orders
+        self.items: dict[str, dict[str, int]] = {}  # uid | SHOP -> {item: delta}
+        self.entries: list[dict] = []
+        self.writes = WriteSet()  # other records committed with the balances (open orders, triggers)
+
+    def __bool__(self) -> bool:
+        return bool(self.coins or self.stocks or self.escrow or self.items or self.writes)
+
+    def credit(self, uid, amount: int, field: str = "wallet") -> "Batch":
+        if field not in BALANCE_FIELDS:
+            raise ValueError(f"not a balance field: {field}")
+        if uid is not None and amount:
+            d = self.coins.setdefault(str(uid), {})
+            d[field] = d.get(field, 0) + int(amount)
+        return self
+
+    def debit(self, uid, amount: int, field: str = "wallet") -> "Batch":
+        return self.credit(uid, -int(amount), field)
+
+    def log(self, kind: str, from_id, to_id, amount: int, **meta) -> "Batch":
+        if amount:
+            self.entries.append({"kind": kind, "from_id": from_id, "to_id": to_id, "amount": int(amount), "meta": meta})
+        return self
+
+    def move(self, src, dst, amount: int, kind: str | None = None, *,
+             from_field: str = "wallet", to_field: str = "wallet", **meta) -> "Batch":
+        """`amount` from src's `from_field` to dst's `to_field`, recorded as `kind` if given."""
+        if amount < 0:
+            raise ValueError("amount must be >= 0")
+        self.debit(src, amount, from_field)
+        self.credit(dst, amount, to_field)
+        if kind:
+            self.log(kind, src, dst, amount, **meta)
+        return self
+
+    def shares(self, uid, stock: str, qty: int) -> "Batch":
+        """Add (or with a negative qty, take) shares of `stock` in a user's portfolio."""
+        if uid is not None and qty:
+            d = self.stocks.setdefault(str(uid), {})
+            d[stock] = d.get(stock, 0) + int(qty)
+        return self
+
+    def escrow_shares(self, uid, stock: str, qty: int) -> "Batch":
+        """Add (or with a negative qty, release) shares of `stock` held back for a user's sell orders."""
+        if uid is not None and qty:
+            d = self.escrow.setdefault(str(uid), {})
+            d[stock] = d.get(stock, 0) + int(qty)
+        return self
+
+    def give(self, owner, item: str, qty: int) -> "Batch":
+        """Add (or with a negative qty, take) items from a user's inventory or the SHOP."""
+        if qty:
+            d = self.items.setdefault(str(owner), {})
+            d[item] = d.get(item, 0) + int(qty)
+        return self
+
+    def keys(self) -> set[str]:
+        """Every MONEY_LOCKS key the caller must hold while applying this batch."""
+        return set(self.coins) | set(self.stocks) | set(self.escrow) | set(self.items)
+
+
+def _apply_items(held: dict, deltas: dict[str, int], owner: str, keep_empty: bool) -> dict:
+    out = {k: int(v) for k, v in held.items()}
+    for item, delta in deltas.items():
+        have = out.get(item, 0)
+        if have + delta < 0:
+            raise TransferError(owner, item, have, -delta)
+        out[item] = have + delta
+        if out[item] == 0 and not keep_empty:
+            del out[item]
+    return out
+
+
+async def apply_batch(batch: Batch, session: AccountSession | None = None) -> AccountSession:
+    """
+    Validate every delta in `batch`, then commit them together in one
+    storage commit (see storage.WriteSet): every touched account (balances,
+    shares and escrow, compare-and-swapped), every touched inventory, the shop's
+    stock, the batch's own record writes and its ledger entries (staged in
+    the ledger outbox). The entries are copied to the ledger database
+    afterwards; if that fails they stay in the outbox for the startup
+    replay, and the committed transfer stands. Raises
+    TransferError (nothing written) if any balance or count would go
+    negative.
+
+    The caller must hold MONEY_LOCKS for `batch.keys()`. Pass the command's
+    own `session` to commit its other account changes (cooldown timestamps)
+    in the same write.
+    """
+    session = session or AccountSession()
+
+    accounts = {uid: await session.get(uid) for uid in {*batch.coins, *batch.stocks, *batch.escrow}}
+    for uid, deltas in batch.coins.items():
+        for field, delta in deltas.items():
+            have = int(getattr(accounts[uid], field))
+            if have + delta < 0:
+                raise TransferError(uid, field, have, -delta)
+    for uid, deltas in batch.stocks.items():
+        for stock, delta in deltas.items():
+            have = accounts[uid].shares(stock)
+            if have + delta < 0:
+                raise TransferError(uid, stock, have, -delta)
+    for uid, deltas in batch.escrow.items():
+        for stock, delta in deltas.items():
+            have = accounts[uid].escrowed(stock)
+            if have + delta < 0:
+                raise TransferError(uid, f"{stock} in escrow", have, -delta)
+
+    inventories, shop = {}, None
+    for owner, deltas in batch.items.items():
+        if owner == SHOP:
+            shop = _apply_items(await aload_json(SHOP_FILE, {}, readonly=True), deltas, owner, keep_empty=True)
+        else:
+            held = await aload_record(INVENTORY_FILE, owner, None) or {}
+            inventories[owner] = _apply_items(held, deltas, owner, keep_empty=False)
+
+    writes = batch.writes.copy()
+    for owner, inv in inventories.items():
+        writes.put(INVENTORY_FILE, owner, inv)
+    if shop is not None:
+        writes.save(SHOP_FILE, shop)
+    staged = LEDGER.stage(writes, batch.entries)
+
+    for uid, deltas in batch.coins.items():
+        for field, delta in deltas.items():
+            setattr(accounts[uid], field, int(getattr(accounts[uid], field)) + delta)
+    for uid, deltas in batch.stocks.items():
+        for stock, delta in deltas.items():
+            accounts[uid].set_shares(stock, accounts[uid].shares(stock) + delta)
+    for uid, deltas in batch.escrow.items():
+        for stock, delta in deltas.items():
+            accounts[uid].set_escrowed(stock, accounts[uid].escrowed(stock) + delta)
+    await session.commit(writes)
+
+    if staged:
+        try:
+            await LEDGER.adeliver(staged)
+        except Exception as e:
+            print(f"[Ledger] failed to record batch, left in the outbox: {type(e).__name__}: {e}")
+    return session
+
+
+async def apply_batch_retrying(batch: Batch) -> AccountSession:
+    """
+    apply_batch on a fresh session, retried when the commit hits
+    AccountConflict; the last conflict is raised. For callers that can't
+    re-run their command (game payouts, the tick). The caller must hold
+    MONEY_LOCKS for `batch.keys()`.
+    """
+    for attempt in range(CONFLICT_RETRIES):
+        try:
+            return await apply_batch(batch)
+        except AccountConflict:
+            if attempt == CONFLICT_RETRIES - 1:
+                raise
+
+
+async def transfer(src, dst, amount: int, kind: str, **kwargs) -> AccountSession:
+    """Lock both sides and move `amount` coins (see Batch.move for kwargs), retrying on AccountConflict."""
+    batch = Batch().move(src, dst, amount, kind, **kwargs)
+    async with MONEY_LOCKS.hold(*batch.keys()):
+        return await apply_batch_retrying(batch)
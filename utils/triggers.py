@@ -0,0 +1,189 @@
+import asyncio
+import bisect
+import os
+import time
+from collections.abc import Iterable, Mapping
+
+from bot.config import STOCKS
+
+from .storage import aload_json, asave_record, adelete_record
+from .accounts import AccountSession
+from .locks import MONEY_LOCKS
+from .transfers import Batch, apply_batch
+
+TRIGGER_FILE = "triggers.json"
+MAX_TRIGGERS = int(os.getenv("MAX_TRIGGERS", "20"))
+
+# triggers.json record holding the id high-water mark (not a trigger), and how
+# many ids each save of it reserves
+TRIGGER_ID_KEY = "next_id"
+TRIGGER_ID_BLOCK = int(os.getenv("TRIGGER_ID_BLOCK", "50"))
+
+# stop-loss sells once the price falls to the trigger, take-profit once it rises to it
+STOP_LOSS, TAKE_PROFIT = "stop_loss", "take_profit"
+
+
+class Trigger:
+    """A standing order to sell `qty` shares of `ticker` at market once the price crosses `price`."""
+
+    __slots__ = ("id", "uid", "ticker", "kind", "price", "qty", "ts")
+
+    def __init__(self, id: int, uid, ticker: str, kind: str, price: int, qty: int, ts: float | None = None):
+        self.id = int(id)
+        self.uid = str(uid)
+        self.ticker = ticker
+        self.kind = kind
+        self.price = int(price)
+        self.qty = int(qty)
+        self.ts = time.time() if ts is None else float(ts)
+
+    def to_dict(self) -> dict:
+        return {"uid": self.uid, "ticker": self.ticker, "kind": self.kind, "price": self.price, "qty": self.qty, "ts": self.ts}
+
+    @classmethod
+    def from_dict(cls, id, d: Mapping) -> "Trigger":
+        return cls(id, d["uid"], d["ticker"], d["kind"], d["price"], d["qty"], d.get("ts"))
+
+
+class TriggerIndex:
+    """
+    One ticker's conditional orders as two lists sorted by (trigger price, id).
+    After a tick, the stop-losses at or above the new price are a suffix of
+    one list and the take-profits at or below it a prefix of the other, so
+    finding what fired is a bisect, not a scan of every order.
+    """
+
+    def __init__(self):
+        self.keys = {STOP_LOSS: [], TAKE_PROFIT: []}  # kind -> sorted [(price, id)]
+
+    def add(self, t: Trigger):
+        bisect.insort(self.keys[t.kind], (t.price, t.id))
+
+    def remove(self, t: Trigger) -> bool:
+        keys = self.keys[t.kind]
+        i = bisect.bisect_left(keys, (t.price, t.id))
+        if i < len(keys) and keys[i] == (t.price, t.id):
+            del keys[i]
+            return True
+        return False
+
+    def pop_triggered(self, price: int) -> list[int]:
+        """Remove and return the ids of every order `price` sets off."""
+        stops, takes = self.keys[STOP_LOSS], self.keys[TAKE_PROFIT]
+        i = bisect.bisect_left(stops, (price,))
+        j = bisect.bisect_right(takes, (price, float("inf")))
+        fired = [oid for _, oid in stops[i:]] + [oid for _, oid in takes[:j]]
+        del stops[i:], takes[:j]
+        return fired
+
+
+class Triggers:
+    """Every ticker's TriggerIndex plus the orders by id, mirrored in triggers.json."""
+
+    def __init__(self, tickers: Iterable[str] = STOCKS):
+        self.index = {s: TriggerIndex() for s in tickers}
+        self.orders: dict[int, Trigger] = {}
+        self._next_id = 1
+        self._reserved = 1  # ids below this are covered by the saved TRIGGER_ID_KEY
+        self.lock = asyncio.Lock()
+        self.ready = False
+
+    def load(self, doc: Mapping):
+        self.index = {s: TriggerIndex() for s in self.index}
+        self.orders = {}
+        for oid, d in doc.items():
+            if oid == TRIGGER_ID_KEY:
+                continue
+            t = Trigger.from_dict(oid, d)
+            if t.ticker in self.index:
+                self.orders[t.id] = t
+                self.index[t.ticker].add(t)
+        # files from before the counter was saved only have the open triggers to go on
+        self._next_id = self._reserved = max(int(doc.get(TRIGGER_ID_KEY, 1)), max(self.orders, default=0) + 1)
+        self.ready = True
+
+    def user_triggers(self, uid) -> list[Trigger]:
+        uid = str(uid)
+        return sorted((t for t in self.orders.values() if t.uid == uid), key=lambda t: t.id)
+
+    async def add(self, uid, ticker: str, kind: str, price: int, qty: int) -> Trigger:
+        async with self.lock:
+            # reserve ids TRIGGER_ID_BLOCK at a time so a restart never hands
+            # out the id of a trigger that already fired or was cancelled
+            if self._next_id >= self._reserved:
+                reserved = self._next_id + TRIGGER_ID_BLOCK
+                await asave_record(TRIGGER_FILE, TRIGGER_ID_KEY, reserved)
+                self._reserved = reserved
+            t = Trigger(self._next_id, uid, ticker, kind, price, qty)
+            self._next_id += 1
+            await asave_record(TRIGGER_FILE, str(t.id), t.to_dict())
+            self.orders[t.id] = t
+            self.index[ticker].add(t)
+            return t
+
+    async def cancel(self, uid, trigger_id: int) -> Trigger | None:
+        async with self.lock:
+            t = self.orders.get(int(trigger_id))
+            if t is None or t.uid != str(uid):
+                return None
+            self.index[t.ticker].remove(t)
+            del self.orders[t.id]
+            await adelete_record(TRIGGER_FILE, str(t.id))
+            return t
+
+    async def execute(self, prices: Mapping[str, int]) -> list[tuple[Trigger, int, int]]:
+        """
+        Sell at market every order the new `prices` set off and remove them
+        from triggers.json, all in one batch commit. Each sells what the user
+        still owns, up to its qty. Returns (order, shares sold, price) for
+        each one that fired. If the commit fails, nothing is sold or removed
+        and the orders go back in the index for the next tick.
+        """
+        async with self.lock:
+            fired = [self.orders[oid] for s, p in prices.items() if s in self.index
+                     for oid in self.index[s].pop_triggered(int(p))]
+            if not fired:
+                return []
+            try:
+                done = await _sell_at_market(fired, prices)
+            except Exception:
+                for t in fired:
+                    self.index[t.ticker].add(t)
+                raise
+            for t in fired:
+                del self.orders[t.id]
+            return done
+
+
+TRIGGERS = Triggers()
+
+
+async def triggers() -> Triggers:
+    """TRIGGERS, loaded from triggers.json on first use."""
+    if not TRIGGERS.ready:
+        TRIGGERS.load(await aload_json(TRIGGER_FILE, {}, readonly=True))
+    return TRIGGERS
+
+
+async def _sell_at_market(fired: list[Trigger], prices: Mapping[str, int]) -> list[tuple[Trigger, int, int]]:
+    done = []
+    async with MONEY_LOCKS.hold(*{t.uid for t in fired}), AccountSession() as session:
+        batch = Batch()
+        owned: dict[tuple[str, str], int] = {}
+        for t in sorted(fired, key=lambda t: t.id):
+            key = (t.uid, t.ticker)
+            if key not in owned:
+                owned[key] = (await session.get(t.uid)).shares(t.ticker)
+            n = min(t.qty, owned[key])
+            if n <= 0:
+                done.append((t, 0, int(prices[t.ticker])))
+                continue
+            owned[key] -= n
+            price = int(prices[t.ticker])
+            batch.shares(t.uid, t.ticker, -n)
+            batch.move(None, t.uid, price * n, t.kind, stock=t.ticker, shares=n, price=price, trigger=t.price)
+            done.append((t, n, price))
+        for t in fired:
+            batch.writes.delete(TRIGGER_FILE, str(t.id))
+        await apply_batch(batch, session)
+    return done